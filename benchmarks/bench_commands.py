@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+End-to-end throughput benchmark of the `export`, `import` and `rm` commands
+against the local stand-in of the Garmin Connect.
+
+Reports workouts per second and the p50/p99 latency of the HTTP requests
+for every library size:
+
+    $ python benchmarks/bench_commands.py --sizes 10 100 1000 10000 \
+        --latency 0.02 --jobs 8
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import logging
+import math
+import os
+import sys
+import tempfile
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCHMARKS_DIR),
+                                'garmin_workouts'))
+sys.path.insert(0, BENCHMARKS_DIR)
+
+from fake_garmin_connect import FakeGarminConnect, generate_corpus  # noqa: E402
+
+
+def percentile(values, percent):
+    # type: (list, float) -> float
+    """
+    Nearest-rank percentile, None for no values.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(percent / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def isolate_user_dirs(home):
+    # type: (str) -> None
+    """
+    Point the user directories of the CLI (session, caches, fingerprints,
+    database) into `home`, so the benchmark neither reads nor changes the
+    real ones. Call it before the CLI modules are imported, they resolve
+    their paths at the import.
+    """
+    os.environ['HOME'] = home
+    for name in ('XDG_CONFIG_HOME', 'XDG_CACHE_HOME', 'XDG_DATA_HOME',
+                 'XDG_STATE_HOME', 'XDG_RUNTIME_DIR'):
+        os.environ.pop(name, None)
+
+
+def own_format_workout(index):
+    # type: (int) -> dict
+    return {
+        "name": f"Imported {index:05d}",
+        "steps": [
+            {"type": "warmup", "distance": 2000, "hr_low": 120, "hr_high": 140},
+            {"type": "repetition", "count": 5, "steps": [
+                {"type": "run", "distance": 1000, "hr_low": 160, "hr_high": 175},
+                {"type": "recovery", "distance": 400, "hr_low": 120, "hr_high": 140},
+            ]},
+            {"type": "cooldown", "distance": 2000, "hr_low": 120, "hr_high": 140},
+        ],
+    }
+
+
+class CommandsBenchmark():
+    def __init__(self, fake, jobs, use_async, workdir):
+        self.fake = fake
+        self.jobs = jobs
+        self.use_async = use_async
+        self.workdir = workdir
+        self.latencies = []
+
+    def _api_client(self):
+        import requests
+        from libs.garmin_api_client import GarminApiClient
+
+        session = requests.Session()
+        session.hooks['response'].append(self._record_latency)
+        return GarminApiClient(session=session, rate_limit=0)
+
+    def _record_latency(self, response, *args, **kwargs):
+        self.latencies.append(response.elapsed.total_seconds())
+
+    def _args(self, argv):
+        from arguments import CLI
+
+        argv = ['--rate-limit', '0'] + argv + ['--jobs', str(self.jobs)]
+        if self.use_async:
+            argv.append('--async')
+        return CLI().init_parser(argv)
+
+    def run(self, command, argv, workouts_count):
+        # type: (str, list, int) -> dict
+        from export import Export
+        from import_workouts import Import
+        from remove import Remove
+
+        commands = {"export": Export, "import": Import, "rm": Remove}
+        args = self._args(argv)
+        api_client = self._api_client()
+        self.latencies = []
+
+        start = time.perf_counter()
+        # The commands print their results, keep the report readable
+        with contextlib.redirect_stdout(io.StringIO()):
+            commands[command](args, api_client)
+        elapsed = time.perf_counter() - start
+
+        p50 = percentile(self.latencies, 50)
+        p99 = percentile(self.latencies, 99)
+        return {
+            "command": command,
+            "workouts": workouts_count,
+            "seconds": elapsed,
+            "workouts_per_second": workouts_count / elapsed,
+            "requests": api_client.stats.requests,
+            "p50_ms": p50 * 1000 if p50 is not None else None,
+            "p99_ms": p99 * 1000 if p99 is not None else None,
+        }
+
+    def run_size(self, size, seed):
+        # type: (int, int) -> list
+        self.fake.load(generate_corpus(size, seed))
+        runs_count = len([workout for workout in self.fake.workouts.values()
+                          if workout["sportType"]["sportTypeKey"] == "running"])
+
+        results = []
+        output = os.path.join(self.workdir, 'workouts.yml')
+        results.append(self.run('export', ['export', '--no-cache', '-f', output],
+                                runs_count))
+
+        plan_dir = os.path.join(self.workdir, f'plan_{size}')
+        os.makedirs(plan_dir)
+        import yaml
+        for index in range(size):
+            with open(os.path.join(plan_dir, f'{index:05d}.yml'), 'w') as outfile:
+                yaml.safe_dump(own_format_workout(index), outfile,
+                               sort_keys=False)
+        results.append(self.run('import', ['import', plan_dir], size))
+
+        # Workouts of unsupported sports are kept by `rm --all`
+        library_size = len(self.fake.workouts)
+        result = self.run('rm', ['rm', '--all', '--force'], 0)
+        deleted = library_size - len(self.fake.workouts)
+        result["workouts"] = deleted
+        result["workouts_per_second"] = deleted / result["seconds"]
+        results.append(result)
+        return results
+
+
+def print_table(results):
+    header = f"{'command':<8} {'workouts':>9} {'seconds':>9} " \
+             f"{'workouts/s':>11} {'requests':>9} {'p50 ms':>8} {'p99 ms':>8}"
+    print(header)
+    print('-' * len(header))
+    for result in results:
+        p50 = f"{result['p50_ms']:.1f}" if result['p50_ms'] is not None else '-'
+        p99 = f"{result['p99_ms']:.1f}" if result['p99_ms'] is not None else '-'
+        print(f"{result['command']:<8} {result['workouts']:>9} "
+              f"{result['seconds']:>9.2f} {result['workouts_per_second']:>11.1f} "
+              f"{result['requests']:>9} {p50:>8} {p99:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[10, 100, 1000, 10000],
+                        help='Library sizes to benchmark')
+    parser.add_argument('--jobs', type=int, default=8)
+    parser.add_argument('--async', action='store_true', dest='use_async',
+                        help='Benchmark the asyncio client. Only latency of '
+                        'the requests sent by the threaded client is measured.')
+    parser.add_argument('--latency', type=float, default=0.01,
+                        help='Mean latency of the fake server in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--throttle-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', type=str, metavar='FILE',
+                        help='Store the results into the JSON file')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    fake = FakeGarminConnect(latency=args.latency, error_rate=args.error_rate,
+                             throttle_rate=args.throttle_rate, seed=args.seed)
+    # The client reads the base URL when `libs.endpoints` is imported
+    os.environ['GARMIN_CONNECT_URL'] = fake.url
+
+    results = []
+    with fake, tempfile.TemporaryDirectory() as workdir:
+        isolate_user_dirs(os.path.join(workdir, 'home'))
+        benchmark = CommandsBenchmark(fake, args.jobs, args.use_async, workdir)
+        for size in args.sizes:
+            results += benchmark.run_size(size, args.seed)
+
+    print_table(results)
+    if args.json:
+        with open(args.json, 'w') as outfile:
+            json.dump(results, outfile, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark of the batch conversions in `libs.conversions` against the
+loop over the scalar functions, on synthetic step targets. Checks the
+results are equal:
+
+    $ python benchmarks/bench_conversions.py --values 100000 1000000
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCHMARKS_DIR),
+                                'garmin_workouts'))
+
+from libs import conversions  # noqa: E402
+
+
+def generate_values(count, seed=0):
+    # type: (int, int) -> dict
+    """
+    Generate speeds, paces and durations as found in the training plans:
+    paces rounded to seconds, durations to seconds and some speeds as raw
+    floats from the recorded activities.
+    """
+    rng = random.Random(seed)
+    speeds = [1000 / rng.randint(150, 480) if rng.random() < 0.8
+              else rng.uniform(1.5, 7) for _ in range(count)]
+    return {
+        "speeds": speeds,
+        "paces": [conversions.mps_to_pace_string(mps) for mps in speeds],
+        "durations": [rng.randint(10, 4 * 3600) if rng.random() < 0.8
+                      else rng.uniform(10, 4 * 3600) for _ in range(count)],
+    }
+
+
+def measure(convert, values, repeat):
+    """
+    Return the best time of `repeat` runs and the converted values.
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = convert(values)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--values', type=int, nargs='+',
+                        default=[1000, 100000, 1000000],
+                        help='Number of converted values')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    backend = 'numpy' if conversions._import_numpy() else 'pure Python'
+    print(f'batch backend: {backend}')
+    header = f"{'conversion':<16} {'values':>8} {'scalar s':>9} {'batch s':>9} {'speedup':>8}"
+    print(header)
+    print('-' * len(header))
+
+    benchmarks = (
+        ("pace string", "speeds", conversions.mps_to_pace_string,
+         conversions.mps_to_pace_strings),
+        ("kmh string", "speeds", conversions.mps_to_kmh_string,
+         conversions.mps_to_kmh_strings),
+        ("time string", "durations", conversions.seconds_to_time_string,
+         conversions.seconds_to_time_strings),
+        ("pace to mps", "paces", conversions.pace_string_to_mps,
+         conversions.pace_strings_to_mps),
+    )
+    failed = False
+    for count in args.values:
+        values = generate_values(count, args.seed)
+        for name, kind, scalar, batch in benchmarks:
+            scalar_seconds, expected = measure(
+                lambda values: [scalar(value) for value in values],
+                values[kind], args.repeat)
+            batch_seconds, result = measure(batch, values[kind], args.repeat)
+            print(f"{name:<16} {count:>8} {scalar_seconds:>9.4f} "
+                  f"{batch_seconds:>9.4f} {scalar_seconds / batch_seconds:>7.1f}x")
+            if result != expected:
+                print(f'FAIL: {name} results differ from the scalar function')
+                failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
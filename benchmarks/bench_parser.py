@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark of the `WorkoutParser` step conversion in both directions,
+Garmin Connect API format -> own format and back, on large synthetic plans:
+
+    $ python benchmarks/bench_parser.py --steps 100000 --depth 4
+"""
+
+import argparse
+import logging
+import os
+import random
+import sys
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCHMARKS_DIR),
+                                'garmin_workouts'))
+
+from libs.parser import WorkoutParser  # noqa: E402
+
+EXECUTABLE_STEPS = (
+    {"type": "warmup", "distance": 2000, "hr_low": 120, "hr_high": 140},
+    {"type": "run", "distance": 1000, "pace_from": "4:10", "pace_to": "4:00"},
+    {"type": "recovery", "lap_button": True},
+    {"type": "cooldown", "distance": 1500},
+)
+
+
+def generate_plan(steps, depth, seed=0):
+    # type: (int, int, int) -> dict
+    """
+    Generate a workout in the own format with about `steps` steps, where
+    repetitions are nested up to `depth` levels.
+    """
+    rng = random.Random(seed)
+    count = 0
+
+    def generate_steps(level):
+        nonlocal count
+        generated = []
+        for _ in range(rng.randint(2, 6)):
+            if count >= steps:
+                break
+            count += 1
+            if level < depth and rng.random() < 0.3:
+                generated.append({"type": "repetition",
+                                  "count": rng.randint(2, 8),
+                                  "steps": generate_steps(level + 1)})
+            else:
+                generated.append(dict(rng.choice(EXECUTABLE_STEPS)))
+        return generated
+
+    plan_steps = []
+    while count < steps:
+        plan_steps += generate_steps(0)
+    return {"name": "Benchmark plan", "steps": plan_steps}
+
+
+def count_steps(garmin_steps):
+    # type: (list) -> int
+    count = 0
+    stack = list(garmin_steps)
+    while stack:
+        step = stack.pop()
+        count += 1
+        stack.extend(step.get("workoutSteps", ()))
+    return count
+
+
+def measure(convert, repeat):
+    """
+    Return the best time of `repeat` runs of the conversion.
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        convert()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--steps', type=int, nargs='+',
+                        default=[1000, 10000, 100000],
+                        help='Number of steps of the synthetic plans')
+    parser.add_argument('--depth', type=int, default=4,
+                        help='Maximum nesting of the repetitions')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    header = f"{'direction':<14} {'steps':>8} {'seconds':>9} {'steps/s':>11}"
+    print(header)
+    print('-' * len(header))
+    for steps in args.steps:
+        own_plan = generate_plan(steps, args.depth, args.seed)
+        garmin_plan = WorkoutParser(own_format=own_plan).get_garmin_format()
+        steps_count = count_steps(
+            garmin_plan["workoutSegments"][0]["workoutSteps"])
+
+        conversions = (
+            ("own->garmin", lambda: WorkoutParser(own_format=own_plan)),
+            ("garmin->own", lambda: WorkoutParser(garmin_format=garmin_plan)),
+        )
+        for direction, convert in conversions:
+            seconds = measure(convert, args.repeat)
+            print(f"{direction:<14} {steps_count:>8} {seconds:>9.4f} "
+                  f"{steps_count / seconds:>11.0f}")
+
+
+if __name__ == '__main__':
+    main()
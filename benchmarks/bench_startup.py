@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Startup time benchmark of `garmin-workouts --help`. Fails, when the CLI
+takes longer than the threshold on top of the bare interpreter startup, or
+when it imports the dependencies needed only by the commands:
+
+    $ python benchmarks/bench_startup.py --runs 20 --threshold 100
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CLI_PATH = os.path.join(ROOT_DIR, 'garmin_workouts', 'garminworkouts.py')
+
+# Not needed for `--help`, each of them is imported only by the commands
+HEAVY_MODULES = ('requests', 'yaml', 'fake_useragent', 'appdirs', 'aiohttp')
+
+# Runs the CLI in-process and prints the heavy modules it imported
+IMPORTED_MODULES_CHECK = f'''
+import json, runpy, sys
+sys.argv = [{CLI_PATH!r}, '--help']
+sys.path.insert(0, {os.path.dirname(CLI_PATH)!r})
+try:
+    runpy.run_path({CLI_PATH!r}, run_name='__main__')
+except SystemExit:
+    pass
+print(json.dumps(sorted(name for name in {HEAVY_MODULES!r}
+                        if name in sys.modules)), file=sys.stderr)
+'''
+
+
+def measure(command, runs):
+    # type: (list, int) -> float
+    """
+    Return the median wall time of the command in milliseconds.
+    """
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, stdout=subprocess.DEVNULL, check=True)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def imported_heavy_modules():
+    # type: () -> list
+    result = subprocess.run([sys.executable, '-c', IMPORTED_MODULES_CHECK],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                            check=True, text=True)
+    return json.loads(result.stderr.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--threshold', type=float, default=100.0,
+                        metavar='MS', help='Maximum milliseconds on top of '
+                        'the bare interpreter startup. Default: 100')
+    args = parser.parse_args()
+
+    interpreter_ms = measure([sys.executable, '-c', 'pass'], args.runs)
+    help_ms = measure([sys.executable, CLI_PATH, '--help'], args.runs)
+    overhead_ms = help_ms - interpreter_ms
+    heavy_modules = imported_heavy_modules()
+
+    print(f'interpreter   {interpreter_ms:8.1f} ms')
+    print(f'--help        {help_ms:8.1f} ms')
+    print(f'overhead      {overhead_ms:8.1f} ms (threshold {args.threshold:.0f} ms)')
+
+    failed = False
+    if overhead_ms > args.threshold:
+        print(f'FAIL: --help is {overhead_ms - args.threshold:.1f} ms over '
+              'the threshold')
+        failed = True
+    if heavy_modules:
+        print(f"FAIL: --help imports {', '.join(heavy_modules)}")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Garmin Connect workout service.
+
+Serves the endpoints used by the `GarminApiClient`, with configurable
+latency, server errors and throttling. Point the CLI to it with:
+
+    $ python benchmarks/fake_garmin_connect.py --port 8765 --workouts 1000
+    $ GARMIN_CONNECT_URL=http://127.0.0.1:8765 \
+        python garmin_workouts/garminworkouts.py export --stdout
+
+Cookies are not checked, every request is authenticated.
+"""
+
+import argparse
+import datetime
+import hashlib
+import itertools
+import json
+import random
+import re
+import threading
+import time
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+SPORTS = (
+    # (sportTypeId, sportTypeKey, share of the corpus)
+    (1, "running", 0.85),
+    (2, "cycling", 0.10),
+    (5, "strength_training", 0.05),
+)
+
+
+def _executable_step(order, step_type_id, step_type_key):
+    return {
+        "type": "ExecutableStepDTO",
+        "stepId": None,
+        "stepOrder": order,
+        "stepType": {"stepTypeId": step_type_id, "stepTypeKey": step_type_key},
+        "description": None,
+        "endConditionCompare": None,
+        "endConditionZone": None,
+        "preferredEndConditionUnit": None,
+        "targetType": {"workoutTargetTypeId": 1,
+                       "workoutTargetTypeKey": "no.target"},
+        "targetValueOne": None,
+        "targetValueTwo": None,
+        "zoneNumber": None,
+    }
+
+
+def _update_date():
+    # Milliseconds, so a workout changed twice in a second gets new stamps
+    return datetime.datetime.now().isoformat(timespec='milliseconds')
+
+
+def generate_workout(workout_id, rng):
+    # type: (int, random.Random) -> dict
+    """
+    Generate one workout in the Garmin Connect API format. Running
+    workouts have a warmup, a repeat group of intervals and a cooldown.
+    """
+    roll = rng.random()
+    for sport_id, sport_key, share in SPORTS:
+        roll -= share
+        if roll <= 0:
+            break
+
+    order = itertools.count(1)
+    warmup = _executable_step(next(order), 1, "warmup")
+    warmup["endCondition"] = {"conditionTypeId": 2, "conditionTypeKey": "time"}
+    warmup["endConditionValue"] = float(rng.choice((600, 900, 1200)))
+
+    repeat = {
+        "type": "RepeatGroupDTO",
+        "stepId": None,
+        "stepOrder": next(order),
+        "stepType": {"stepTypeId": 6, "stepTypeKey": "repeat"},
+        "numberOfIterations": rng.randint(3, 8),
+        "smartRepeat": False,
+        "childStepId": 1,
+        "workoutSteps": [],
+    }
+    interval = _executable_step(next(order), 3, "interval")
+    interval["endCondition"] = {"conditionTypeId": 3,
+                                "conditionTypeKey": "distance"}
+    interval["endConditionValue"] = float(rng.choice((400, 800, 1000, 2000)))
+    pace = rng.randint(210, 330)
+    interval["targetType"] = {"workoutTargetTypeId": 6,
+                              "workoutTargetTypeKey": "pace.zone"}
+    interval["targetValueOne"] = 1000 / pace
+    interval["targetValueTwo"] = 1000 / (pace + 10)
+    recovery = _executable_step(next(order), 4, "recovery")
+    recovery["endCondition"] = {"conditionTypeId": 2,
+                                "conditionTypeKey": "time"}
+    recovery["endConditionValue"] = float(rng.choice((60, 90, 120)))
+    repeat["workoutSteps"] = [interval, recovery]
+
+    cooldown = _executable_step(next(order), 2, "cooldown")
+    cooldown["endCondition"] = {"conditionTypeId": 1,
+                                "conditionTypeKey": "lap.button"}
+
+    sport_type = {"sportTypeId": sport_id, "sportTypeKey": sport_key}
+    return {
+        "workoutId": workout_id,
+        "workoutName": f"Workout {workout_id:05d}",
+        "description": None,
+        "sportType": sport_type,
+        "updateDate": "2020-01-01T00:00:00.0",
+        "workoutSegments": [{
+            "segmentOrder": 1,
+            "sportType": sport_type,
+            "workoutSteps": [warmup, repeat, cooldown],
+        }],
+    }
+
+
+def generate_corpus(count, seed=0):
+    # type: (int, int) -> dict
+    rng = random.Random(seed)
+    return {workout_id: generate_workout(workout_id, rng)
+            for workout_id in range(1, count + 1)}
+
+
+class FakeGarminConnect():
+    """
+    Threaded HTTP server imitating the Garmin Connect workout service.
+
+    Attributes:
+        latency       -- mean seconds added to every response (+-50 %)
+        error_rate    -- probability of a 503 response
+        throttle_rate -- probability of a 429 response
+        retry_after   -- seconds in the `Retry-After` header of 429
+        validators    -- send `ETag` with the workout details and answer
+                         the matching `If-None-Match` with 304
+    """
+    def __init__(self, workouts=None, port=0, latency=0.0, error_rate=0.0,
+                 throttle_rate=0.0, retry_after=0, seed=0, validators=True):
+        self.workouts = workouts if workouts is not None else {}
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.validators = validators
+        self.requests = 0
+        self.not_modified = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._next_id = max(self.workouts, default=0) + 1
+        self._server = ThreadingHTTPServer(('127.0.0.1', port),
+                                           self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    def load(self, workouts):
+        # type: (dict) -> None
+        """
+        Replace the workouts library.
+        """
+        with self._lock:
+            self.workouts = workouts
+            self._next_id = max(self.workouts, default=0) + 1
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(FakeGarminConnectHandler):
+            server_state = fake
+
+        return Handler
+
+    def injected_failure(self):
+        """
+        Return the status code of an injected failure, or None.
+        """
+        with self._lock:
+            self.requests += 1
+            roll = self._rng.random()
+            delay = self.latency * self._rng.uniform(0.5, 1.5)
+        time.sleep(delay)
+        if roll < self.throttle_rate:
+            return 429
+        if roll < self.throttle_rate + self.error_rate:
+            return 503
+        return None
+
+    def list_workouts(self, start, limit, order_seq):
+        with self._lock:
+            workouts = sorted(self.workouts.values(),
+                              key=lambda workout: workout["workoutName"],
+                              reverse=order_seq == 'DESC')
+        keys = ("workoutId", "workoutName", "description", "sportType",
+                "updateDate")
+        return [{key: workout.get(key) for key in keys}
+                for workout in workouts[start - 1:start - 1 + limit]]
+
+    def create_workout(self, workout):
+        with self._lock:
+            workout_id = self._next_id
+            self._next_id += 1
+            workout["workoutId"] = workout_id
+            workout["updateDate"] = _update_date()
+            self.workouts[workout_id] = workout
+        return workout
+
+    def update_workout(self, workout_id, workout):
+        with self._lock:
+            if workout_id not in self.workouts:
+                return False
+            workout["workoutId"] = workout_id
+            workout["updateDate"] = _update_date()
+            self.workouts[workout_id] = workout
+        return True
+
+    def delete_workout(self, workout_id):
+        with self._lock:
+            return self.workouts.pop(workout_id, None) is not None
+
+
+class FakeGarminConnectHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately, don't wait for the ACK
+    disable_nagle_algorithm = True
+    server_state = None  # type: FakeGarminConnect
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body=None, headers=None):
+        data = b'' if body is None else json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        data = self.rfile.read(length)
+        return json.loads(data) if data else None
+
+    def _handle_failure(self):
+        status = self.server_state.injected_failure()
+        if status == 429:
+            self._send(status, headers={
+                'Retry-After': str(self.server_state.retry_after)})
+        elif status:
+            self._send(status)
+        return status is not None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if self._handle_failure():
+            return
+
+        if url.path in ('/modern/settings', '/modern/auth/logout'):
+            self._send(200, {})
+        elif url.path == '/proxy/workout-service/workouts':
+            workouts = self.server_state.list_workouts(
+                int(query.get('start', ['1'])[0]),
+                int(query.get('limit', ['999'])[0]),
+                query.get('orderSeq', ['DESC'])[0])
+            self._send(200, workouts)
+        else:
+            match = re.fullmatch(r'/proxy/workout-service/workout/(\d+)',
+                                 url.path)
+            workout = None
+            if match:
+                workout = self.server_state.workouts.get(int(match.group(1)))
+            if workout is None:
+                self._send(404)
+            elif not self.server_state.validators:
+                self._send(200, workout)
+            else:
+                self._send_conditional(workout)
+
+    def _send_conditional(self, workout):
+        etag = '"%s"' % hashlib.sha1(json.dumps(workout, sort_keys=True)
+                                     .encode('utf-8')).hexdigest()
+        if self.headers.get('If-None-Match') == etag:
+            with self.server_state._lock:
+                self.server_state.not_modified += 1
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+        else:
+            self._send(200, workout, headers={'ETag': etag})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        body = self._read_json()
+        if self._handle_failure():
+            return
+
+        if url.path == '/modern/proxy/workout-service/workout':
+            self._send(200, self.server_state.create_workout(body))
+            return
+
+        match = re.fullmatch(r'/modern/proxy/workout-service/workout/(\d+)',
+                             url.path)
+        override = self.headers.get('X-HTTP-Method-Override')
+        if not match or override not in ('PUT', 'DELETE'):
+            self._send(404)
+            return
+
+        workout_id = int(match.group(1))
+        if override == 'PUT':
+            found = self.server_state.update_workout(workout_id, body)
+        else:
+            found = self.server_state.delete_workout(workout_id)
+        self._send(204 if found else 404)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--workouts', type=int, default=100,
+                        help='Size of the synthetic workouts library')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Mean latency of responses in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--throttle-rate', type=float, default=0.0)
+    parser.add_argument('--retry-after', type=int, default=0)
+    parser.add_argument('--no-validators', action='store_false',
+                        dest='validators',
+                        help="Don't send ETag with the workout details")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    fake = FakeGarminConnect(generate_corpus(args.workouts, args.seed),
+                             port=args.port, latency=args.latency,
+                             error_rate=args.error_rate,
+                             throttle_rate=args.throttle_rate,
+                             retry_after=args.retry_after, seed=args.seed,
+                             validators=args.validators)
+    print(f'Serving {len(fake.workouts)} workouts on {fake.url}')
+    fake.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        fake.stop()
+
+
+if __name__ == '__main__':
+    main()
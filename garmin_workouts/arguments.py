@@ -1,10 +1,23 @@
 import argparse
 import logging
+import re
 
 
 log = logging.getLogger(__name__)
 
 
+def _regex(value):
+    # type: (str) -> str
+    """
+    Check the regex option, so an invalid one is the usage error.
+    """
+    try:
+        re.compile(value)
+    except re.error as err:
+        raise argparse.ArgumentTypeError(f"invalid regex '{value}': {err}")
+    return value
+
+
 class CLI:
     def __init__(self):
         self.parser = argparse.ArgumentParser(prog='garmin-workouts',
@@ -13,8 +26,8 @@ class CLI:
     def print_help(self):
         self.parser.print_help()
 
-    def init_parser(self):
-        # type: (None) -> argparse.ArgumentParser
+    def init_parser(self, argv=None):
+        # type: (list) -> argparse.Namespace
         # Basic options
         options = self.parser.add_argument_group('Options')
         options.add_argument(
@@ -24,6 +37,42 @@ class CLI:
             "-h", "--help", action='store_true',
             help="Show this help message and exit"
         )
+        options.add_argument(
+            "--rate-limit", type=float, default=0, metavar='N',
+            dest='rate_limit',
+            help="Maximum requests per second sent to the Garmin Connect. "
+            "Default: 0, no limit. The requests in flight are reduced, when "
+            "the server throttles them.")
+        options.add_argument(
+            "--max-retries", type=int, default=5, metavar='N',
+            dest='max_retries',
+            help="How many times to retry throttled or failed requests. "
+            "Default: 5")
+        options.add_argument(
+            "--session-ttl", type=float, default=1800, metavar='SECONDS',
+            dest='session_ttl',
+            help="Trust the stored session for this long without checking "
+            "it. Use 0 to always check. Default: 1800")
+        options.add_argument(
+            "--profile", action='store_true', dest='profile',
+            help="Print the time spent in each phase of the command and the "
+            "latency of the requests per endpoint")
+        options.add_argument(
+            "--profile-stats", metavar='FILE', dest='profile_stats',
+            help="Run the command under cProfile and save the stats to the "
+            ".pstats file. Implies --profile")
+        options.add_argument(
+            "--profile-json", metavar='FILE', dest='profile_json',
+            help="Save the phase timings and the latency histograms to the "
+            "JSON file. Implies --profile")
+        options.add_argument(
+            "--no-daemon", action='store_true', dest='no_daemon',
+            help="Run the command in this process, even when the daemon is "
+            "running")
+        options.add_argument(
+            "--daemon-socket", metavar='PATH', dest='daemon_socket',
+            help="Unix socket of the daemon. Default: in $XDG_RUNTIME_DIR or "
+            "the cache directory")
 
         # Sub-commands
         subparsers = self.parser.add_subparsers(title='Commands',
@@ -77,30 +126,89 @@ class CLI:
         )
         export_parser.add_argument(
             '--from-garmin-workouts-file', type=str, help='Instead of export '
-            ' from Garmin Connect, load workouts from given file.',
+            ' from Garmin Connect, load workouts from given file. Accepts the '
+            'raw archive or a JSON array of workouts.',
             dest='export_garmin_workouts_file'
         )
+        export_parser.add_argument(
+            '--raw-archive', type=str, metavar='PATH',
+            help='Store the raw Garmin Connect workouts into the NDJSON '
+            'archive. Compressed with gzip, when PATH ends with ".gz".',
+            dest='export_raw_archive'
+        )
+        export_parser.add_argument(
+            '--db', type=str, metavar='PATH', nargs='?', const='',
+            help='Store the workouts also into the SQLite database for the '
+            '`query` command. Without PATH, the default database is used.',
+            dest='export_db'
+        )
         export_parser.add_argument(
             '--no-steps', help='Export only the workouts info without '
             'steps', dest='export_no_steps', action='store_true'
         )
+        export_parser.add_argument(
+            '-j', '--jobs', type=int, dest='export_jobs', default=1,
+            metavar='N', help='Number of workouts to download in parallel, '
+            'or of processes converting the --from-garmin-workouts-file. '
+            'Default: 1'
+        )
+        export_parser.add_argument(
+            '--async', action='store_true', dest='use_async',
+            help='Send the requests with asyncio instead of threads. '
+            '--jobs limits the requests in flight. Needs aiohttp.'
+        )
+        export_parser.add_argument(
+            '--no-cache', help="Don't use the local cache of downloaded "
+            'workouts', dest='export_no_cache', action='store_true'
+        )
+        export_parser.add_argument(
+            '--refresh', help='Download all workouts again and refresh the '
+            'local cache with them', dest='export_refresh', action='store_true'
+        )
+        export_parser.add_argument(
+            '--resume', help='Keep a checkpoint while exporting into the file '
+            'and continue the interrupted export from it. Without FILENAME, '
+            'the last interrupted export is continued.',
+            dest='export_resume', action='store_true'
+        )
 
         import_parser = subparsers.add_parser(
             'import', help='Import workouts to the Garmin Connect from a file')
+        import_parser.add_argument(
+            'import_paths', nargs='*', metavar='FILE', help='Files, '
+            'directories or glob patterns with the workouts definition'
+        )
         import_parser.add_argument(
             '-f', '--file', type=str, help='Path to the file containing '
-            'workouts definition', dest='import_file')
+            'workouts definition (can be defined multiple times)',
+            action='append', dest='import_file')
+        import_parser.add_argument(
+            '-j', '--jobs', type=int, dest='import_jobs', default=4,
+            metavar='N', help='Number of workouts to upload in parallel. '
+            'Default: 4'
+        )
+        import_parser.add_argument(
+            '--async', action='store_true', dest='use_async',
+            help='Send the requests with asyncio instead of threads. '
+            '--jobs limits the requests in flight. Needs aiohttp.'
+        )
         import_parser.add_argument(
             '--save-to-file', help='Save imported workout into a file with its'
             ' ID', action='store_true', dest='import_save_to_file'
         )
+        import_parser.add_argument(
+            '--force', action='store_true', dest='import_force',
+            help='Upload also the workouts, which are the same as in the '
+            'Garmin Connect'
+        )
 
         remove_parser = subparsers.add_parser(
             'rm', aliases=['remove'], help='Remove one or more workouts from '
             ' Garmin Connect'
         )
         remove_parser.add_argument(
-            'WORKOUT_ID', nargs='*', help='The ID of workout to remove',
+            'WORKOUT_ID', nargs='*', type=int,
+            help='The ID of workout to remove',
         )
         remove_parser.add_argument(
             '--all', action='store_true',
@@ -122,20 +230,123 @@ class CLI:
             '--force', '-f', action='store_true',
             help="Don't prompt before removal", dest='remove_force'
         )
+        remove_parser.add_argument(
+            '-j', '--jobs', type=int, dest='remove_jobs', default=4,
+            metavar='N', help='Number of workouts to delete in parallel. '
+            'Default: 4'
+        )
+        remove_parser.add_argument(
+            '--async', action='store_true', dest='use_async',
+            help='Send the requests with asyncio instead of threads. '
+            '--jobs limits the requests in flight. Needs aiohttp.'
+        )
         remove_parser.add_argument(
             '--name', action='append', metavar='NAME',
             help='The name of workout to remove (can be defined multiple times)',
             dest='remove_workout_name'
         )
         remove_parser.add_argument(
-            '--regex', '-r', metavar='REG',
+            '--regex', '-r', metavar='REG', type=_regex,
             help='All workouts with name matching this regex will be deleted',
             dest='remove_regex'
         )
         remove_parser.add_argument(
-            '--id', action='append', metavar='ID',
+            '--id', action='append', metavar='ID', type=int,
             help='The ID of workout to remove (can be defined multiple times)',
             dest='remove_workout_id_optional'
         )
 
-        return self.parser.parse_args()
+        sync_parser = subparsers.add_parser(
+            'sync', help='Upload new and changed workouts from YAML files '
+            'to the Garmin Connect')
+        sync_parser.add_argument(
+            'sync_paths', nargs='+', metavar='PATH', help='Files, '
+            'directories or glob patterns with the workouts definition'
+        )
+        sync_parser.add_argument(
+            '--delete', action='store_true', dest='sync_delete',
+            help='Delete run workouts, which are not in the files'
+        )
+        sync_parser.add_argument(
+            '--dry-run', '-n', action='store_true', dest='sync_dry_run',
+            help='Only show the plan, change nothing'
+        )
+        sync_parser.add_argument(
+            '--force', '-f', action='store_true', dest='sync_force',
+            help="Don't prompt before applying the plan"
+        )
+        sync_parser.add_argument(
+            '-j', '--jobs', type=int, dest='sync_jobs', default=4,
+            metavar='N', help='Number of workouts to download and upload in '
+            'parallel. Default: 4'
+        )
+
+        query_parser = subparsers.add_parser(
+            'query', help='Search the workouts stored by `export --db`, '
+            'without the Garmin Connect')
+        query_parser.add_argument(
+            '--db', type=str, metavar='PATH', dest='query_db',
+            help='The database filled by `export --db`. Default: the same as '
+            'of `export --db`'
+        )
+        query_parser.add_argument(
+            '--id', type=int, metavar='ID', dest='query_id',
+            help='The ID of the workout'
+        )
+        query_parser.add_argument(
+            '--name', type=str, metavar='TEXT', dest='query_name',
+            help='Workouts with the name containing the text (ignoring case)'
+        )
+        query_parser.add_argument(
+            '--sport', type=str, dest='query_sport',
+            help='Workouts of the sport, e.g. running'
+        )
+        query_parser.add_argument(
+            '--target', choices=['pace', 'speed', 'hr', 'cadence', 'none'],
+            dest='query_target', help='Workouts with a step of the target'
+        )
+        query_parser.add_argument(
+            '--pace', type=str, metavar='MM:SS', dest='query_pace',
+            help='Workouts with a pace target including the pace per km'
+        )
+        query_parser.add_argument(
+            '--min-distance', type=float, metavar='KM',
+            dest='query_min_distance',
+            help='Workouts planned at least this long'
+        )
+        query_parser.add_argument(
+            '--max-distance', type=float, metavar='KM',
+            dest='query_max_distance',
+            help='Workouts planned at most this long'
+        )
+        query_parser.add_argument(
+            '--group-by', choices=['sport', 'target', 'step'],
+            dest='query_group_by',
+            help='Count the matching workouts (and steps) by the sport, '
+            'the target type or the step type'
+        )
+        query_parser.add_argument(
+            '--count', action='store_true', dest='query_count',
+            help='Print only the number of matching workouts'
+        )
+        query_parser.add_argument(
+            '--sql', type=str, metavar='QUERY', dest='query_sql',
+            help='Run the read-only SQL query over the `workouts` and `steps` '
+            'tables instead of the filters'
+        )
+
+        daemon_parser = subparsers.add_parser(
+            'daemon', help='Keep the session logged in and run the commands '
+            'of the CLI for it')
+        daemon_parser.add_argument(
+            '--idle-timeout', type=float, default=3600, metavar='SECONDS',
+            dest='daemon_idle_timeout',
+            help='Stop after this long without a command. Use 0 to never '
+            'stop. Default: 3600'
+        )
+        daemon_parser.add_argument(
+            '--stop', action='store_true', dest='daemon_stop',
+            help='Stop the running daemon'
+        )
+
+        return self.parser.parse_args(argv)
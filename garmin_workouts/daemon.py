@@ -0,0 +1,296 @@
+import io
+import logging
+import os
+import socket
+import sys
+import threading
+import time
+import traceback
+
+from contextlib import redirect_stdout, redirect_stderr
+
+from arguments import CLI
+from libs.app_dirs import ensure_dir
+from libs.daemon_client import default_socket_path, send_message, \
+    read_message, stop_daemon
+
+log = logging.getLogger(__name__)
+
+# Output of the command is sent to the client when there is this much of
+# it, or when it waited this long
+FLUSH_SIZE = 64 * 1024
+FLUSH_INTERVAL = 0.1
+
+
+class ClientGone(KeyboardInterrupt):
+    """
+    Raised in the command being served, when its client is gone, e.g. it
+    was interrupted. The commands handle it like the Ctrl+C, so it stops
+    them the same way, and the logging doesn't swallow it.
+    """
+
+
+class _ClientOutput():
+    """
+    STDOUT and STDERR of the command being served, sent to the client in
+    the order they were written.
+    """
+    def __init__(self, wfile):
+        self._wfile = wfile
+        # [kind, text] pieces waiting to be sent
+        self._pending = []
+        self._size = 0
+        self._sent_at = time.monotonic()
+        self._broken = False
+        self._lock = threading.Lock()
+        # Processes forked by the command must not write to the socket
+        self._pid = os.getpid()
+
+    def write(self, kind, text):
+        # type: (str, str) -> None
+        if os.getpid() != self._pid:
+            return
+        if self._broken:
+            raise ClientGone()
+        with self._lock:
+            if self._pending and self._pending[-1][0] == kind:
+                self._pending[-1][1] += text
+            else:
+                self._pending.append([kind, text])
+            self._size += len(text)
+            if self._size >= FLUSH_SIZE or \
+                    time.monotonic() - self._sent_at >= FLUSH_INTERVAL:
+                self._flush()
+
+    def flush(self):
+        if os.getpid() != self._pid:
+            return
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        pending, self._pending, self._size = self._pending, [], 0
+        self._sent_at = time.monotonic()
+        if self._broken:
+            return
+        try:
+            for kind, text in pending:
+                send_message(self._wfile, {kind: text})
+        except OSError as err:
+            self.close(err)
+
+    def close(self, err):
+        # type: (OSError) -> None
+        """
+        Stop the command, the client is gone. Any further output of the
+        command stops it as well.
+        """
+        self._broken = True
+        raise ClientGone() from err
+
+    @property
+    def broken(self):
+        # type: () -> bool
+        return self._broken
+
+
+class _ClientStream(io.TextIOBase):
+    def __init__(self, output, kind):
+        # type: (_ClientOutput, str) -> None
+        self._output = output
+        self._kind = kind
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        self._output.write(self._kind, text)
+        return len(text)
+
+    def flush(self):
+        self._output.flush()
+
+
+class _ClientStdin(io.TextIOBase):
+    """
+    STDIN of the command being served, so the prompts are answered by the
+    user of the client.
+    """
+    def __init__(self, output, rfile, wfile):
+        # type: (_ClientOutput, object, object) -> None
+        self._output = output
+        self._rfile = rfile
+        self._wfile = wfile
+
+    def readable(self):
+        return True
+
+    def readline(self, size=-1):
+        self._output.flush()
+        try:
+            send_message(self._wfile, {"readline": True})
+            message = read_message(self._rfile)
+        except OSError as err:
+            self._output.close(err)
+        return message.get("line", "") if message else ''
+
+
+class Daemon():
+    """
+    Keeps the logged in Garmin Connect client with its connection pool
+    and runs the commands sent by the CLI over the Unix socket, so they
+    don't pay for the start, the imports and the login.
+
+    Commands are served one at a time in the working directory of the
+    client. The global options of the daemon (--rate-limit, --max-retries,
+    --session-ttl) apply to all of them.
+    """
+    def __init__(self, args, run_command):
+        self.socket_path = os.path.abspath(args.daemon_socket or
+                                           default_socket_path)
+        if args.daemon_stop:
+            if stop_daemon(self.socket_path):
+                log.info('Daemon stopped')
+            else:
+                log.info(f'No daemon is listening on "{self.socket_path}"')
+            return
+
+        # Slow, only needed when the daemon starts
+        from login import Login
+        self.api_client = Login(args).get_api_client()
+        self.idle_timeout = args.daemon_idle_timeout
+        self._run_command = run_command
+        self.served = 0
+        self.serve()
+
+    def _listen(self):
+        # type: () -> socket.socket
+        ensure_dir(os.path.dirname(self.socket_path))
+        if os.path.exists(self.socket_path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.socket_path)
+            except OSError:
+                # Left behind by a daemon, which didn't stop cleanly
+                os.remove(self.socket_path)
+            else:
+                raise RuntimeError('A daemon is already listening on '
+                                   f'"{self.socket_path}"')
+            finally:
+                probe.close()
+
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        # Only the user can connect, the daemon acts with their session
+        umask = os.umask(0o177)
+        try:
+            listener.bind(self.socket_path)
+        finally:
+            os.umask(umask)
+        listener.listen(16)
+        listener.settimeout(self.idle_timeout or None)
+        return listener
+
+    def serve(self):
+        listener = self._listen()
+        log.info(f'Listening on "{self.socket_path}"')
+        try:
+            while True:
+                try:
+                    connection, _ = listener.accept()
+                except socket.timeout:
+                    log.info(f'Idle for {self.idle_timeout:.0f}s, stopping')
+                    break
+                with connection:
+                    connection.settimeout(None)
+                    if not self._handle(connection):
+                        log.info('Stopping on request')
+                        break
+        except KeyboardInterrupt:
+            log.info('Interrupted, stopping')
+        finally:
+            listener.close()
+            os.remove(self.socket_path)
+        log.info(f'Served {self.served} commands')
+
+    def _handle(self, connection):
+        # type: (socket.socket) -> bool
+        """
+        Serve one client. Returns False, when it asked the daemon to stop.
+        """
+        rfile = connection.makefile('rb')
+        wfile = connection.makefile('wb')
+        try:
+            request = read_message(rfile)
+            if request is None:
+                return True
+            if request.get("stop"):
+                send_message(wfile, {"exit": 0})
+                return False
+            exit_code = self._run(request, rfile, wfile)
+            send_message(wfile, {"exit": exit_code})
+        except (OSError, ValueError) as err:
+            log.warning(f'Client failed: {err}')
+        return True
+
+    def _run(self, request, rfile, wfile):
+        # type: (dict, object, object) -> int
+        """
+        Run the command of the request with the output going to the client.
+        Returns its exit code.
+        """
+        start = time.perf_counter()
+        output = _ClientOutput(wfile)
+        stdout = _ClientStream(output, "stdout")
+        handler = logging.StreamHandler(stdout)
+        handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+        root = logging.getLogger()
+        handlers, level = root.handlers[:], root.level
+        stdin, cwd = sys.stdin, os.getcwd()
+        command = ' '.join(request["argv"])
+
+        exit_code = 1
+        try:
+            os.chdir(request["cwd"])
+            with redirect_stdout(stdout), \
+                    redirect_stderr(_ClientStream(output, "stderr")):
+                sys.stdin = _ClientStdin(output, rfile, wfile)
+                # The log of the command goes to the client only, the
+                # same way as when it runs alone
+                root.handlers = [handler]
+                exit_code = self._call(request["argv"], output)
+        except ClientGone:
+            # Also raised by the output of the cleanup or of the traceback
+            exit_code = 130
+        finally:
+            root.handlers = handlers
+            root.setLevel(level)
+            sys.stdin = stdin
+            os.chdir(cwd)
+            self.served += 1
+            if output.broken:
+                log.warning(f'Client of "{command}" is gone, the command '
+                            'was stopped')
+            log.info(f'Served "{command}" in '
+                     f'{time.perf_counter() - start:.2f}s, exit {exit_code}')
+        return exit_code
+
+    def _call(self, argv, output):
+        # type: (list, _ClientOutput) -> int
+        """
+        Call the command with the arguments. Returns its exit code.
+        """
+        try:
+            args = CLI().init_parser(argv)
+            logging.getLogger().setLevel(logging.DEBUG if args.verbose
+                                         else logging.INFO)
+            self.api_client.reset_state()
+            self._run_command(args, self.api_client)
+            return 0
+        except SystemExit as err:
+            return err.code if isinstance(err.code, int) \
+                else int(err.code is not None)
+        except Exception:
+            traceback.print_exc()
+            return 1
+        finally:
+            output.flush()
@@ -1,23 +1,98 @@
+import asyncio
+import json
 import logging
+import os
+import sys
 import time
-import yaml
-import json
 
-from libs.parser import WorkoutParser, WorkoutsInfoParser
-from libs.garmin_api_client import GarminApiClient
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import nullcontext
+from typing import Callable, List
+
+from libs.parser import WorkoutParser
+from libs.profiling import active_profiler
+from libs.concurrency import ordered_map, async_ordered_map, chunked
+from libs.export_checkpoint import ExportCheckpoint, find_checkpointed
+from libs.async_garmin_api_client import AsyncGarminApiClient, \
+    DEFAULT_CONCURRENCY
+from libs.validator_store import ValidatorStore
+from libs.workout_cache import WorkoutCache
+from libs.workout_catalog import WorkoutCatalog
+from libs.yaml_writer import WorkoutsYamlWriter
+from libs.raw_archive import RawArchiveWriter, iter_raw_workout_texts
+from libs.workout_db import WorkoutDatabaseWriter, default_db_path
 
-from libs.exception import GarminConnectNotImplementedError
+from libs.exception import GarminConnectObjectError, \
+    GarminConnectNotImplementedError
 
 log = logging.getLogger(__name__)
 
+# Raw workouts sent to a worker process at once, so the pickling of the
+# chunks doesn't cost more than their conversion
+RAW_CHUNK_SIZE = 64
+
+
+def _conversion_error(err):
+    # type: (Exception) -> str
+    # The exceptions of the parser print the whole object, too much for
+    # the log of a big file
+    if isinstance(err, GarminConnectObjectError):
+        return f'missing "{err.property}"'
+    if isinstance(err, GarminConnectNotImplementedError):
+        return f'{err.property} "{err.value}" is not supported'
+    if isinstance(err, json.JSONDecodeError):
+        return f'invalid JSON: {err}'
+    return f'{type(err).__name__}: {err}'
+
+
+def convert_raw_workout(text: str,
+                        parse_workout: Callable = WorkoutParser) -> tuple:
+    """
+    Decode and parse one workout of the raw file. Returns the parsed
+    workout and None, or None and the reason why it failed.
+    """
+    garmin_workout = None
+    try:
+        garmin_workout = json.loads(text)
+        return parse_workout(garmin_workout), None
+    except (ValueError, KeyError, TypeError, AttributeError,
+            GarminConnectObjectError,
+            GarminConnectNotImplementedError) as err:
+        error = _conversion_error(err)
+        if isinstance(garmin_workout, dict) and \
+                garmin_workout.get("workoutId"):
+            error = f'workout {garmin_workout["workoutId"]}: {error}'
+        return None, error
+
+
+def convert_raw_workouts(texts: List[str]) -> List[tuple]:
+    """
+    `convert_raw_workout` for a chunk of the raw file. Runs in the worker
+    processes with `--jobs`.
+    """
+    return [convert_raw_workout(text) for text in texts]
+
 
 class Export():
-    def __init__(self, args, session):
+    def __init__(self, args, api_client):
         self._parse_args(args)
-        self.api_client = GarminApiClient(session=session)
-        with open("json_workouts.json", 'w') as outfile:
-            outfile.write("")
-        self._export()
+        self.api_client = api_client
+        if self._jobs > 1:
+            self.api_client.set_pool_size(self._jobs)
+        self._cache = None if self._no_cache \
+            else WorkoutCache(refresh=self._refresh)
+        if not self._no_cache:
+            # What the cache can't answer (`--id` without the update date,
+            # evicted entries) is requested conditionally. The 304s are
+            # served from the same cache.
+            self.api_client.set_validator_store(
+                ValidatorStore(self._cache, refresh=self._refresh))
+        self._catalog = WorkoutCatalog()
+        try:
+            self._export()
+        except KeyboardInterrupt:
+            self._interrupted()
+        self.api_client.log_request_stats()
 
     def _parse_args(self, args):
         self._export_runs = args.export_runs
@@ -43,94 +118,282 @@ class Export():
             self.order_seq = 'ASC'
         else:
             self.order_seq = 'DESC'
-        self.limit = args.export_limit if 'export_limit' in args else 999
+        self.limit = args.export_limit if 'export_limit' in args else None
         self.stdout = args.export_stdout
+        self._resume = args.export_resume
+        if self._resume and (self.stdout or self._from_garmin_workouts_file
+                             or self._workout_id or args.export_raw_archive
+                             or args.export_db is not None):
+            log.error('--resume works only for the export of the workouts '
+                      'list into a file, without --raw-archive and --db')
+            # The usage error, as argparse exits
+            sys.exit(2)
         if not self.stdout:
             if not args.export_file:
-                timestamp = time.strftime("%Y%m%d-%H%M%S")
-                self.filename = f'workouts_{timestamp}.yml'
+                # Continue the last interrupted export with the default name
+                self.filename = find_checkpointed() if self._resume else None
+                if not self.filename:
+                    timestamp = time.strftime("%Y%m%d-%H%M%S")
+                    self.filename = f'workouts_{timestamp}.yml'
             else:
                 self.filename = args.export_file
 
         self._no_steps = args.export_no_steps
+        self._jobs = max(args.export_jobs, 1)
+        self._no_cache = args.export_no_cache
+        self._refresh = args.export_refresh
+        self._raw_archive_path = args.export_raw_archive
+        # Empty, when `--db` is given without the path
+        self._db_path = None if args.export_db is None \
+            else args.export_db or default_db_path
+        self._async = args.use_async
+        self._checkpoint = None
 
-    def _get_and_parse_workout(self, id) -> WorkoutParser:
-        garmin_workout = self.api_client.get_workout_details(id)
-        with open("json_workouts.json", 'a') as outfile:
-            outfile.write(json.dumps(garmin_workout, indent=2))
-        workout_parser = WorkoutParser(garmin_format=garmin_workout)
-        return workout_parser
+    def _get_and_parse_workout(self, id, update_date=None) -> WorkoutParser:
+        garmin_workout = None
+        if self._cache:
+            garmin_workout = self._cache.get(id, update_date)
+        if garmin_workout is None:
+            garmin_workout = self.api_client.get_workout_details(id)
+            if self._cache:
+                self._cache.put(id, update_date, garmin_workout)
+        return self._parse_workout(garmin_workout)
 
-    def _export(self):
-        to_export = {
-            "version": 1
-        }
-        workouts = []
+    def _parse_workout(self, garmin_workout):
+        # type: (dict) -> WorkoutParser
+        return WorkoutParser(garmin_format=garmin_workout)
 
-        count = 1
+    def _convert_raw_workouts(self, texts: List[str]) -> List[tuple]:
+        # In this process `_parse_workout` can be timed by `--profile`
+        return [convert_raw_workout(text, self._parse_workout)
+                for text in texts]
 
-        if self._from_garmin_workouts_file:
-            with open(self._from_garmin_workouts_file, 'r') as infile:
-                garmin_workouts = json.load(infile)
-                total_count = len(garmin_workouts)
-                for garmin_workout in garmin_workouts:
-                    try:
-                        log.info(f'Done {count}/{total_count}...')
-                        count += 1
-                        parsed_workout = WorkoutParser(garmin_format=garmin_workout)
-                        if self._no_steps:
-                            parsed_workout.remove_steps()
-                    except GarminConnectNotImplementedError as err:
-                        to_export["error"] = "parsing error"
-                        to_export["workouts"] = workouts
-                        self.filename = "failed_workouts.yml"
-                        self._write_to_stream(to_export)
-                        raise err
-                    workouts.append(parsed_workout.get_own_format())
+    def _export_from_file(self, writer, raw_archive, database):
+        """
+        Convert the workouts of `--from-garmin-workouts-file`. The file is
+        read incrementally and with `--jobs` the chunks of it are converted
+        in the worker processes. Workouts, which can't be converted, are
+        reported and skipped.
+        """
+        chunks = chunked(iter_raw_workout_texts(self._from_garmin_workouts_file),
+                         RAW_CHUNK_SIZE)
+        failed_count = 0
+        with ProcessPoolExecutor(max_workers=self._jobs) \
+                if self._jobs > 1 else nullcontext() as executor:
+            if executor:
+                # Results keep the order of the file
+                results = ordered_map(executor, convert_raw_workouts, chunks,
+                                      window=self._jobs * 2)
+            else:
+                results = map(self._convert_raw_workouts, chunks)
+
+            number = 0
+            for converted in results:
+                for parsed_workout, error in converted:
+                    number += 1
+                    if error:
+                        log.error(f'Skipping workout #{number} of the '
+                                  f'"{self._from_garmin_workouts_file}": '
+                                  f'{error}')
+                        failed_count += 1
+                        continue
+                    log.info(f'Done {number}...')
+                    self._write_workout(writer, raw_archive, database,
+                                        parsed_workout)
+        if failed_count:
+            log.warning(f'{failed_count} workouts of the '
+                        f'"{self._from_garmin_workouts_file}" failed to '
+                        'convert')
+
+    def _select_runs(self, page: list) -> List[int]:
+        """
+        Add the page of the workouts list to the catalog and return the
+        positions of the workouts to export.
+        """
+        positions = self._catalog.extend(page)
+        if not self._export_runs:
+            return []
+        runs = self._catalog.by_sport("running", positions)
+        if self._checkpoint:
+            # Exported before the interruption
+            runs = [position for position in runs
+                    if self._catalog.get_id(position)
+                    not in self._checkpoint.completed]
+        return runs
+
+    def _fetch_workout(self, position):
+        # type: (int) -> WorkoutParser
+        """
+        Download and parse one workout from the catalog. Runs in the worker
+        threads when `--jobs` is given.
+        """
+        id = self._catalog.get_id(position)
+        parsed_workout = self._get_and_parse_workout(
+            id, self._catalog.get_update_date(position))
+        parsed_workout.set_workout_id(id)
+        return parsed_workout
+
+    async def _fetch_workout_async(self, client, position):
+        # type: (AsyncGarminApiClient, int) -> WorkoutParser
+        """
+        The same as `_fetch_workout`, with the async client.
+        """
+        id = self._catalog.get_id(position)
+        update_date = self._catalog.get_update_date(position)
+        garmin_workout = None
+        if self._cache:
+            garmin_workout = self._cache.get(id, update_date)
+        if garmin_workout is None:
+            garmin_workout = await client.get_workout_details(id)
+            if self._cache:
+                self._cache.put(id, update_date, garmin_workout)
+        parsed_workout = self._parse_workout(garmin_workout)
+        parsed_workout.set_workout_id(id)
+        return parsed_workout
+
+    async def _export_async(self, writer, raw_archive, database):
+        """
+        Export all workouts with the async client. `--jobs` limits the
+        number of requests in flight.
+        """
+        concurrency = self._jobs if self._jobs > 1 else DEFAULT_CONCURRENCY
+        async with AsyncGarminApiClient(self.api_client, concurrency) as client:
+            pages = client.iter_workouts_pages(self.limit, self.order_seq)
+            runs = (position async for page in pages
+                    for position in self._select_runs(page))
+
+            async def fetch_workout(position):
+                return await self._fetch_workout_async(client, position)
+
+            parsed_workouts = async_ordered_map(fetch_workout, runs,
+                                                window=concurrency * 2)
+            async for parsed_workout in parsed_workouts:
+                self._write_workout(writer, raw_archive, database,
+                                    parsed_workout)
+                log.info(f'Done {writer.count}...')
+
+    def _write_workout(self, writer, raw_archive, database, parsed_workout):
+        # type: (WorkoutsYamlWriter, RawArchiveWriter, WorkoutDatabaseWriter, WorkoutParser) -> None
+        if self._no_steps:
+            parsed_workout.remove_steps()
+        writer.write(parsed_workout.get_own_format())
+        if self._raw_archive_path:
+            raw_archive.write(parsed_workout.get_garmin_format())
+        if self._db_path:
+            database.write(parsed_workout)
+        if self._checkpoint:
+            self._checkpoint.commit(parsed_workout.get_workout_id(),
+                                    writer.tell())
+
+    def _load_checkpoint(self, writer):
+        # type: (WorkoutsYamlWriter) -> ExportCheckpoint
+        """
+        Continue the interrupted export into the same file from its
+        checkpoint, or start a new checkpoint.
+        """
+        checkpoint = ExportCheckpoint(self.filename, {
+            "filename": os.path.abspath(self.filename),
+            "sort": self.order_seq,
+            "limit": self.limit,
+            "runs": self._export_runs,
+            "no_steps": self._no_steps,
+        })
+        if checkpoint.load() and checkpoint.offset is not None and \
+                writer.resume(checkpoint.offset, len(checkpoint.completed)):
+            log.info(f'Resuming the export into the "{self.filename}" after '
+                     f'{writer.count} workouts')
+        else:
+            checkpoint.reset()
+        return checkpoint
+
+    def _instrument(self, writer, raw_archive, database):
+        """
+        Time the phases of the export for `--profile`. Nothing is replaced,
+        when it's off.
+        """
+        profiler = active_profiler()
+        if not profiler:
+            return
+        profiler.instrument(self, '_select_runs', 'catalog')
+        profiler.instrument(self, '_parse_workout', 'parse')
+        profiler.instrument(writer, 'write', 'yaml dump')
+        if self._raw_archive_path:
+            profiler.instrument(raw_archive, 'write', 'raw archive')
+        if self._db_path:
+            profiler.instrument(database, 'write', 'database')
+        if self._cache:
+            profiler.instrument(self._cache, 'get', 'cache read')
+            profiler.instrument(self._cache, 'put', 'cache write')
+
+    def _interrupted(self):
+        """
+        Report the export stopped by Ctrl+C and exit, without the traceback.
+        """
+        if self._checkpoint:
+            log.warning('Export interrupted after '
+                        f'{len(self._checkpoint.completed)} workouts. The '
+                        f'checkpoint "{self._checkpoint.path}" was kept, run '
+                        'the same export with --resume to continue')
         else:
+            log.warning('Export interrupted')
+        sys.exit(130)
+
+    def _export(self):
+        count = 1
+
+        filename = None if self.stdout else self.filename
+        raw_archive = RawArchiveWriter(self._raw_archive_path) \
+            if self._raw_archive_path else nullcontext()
+        database = WorkoutDatabaseWriter(self._db_path) \
+            if self._db_path else nullcontext()
+        writer = WorkoutsYamlWriter(filename, keep_partial=self._resume)
+        checkpoint = nullcontext()
+        if self._resume:
+            checkpoint = self._checkpoint = self._load_checkpoint(writer)
+            count += writer.count
+        with checkpoint, writer, raw_archive, database:
+            self._instrument(writer, raw_archive, database)
+            if self._from_garmin_workouts_file:
+                self._export_from_file(writer, raw_archive, database)
             # Get a specific workout, if ID was given as argument
-            if self._workout_id:
+            elif self._workout_id:
                 parsed_workout = self._get_and_parse_workout(self._workout_id)
-                if self._no_steps:
-                    parsed_workout.remove_steps()
-                workouts.append(parsed_workout.get_own_format())
+                self._write_workout(writer, raw_archive, database,
+                                    parsed_workout)
+            elif self._async:
+                asyncio.run(self._export_async(writer, raw_archive, database))
             else:
-                # Get all workouts
-                garmin_workouts_info = self.api_client.\
-                    get_workouts_info(self.limit, self.order_seq)
-                total_count = len(garmin_workouts_info)
-
-                for garmin_workout_info in garmin_workouts_info:
-                    try:
-                        workout_info = WorkoutsInfoParser(garmin_workout_info)
-                        if not (self._export_runs and workout_info.is_run()):
-                            continue
-
-                        id = workout_info.get_id()
-                        parsed_workout = self._get_and_parse_workout(id)
-                        parsed_workout.set_workout_id(id)
-                        log.info(f'Done {count}/{total_count}...')
-
-                        if self._no_steps:
-                            parsed_workout.remove_steps()
-                        count += 1
-                        workouts.append(parsed_workout.get_own_format())
-                    except GarminConnectNotImplementedError as err:
-                        if err.property != "sportType.sportTypeKey":
-                            # NOTE: Raise only different sports
-                            raise err
+                # Get all workouts. The workouts list comes page by page,
+                # so the first workouts are downloaded while the rest of the
+                # list is still on its way
+                pages = self.api_client.\
+                    iter_workouts_pages(self.limit, self.order_seq)
+                runs = (position for page in pages
+                        for position in self._select_runs(page))
 
+                with ThreadPoolExecutor(max_workers=self._jobs) as executor:
+                    # Results keep the order of the workouts list, no matter
+                    # in which order the workers finish
+                    parsed_workouts = ordered_map(executor,
+                                                  self._fetch_workout,
+                                                  runs,
+                                                  window=self._jobs * 2)
+                    for parsed_workout in parsed_workouts:
+                        log.info(f'Done {count}...')
                         count += 1
-                        count_str = f"({count}/{total_count})"
-                        log.info(f'Skipping {err.value} workout for now... {count_str}')
+                        # Each workout goes to the output as soon as it's
+                        # parsed, nothing is kept in memory
+                        self._write_workout(writer, raw_archive, database,
+                                            parsed_workout)
 
-        to_export["workouts"] = workouts
-        self._write_to_stream(to_export)
+            # The whole library went through the export, so the workouts it
+            # didn't see are gone from the Garmin Connect
+            if self._db_path and not (self._from_garmin_workouts_file or
+                                      self._workout_id or self.limit):
+                database.remove_others()
 
-    def _write_to_stream(self, to_export):
-        if self.stdout:
-            print(yaml.dump(to_export, default_flow_style=False, sort_keys=False))
-        else:
-            with open(self.filename, 'w') as outfile:
-                log.info('Storing workouts to the "%s"' % self.filename)
-                yaml.dump(to_export, outfile, sort_keys=False)
+        summary = f'Exported {writer.count} workouts'
+        if self._cache and not self._from_garmin_workouts_file:
+            summary += f' (cache: {self._cache.hits} hits, ' \
+                       f'{self._cache.misses} misses)'
+        log.info(summary)
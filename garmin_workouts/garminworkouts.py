@@ -5,11 +5,6 @@ import sys
 
 from arguments import CLI
 
-from login import Login
-from export import Export
-from import_workouts import Import
-from remove import Remove
-
 logging.basicConfig(stream=sys.stdout, level=logging.INFO)
 
 
@@ -24,22 +19,70 @@ def main():
         cli.print_help()
         exit(0)
 
+    if not args.command:
+        cli.print_help()
+        return
+
+    profiling = args.profile or args.profile_stats or args.profile_json
+    if not (profiling or args.no_daemon):
+        # Only what is needed to reach the daemon is imported before
+        from libs.daemon_client import DAEMON_COMMANDS, forward_to_daemon
+        if args.command in DAEMON_COMMANDS:
+            exit_code = forward_to_daemon(sys.argv[1:], args.daemon_socket)
+            if exit_code is not None:
+                sys.exit(exit_code)
+
+    profiler = None
+    if profiling:
+        from libs.profiling import Profiler
+        profiler = Profiler(stats_path=args.profile_stats)
+        profiler.start()
+    try:
+        run_command(args)
+    finally:
+        if profiler:
+            profiler.stop()
+            # stderr, so it doesn't mix with `export --stdout`
+            print(profiler.summary(), file=sys.stderr)
+            if args.profile_json:
+                profiler.write_json(args.profile_json)
+
+
+def run_command(args, api_client=None):
+    # Commands and their dependencies are imported only when they run, so
+    # `--help` and invalid arguments don't wait for them
+    if args.command == 'query':
+        # Works offline, no login
+        from query import Query
+        Query(args)
+        return
+    if args.command == 'daemon':
+        from daemon import Daemon
+        Daemon(args, run_command)
+        return
+
+    from login import Login, logout
+
     if args.command == 'login':
-        login = Login(args)
+        Login(args)
     elif args.command == 'logout':
-        login = Login()
-        login.logout()
+        logout()
     else:
-        login = Login(args)
-        session = login.get_session()
+        # The daemon passes its logged in client
+        if api_client is None:
+            api_client = Login(args).get_api_client()
         if args.command == 'export':
-            Export(args, session)
+            from export import Export
+            Export(args, api_client)
         elif args.command == 'import':
-            Import(args, session)
+            from import_workouts import Import
+            Import(args, api_client)
         elif args.command in ('rm', 'remove'):
-            Remove(args, session)
-        else:
-            cli.print_help()
+            from remove import Remove
+            Remove(args, api_client)
+        elif args.command == 'sync':
+            from sync import Sync
+            Sync(args, api_client)
 
 
 if __name__ == "__main__":
@@ -1,40 +1,267 @@
+import asyncio
 import logging
 import json
+import requests
 import yaml
 
+from concurrent.futures import ThreadPoolExecutor
+
 from libs.parser import WorkoutParser
-from libs.garmin_api_client import GarminApiClient
+from libs.concurrency import ordered_map, async_ordered_map
+from libs.async_garmin_api_client import AsyncGarminApiClient
+from libs.fingerprint import FingerprintStore, workout_fingerprint
+from libs.validator_store import ValidatorStore
+from libs.workout_cache import WorkoutCache
+from libs.workout_files import WORKOUT_ERRORS, expand_paths, \
+    parse_yaml_file, workout_error
 
 log = logging.getLogger(__name__)
 
 
 class Import():
-    def __init__(self, args, session):
-        self.filename = args.import_file
-        self.api_client = GarminApiClient(session=session)
+    def __init__(self, args, api_client):
+        self.filenames = (args.import_paths or []) + (args.import_file or [])
+        self.api_client = api_client
         self._save_to_file = args.import_save_to_file
+        # Upload also the workouts with the same fingerprint
+        self._force = args.import_force
+        self._fingerprints = FingerprintStore()
+        self._jobs = max(args.import_jobs, 1)
+        self._async = args.use_async
+        if self._jobs > 1:
+            self.api_client.set_pool_size(self._jobs)
+        if not self._force:
+            # Workouts unknown to the fingerprint store are compared with
+            # the downloaded ones
+            self._cache = WorkoutCache()
+            self.api_client.set_validator_store(ValidatorStore(self._cache))
         self.import_workouts()
+        self.api_client.log_request_stats()
 
     def import_workouts(self):
-        workout_obj = self.parse_yaml_file(self.filename)
+        """
+        Upload all workouts from the given files. Workouts are parsed and
+        converted here, while the uploads run in the worker threads.
 
-        workout_parser = WorkoutParser(own_format=workout_obj)
-        garmin_workout = workout_parser.get_garmin_format()
+        Workouts with an ID, which are the same as in the Garmin Connect,
+        are skipped unless `--force` is given. They are compared by the
+        fingerprint from the last upload, or of the downloaded workout.
+
+        At the end prints the manifest mapping each file to the ID of the
+        uploaded workout, or to the error. Files and workouts, which can't be
+        read or converted, don't stop the import. The manifest is printed
+        also when the import is interrupted, with the finished workouts.
+        """
+        manifest = []
+        try:
+            if self._async:
+                asyncio.run(self._import_workouts_async(manifest))
+            else:
+                with ThreadPoolExecutor(max_workers=self._jobs) as executor:
+                    results = ordered_map(executor, self._upload_workout,
+                                          self._iter_workouts(),
+                                          window=self._jobs * 2)
+                    for entry in results:
+                        manifest.append(entry)
+        finally:
+            self._fingerprints.save()
+            self._print_manifest(manifest)
+
+    def _print_manifest(self, manifest):
+        # type: (list) -> None
+        failed_count = len([entry for entry in manifest if "error" in entry])
+        unchanged_count = len([entry for entry in manifest
+                               if entry.get("unchanged")])
+        log.info(f'Imported {len(manifest) - failed_count - unchanged_count} '
+                 f'workouts, {unchanged_count} unchanged, '
+                 f'{failed_count} failed')
+        print(yaml.safe_dump(manifest, default_flow_style=False,
+                             sort_keys=False))
+
+    async def _import_workouts_async(self, manifest):
+        # type: (list) -> None
+        async with AsyncGarminApiClient(self.api_client, self._jobs) as client:
+            async def upload_workout(workout):
+                return await self._upload_workout_async(client, workout)
+
+            results = async_ordered_map(upload_workout, self._iter_workouts(),
+                                        window=self._jobs * 2)
+            async for entry in results:
+                manifest.append(entry)
+
+    def _iter_workouts(self):
+        """
+        Iterate over the workouts in the files as (filename, document,
+        workout parser, error). The parser is None, when the file or the
+        workout failed to parse, and the error says why.
+        """
+        for filename in expand_paths(self.filenames):
+            try:
+                workout_objs = parse_yaml_file(filename)
+            except (OSError, yaml.YAMLError) as err:
+                yield filename, None, None, str(err)
+                continue
+            for index, workout_obj in enumerate(workout_objs):
+                # Index of the workout is interesting only in the files
+                # with more of them
+                document = index if len(workout_objs) > 1 else None
+                try:
+                    workout_parser = WorkoutParser(own_format=workout_obj)
+                except WORKOUT_ERRORS as err:
+                    yield filename, document, None, workout_error(err)
+                    continue
+                yield filename, document, workout_parser, None
+
+    def _upload_workout(self, workout):
+        """
+        Upload one parsed workout. Runs in the worker threads.
+
+        Returns the manifest entry of the workout.
+        """
+        if workout[2] is None:
+            return self._failed_workout(workout)
+        entry, workout_parser, workout_json, fingerprint = \
+            self._prepare_upload(workout)
+        workout_name = workout_parser.get_workout_name()
+        workout_id = workout_parser.get_workout_id()
+        if self._is_unchanged(workout_id, fingerprint):
+            return self._skip_upload(entry, workout_id)
+        try:
+            if workout_id:
+                self.api_client.update_existing_workout(workout_json,
+                                                        workout_name,
+                                                        workout_id)
+            else:
+                workout_id, _ = self.api_client.upload_new_workout(workout_json, workout_name)
+        except requests.exceptions.RequestException as err:
+            return self._failed_upload(entry, err)
+
+        return self._finish_upload(entry, workout_parser, workout_id,
+                                   fingerprint)
+
+    async def _upload_workout_async(self, client, workout):
+        """
+        The same as `_upload_workout`, with the async client.
+        """
+        if workout[2] is None:
+            return self._failed_workout(workout)
+        entry, workout_parser, workout_json, fingerprint = \
+            self._prepare_upload(workout)
         workout_name = workout_parser.get_workout_name()
         workout_id = workout_parser.get_workout_id()
+        if await self._is_unchanged_async(client, workout_id, fingerprint):
+            return self._skip_upload(entry, workout_id)
+        try:
+            if workout_id:
+                await client.update_existing_workout(workout_json,
+                                                     workout_name,
+                                                     workout_id)
+            else:
+                workout_id, _ = await client.upload_new_workout(workout_json, workout_name)
+        except requests.exceptions.RequestException as err:
+            return self._failed_upload(entry, err)
+
+        return self._finish_upload(entry, workout_parser, workout_id,
+                                   fingerprint)
+
+    def _is_known_unchanged(self, workout_id, fingerprint):
+        # type: (int, str) -> bool
+        """
+        Compare the workout with the fingerprint store. Returns None, when
+        the store doesn't know the workout.
+        """
+        if self._force or not workout_id:
+            return False
+        stored_fingerprint = self._fingerprints.get(workout_id)
+        if stored_fingerprint is None:
+            return None
+        return stored_fingerprint == fingerprint
+
+    def _is_remote_unchanged(self, workout_id, fingerprint, garmin_workout):
+        # type: (int, str, dict) -> bool
+        # The body for the next conditional request, unless a 304 was
+        # served from it
+        stamp = garmin_workout.get("updateDate")
+        if not self._cache.contains(workout_id, stamp):
+            self._cache.put(workout_id, stamp, garmin_workout)
+        remote_fingerprint = workout_fingerprint(garmin_workout)
+        self._fingerprints.set(workout_id, remote_fingerprint)
+        return remote_fingerprint == fingerprint
+
+    def _is_unchanged(self, workout_id, fingerprint):
+        # type: (int, str) -> bool
+        """
+        Return True, when the workout doesn't need to be uploaded. Unknown
+        workouts are downloaded and compared, which is still cheaper than
+        an update.
+        """
+        unchanged = self._is_known_unchanged(workout_id, fingerprint)
+        if unchanged is not None:
+            return unchanged
+        try:
+            garmin_workout = self.api_client.get_workout_details(workout_id)
+        except requests.exceptions.RequestException:
+            # Let the update report the problem
+            return False
+        return self._is_remote_unchanged(workout_id, fingerprint,
+                                         garmin_workout)
+
+    async def _is_unchanged_async(self, client, workout_id, fingerprint):
+        # type: (AsyncGarminApiClient, int, str) -> bool
+        """
+        The same as `_is_unchanged`, with the async client.
+        """
+        unchanged = self._is_known_unchanged(workout_id, fingerprint)
+        if unchanged is not None:
+            return unchanged
+        try:
+            garmin_workout = await client.get_workout_details(workout_id)
+        except requests.exceptions.RequestException:
+            return False
+        return self._is_remote_unchanged(workout_id, fingerprint,
+                                         garmin_workout)
+
+    def _prepare_upload(self, workout):
+        filename, document, workout_parser, _ = workout
+        garmin_workout = workout_parser.get_garmin_format()
+
+        entry = {"file": filename}
+        if document is not None:
+            entry["document"] = document
+        entry["name"] = workout_parser.get_workout_name()
 
         workout_json = json.dumps(garmin_workout, sort_keys=True, indent=2)
 
         log.debug(json.dumps(garmin_workout, sort_keys=True, indent=2))
+        return entry, workout_parser, workout_json, \
+            workout_fingerprint(garmin_workout)
+
+    def _skip_upload(self, entry, workout_id):
+        log.info(f'Workout "{entry["name"]}" ({workout_id}) is unchanged, '
+                 'skipping')
+        entry["id"] = workout_id
+        entry["unchanged"] = True
+        return entry
 
-        if workout_id:
-            self.api_client.update_existing_workout(workout_json,
-                                                    workout_name,
-                                                    workout_id)
-        else:
-            workout_id, _ = self.api_client.upload_new_workout(workout_json, workout_name)
+    def _failed_workout(self, workout):
+        # type: (tuple) -> dict
+        filename, document, _, error = workout
+        entry = {"file": filename}
+        if document is not None:
+            entry["document"] = document
+        log.error(f'Failed to read the workout from {filename}: {error}')
+        entry["error"] = error
+        return entry
 
+    def _failed_upload(self, entry, err):
+        log.error(f'Failed to import "{entry["name"]}" from {entry["file"]}: {err}')
+        entry["error"] = str(err)
+        return entry
+
+    def _finish_upload(self, entry, workout_parser, workout_id, fingerprint):
+        entry["id"] = workout_id
         workout_parser.set_workout_id(workout_id)
+        self._fingerprints.set(workout_id, fingerprint)
         # Store the uploaded workout into the YAML file, so we can use
         # it for the future. Use the workout ID in the name
         if self._save_to_file:
@@ -45,10 +272,4 @@ class Import():
                                sort_keys=False,
                                stream=outfile)
                 log.info('Workout saved to "%s"' % stored_workout_name)
-
-    def parse_yaml_file(self, filename):
-        with open(filename, 'r') as infile:
-            log.info(f'Opening file {filename} for reading')
-            workout_obj = yaml.safe_load(infile)
-
-        return workout_obj
+        return entry
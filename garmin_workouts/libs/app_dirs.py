@@ -0,0 +1,17 @@
+import os
+
+from appdirs import AppDirs
+
+APP_NAME = 'garmin-workouts-cli'
+
+package_dirs = AppDirs(APP_NAME)
+
+
+def ensure_dir(path):
+    # type: (str) -> str
+    """
+    Create the directory, if it doesn't exist yet. Directories are created
+    only when something is written into them, never at import time.
+    """
+    os.makedirs(path, exist_ok=True)
+    return path
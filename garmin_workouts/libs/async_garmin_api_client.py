@@ -0,0 +1,391 @@
+import asyncio
+import email.utils
+import http
+import http.cookiejar
+import http.cookies
+import json
+import logging
+import requests
+import time
+from typing import AsyncIterator, List
+
+from libs import endpoints
+from libs.parser import WorkoutsInfoParser
+from libs.exception import GarminConnectNotImplementedError
+from libs.profiling import active_profiler
+from libs.throttling import AsyncAdaptiveConcurrency, RetryPolicy
+from libs.validator_store import conditional_headers
+
+# Requests in flight at the same time
+DEFAULT_CONCURRENCY = 64
+
+log = logging.getLogger(__name__)
+
+
+def _import_aiohttp():
+    """
+    Import the optional `aiohttp` package. It's slow to import, so only
+    the async mode pays for it.
+    """
+    try:
+        import aiohttp
+    except ImportError:
+        raise ImportError("The async mode needs the 'aiohttp' package. "
+                          "Install it with 'pip install aiohttp'.")
+    return aiohttp
+
+
+def _to_cookie(morsel, cookie=None):
+    # type: (http.cookies.Morsel, http.cookiejar.Cookie) -> http.cookiejar.Cookie
+    """
+    Convert the cookie of the aiohttp jar to the cookie of the LWP jar. The
+    domain of the replaced `cookie` is kept, it says whether the cookie is
+    for the subdomains as well.
+    """
+    domain = cookie.domain if cookie is not None else morsel["domain"]
+    expires = None
+    if morsel["max-age"]:
+        expires = int(time.time()) + int(morsel["max-age"])
+    elif morsel["expires"]:
+        expires = http.cookiejar.http2time(morsel["expires"])
+    return http.cookiejar.Cookie(
+        version=0, name=morsel.key, value=morsel.value, port=None,
+        port_specified=False, domain=domain, domain_specified=bool(domain),
+        domain_initial_dot=domain.startswith('.'),
+        path=morsel["path"] or '/', path_specified=True,
+        secure=bool(morsel["secure"]), expires=expires,
+        discard=expires is None, comment=None, comment_url=None, rest={})
+
+
+class AsyncResponse():
+    """
+    Response read from the aiohttp, with the part of the `requests.Response`
+    interface the client needs.
+    """
+    def __init__(self, method, url, status_code, reason, headers, text,
+                 history=()):
+        self.method = method
+        self.url = url
+        self.status_code = status_code
+        self.reason = reason
+        self.headers = headers
+        self.text = text
+        # Redirects followed to get the response
+        self.history = list(history)
+
+    def json(self):
+        return json.loads(self.text)
+
+    def raise_for_status(self):
+        """
+        Raise the same exception as `requests`, so the commands handle
+        errors the same way for both clients.
+        """
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(
+                f'{self.status_code} Error: {self.reason} for url: {self.url}')
+
+
+class AsyncGarminApiClient():
+    """
+    asyncio counterpart of the `GarminApiClient` for operations with many
+    requests in flight. Needs the optional `aiohttp` package.
+
+    It takes the cookies of the logged in synchronous client, which also
+    handles the authentication, when the session expires. Cookies changed
+    by the responses are given back to it and stored at the exit. Rate limit,
+    retry policy and request counters are shared with it. Requests in
+    flight are limited adaptively up to `concurrency`, the same way as in
+    the synchronous client.
+
+    Use as an async context manager:
+
+        async with AsyncGarminApiClient(api_client) as client:
+            workout = await client.get_workout_details(workout_id)
+    """
+    def __init__(self, api_client, concurrency=DEFAULT_CONCURRENCY):
+        # type: (GarminApiClient, int) -> None
+        self._aiohttp = _import_aiohttp()
+        self.api_client = api_client
+        self.concurrency = concurrency
+        self.stats = api_client.stats
+        self.session = None
+        self._concurrency = None
+        self._retry_policy = None
+
+        profiler = active_profiler()
+        if profiler:
+            profiler.instrument_async_api_client(self)
+
+    async def __aenter__(self):
+        self._concurrency = AsyncAdaptiveConcurrency(self.concurrency)
+        self._retry_policy = RetryPolicy(self.api_client.max_retries,
+                                         self.stats, self._concurrency)
+        aiohttp = self._aiohttp
+        connector = aiohttp.TCPConnector(limit=self.concurrency)
+        # The default jar refuses the cookies of the IP hosts
+        self.session = aiohttp.ClientSession(
+            connector=connector, cookie_jar=aiohttp.CookieJar(unsafe=True))
+        self._load_cookies()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        try:
+            self._save_cookies()
+        finally:
+            await self.session.close()
+
+    def _load_cookies(self):
+        """
+        Copy the cookies from the synchronous client's LWP cookie jar.
+        """
+        self.session.cookie_jar.clear()
+        for cookie in self.api_client.session.cookies:
+            morsel = http.cookies.Morsel()
+            morsel.set(cookie.name, cookie.value, cookie.value)
+            morsel["domain"] = cookie.domain
+            morsel["path"] = cookie.path
+            if cookie.expires is not None:
+                morsel["expires"] = email.utils.formatdate(cookie.expires,
+                                                           usegmt=True)
+            morsel["secure"] = cookie.secure
+            self.session.cookie_jar.update_cookies({cookie.name: morsel})
+
+    def _save_cookies(self):
+        """
+        Copy the cookies set by the responses back to the synchronous
+        client's jar, and store them for the next commands.
+        """
+        cookie_jar = self.api_client.session.cookies
+        cookies = {(cookie.domain.lstrip('.'), cookie.path, cookie.name): cookie
+                   for cookie in cookie_jar}
+        changed = False
+        for morsel in self.session.cookie_jar:
+            path = morsel["path"] or '/'
+            cookie = cookies.get((morsel["domain"], path, morsel.key))
+            if cookie is not None and cookie.value == morsel.value:
+                continue
+            cookie_jar.set_cookie(_to_cookie(morsel, cookie))
+            changed = True
+        if changed:
+            store = self.api_client.session_store
+            with store.lock():
+                store.save(cookie_jar)
+
+    async def _request(self, method, url, idempotent=True, **kwargs):
+        # type: (str, str, bool, ...) -> AsyncResponse
+        """
+        Send the request. Retries and re-authentication work the same way
+        as in `GarminApiClient._request`.
+        """
+        generation = self.api_client._auth_generation
+        response = await self._send(method, url, idempotent, **kwargs)
+        if self.api_client._is_unauthenticated(response):
+            # Authentication is synchronous, run it outside of the loop
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self.api_client._reauthenticate,
+                                       generation)
+            self._load_cookies()
+            response = await self._send(method, url, idempotent, **kwargs)
+        return response
+
+    async def _fetch(self, method, url, **kwargs):
+        # type: (str, str, ...) -> AsyncResponse
+        """
+        Send the request once and read the whole response.
+        """
+        async with self.session.request(method, url, **kwargs) as aio_response:
+            history = [AsyncResponse(method, str(redirect.url),
+                                     redirect.status, redirect.reason,
+                                     redirect.headers, '')
+                       for redirect in aio_response.history]
+            return AsyncResponse(method, url, aio_response.status,
+                                 aio_response.reason, aio_response.headers,
+                                 await aio_response.text(), history)
+
+    def _decode_json(self, response):
+        # type: (AsyncResponse) -> object
+        return response.json()
+
+    async def _send(self, method, url, idempotent=True, **kwargs):
+        # type: (str, str, bool, ...) -> AsyncResponse
+        attempt = 0
+        while True:
+            rate_limiter = self.api_client._rate_limiter
+            if rate_limiter:
+                await asyncio.sleep(rate_limiter.reserve())
+
+            response = None
+            async with self._concurrency:
+                try:
+                    response = await self._fetch(method, url, **kwargs)
+                except (self._aiohttp.ClientConnectionError,
+                        asyncio.TimeoutError) as err:
+                    if not self._retry_policy.can_retry_error(attempt,
+                                                              idempotent):
+                        # The same exception as from `requests`
+                        raise requests.exceptions.ConnectionError(
+                            f'{method} {url} failed: {err}') from err
+                    log.debug(f'{method} {url} failed: {err}')
+            self.stats.add(requests=1)
+
+            delay = self._retry_policy.retry_delay(method, url, response,
+                                                   attempt, idempotent)
+            if delay is None:
+                return response
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def get_workouts_info(self, limit: int = 999, order_seq: str = 'DESC',
+                                start: int = 1) -> List[dict]:
+        workouts_url = endpoints.WORKOUTS_LIST_URL
+        workouts_params = {
+            "start": start,
+            "limit": limit,
+            "myWorkoutsOnly": "true",
+            "sharedWorkoutsOnly": "false",
+            "orderBy": "WORKOUT_NAME",
+            "orderSeq": order_seq,
+            "includeAtp": "false",
+        }
+        workouts_response = await self._request('GET', workouts_url,
+                                                params=workouts_params)
+        workouts_response.raise_for_status()
+
+        return self._decode_json(workouts_response)
+
+    async def iter_workouts_pages(
+            self, limit: int = None, order_seq: str = 'DESC',
+            page_size: int = 100) -> AsyncIterator[List[dict]]:
+        """
+        Iterate over the pages of the workouts list with all workouts (or
+        the first `limit` ones), requesting the next page while the current
+        one is processed.
+        """
+        start = 1
+        remaining = limit
+
+        def next_page():
+            page_limit = page_size if remaining is None \
+                else min(page_size, remaining)
+            return asyncio.ensure_future(self.get_workouts_info(
+                page_limit, order_seq, start)), page_limit
+
+        task, page_limit = next_page()
+        while task:
+            page = await task
+            start += len(page)
+            if remaining is not None:
+                remaining -= len(page)
+
+            task = None
+            if len(page) == page_limit and remaining != 0:
+                task, page_limit = next_page()
+
+            yield page
+
+    async def iter_workouts_info(
+            self, limit: int = None, order_seq: str = 'DESC',
+            page_size: int = 100) -> AsyncIterator[WorkoutsInfoParser]:
+        """
+        Iterate over the info of all workouts (or the first `limit` ones)
+        page by page. Workouts with a sport we don't support yet are skipped.
+        """
+        async for page in self.iter_workouts_pages(limit, order_seq,
+                                                   page_size):
+            for workout_info in page:
+                try:
+                    yield WorkoutsInfoParser(workout_info)
+                except GarminConnectNotImplementedError as err:
+                    if err.property != "sportType.sportTypeKey":
+                        raise err
+                    log.info(f'Skipping {err.value} workout for now...')
+
+    async def get_workout_details(self, id):
+        workout_url = endpoints.workout_details_url(id)
+        store = self.api_client.validator_store
+        validators = store.get_validators(id) if store else None
+        workout_response = await self._request(
+            'GET', workout_url, headers=conditional_headers(validators))
+        if validators and \
+                workout_response.status_code == http.HTTPStatus.NOT_MODIFIED:
+            workout = store.get_body(id, validators)
+            if workout is not None:
+                self.stats.add(not_modified=1)
+                return workout
+            workout_response = await self._request('GET', workout_url)
+        workout_response.raise_for_status()
+
+        workout = self._decode_json(workout_response)
+        if store:
+            self.api_client._store_validators(id, workout_response.headers,
+                                              workout)
+        return workout
+
+    async def upload_new_workout(self, workout_json, workout_name):
+        log.info(f"Uploading a new workout '{workout_name}' to the Garmin Connect")
+        headers = {
+            "Accept": "application/json, text/javascript, */*; q=0.01",
+            "Accept-Language": "en-US,en;q=0.5",
+            "NK": "NT",
+            "Referer": endpoints.WORKOUTS_PAGE_URL,
+            "Content-Type": "application/json",
+        }
+        response = await self._request(
+            'POST',
+            endpoints.WORKOUT_SERVICE_URL,
+            idempotent=False, headers=headers, data=workout_json)
+        response.raise_for_status()
+
+        response_json = response.json()
+        workout_id = response_json["workoutId"]
+        new_workout_url = endpoints.workout_url(workout_id)
+        log.info(f'New workout created: {new_workout_url}')
+        return workout_id, response_json
+
+    async def update_existing_workout(self, workout_json, workout_name,
+                                      workout_id):
+        log.info(f"Updating existing workout '{workout_id}' with the name '{workout_name}'")
+        headers = {
+            "Accept": "application/json, text/javascript, */*; q=0.01",
+            "Accept-Language": "en-US,en;q=0.5",
+            "NK": "NT",
+            "Referer": endpoints.workout_edit_url(workout_id),
+            "Content-Type": "application/json",
+            "X-HTTP-Method-Override": "PUT",
+        }
+        response = await self._request(
+            'POST',
+            endpoints.workout_service_url(workout_id),
+            headers=headers, data=workout_json)
+        response.raise_for_status()
+
+        log.info(f'Workout updated: {endpoints.workout_url(workout_id)}')
+
+    async def delete_workout(self, workout_id):
+        # type: (int) -> int
+        """
+        Delete the workout with the given ID. Returns the HTTP status code,
+        like `GarminApiClient.delete_workout`.
+        """
+        log.debug(f"Deleting workout with ID '{workout_id}'")
+        headers = {
+            "Accept": "application/json, text/javascript, */*; q=0.01",
+            "Accept-Language": "en-US,en;q=0.5",
+            "NK": "NT",
+            "Referer": endpoints.WORKOUTS_PAGE_URL,
+            "Content-Type": "application/json",
+            "X-HTTP-Method-Override": "DELETE",
+        }
+        response = await self._request(
+            'POST',
+            endpoints.workout_service_url(workout_id),
+            headers=headers)
+
+        if response.status_code in (http.HTTPStatus.NOT_FOUND,
+                                    http.HTTPStatus.FORBIDDEN):
+            return response.status_code
+
+        response.raise_for_status()
+        log.debug(f"Workout '{workout_id}' deleted")
+        return response.status_code
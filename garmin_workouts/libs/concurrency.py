@@ -0,0 +1,65 @@
+import asyncio
+from collections import deque
+from itertools import islice
+from typing import Callable, Iterable, Iterator, List
+
+
+def ordered_map(executor: object, fn: Callable, iterable: Iterable,
+                window: int) -> Iterator:
+    """
+    Like `Executor.map`, but it takes items from `iterable` lazily and
+    keeps at most `window` of them in flight.
+
+    `Executor.map` submits the whole iterable up front, so it would wait
+    for the last page of a paginated generator before yielding anything.
+
+    Results are yielded in the order of `iterable`.
+    """
+    pending = deque()
+    for item in iterable:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+
+    while pending:
+        yield pending.popleft().result()
+
+
+def chunked(iterable: Iterable, size: int) -> Iterator[List]:
+    """
+    Split `iterable` lazily into lists of `size` items, the last one can
+    be shorter.
+    """
+    iterator = iter(iterable)
+    chunk = list(islice(iterator, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, size))
+
+
+async def async_ordered_map(fn, iterable, window):
+    """
+    asyncio version of `ordered_map`. `fn` is a coroutine function and
+    `iterable` a regular or an async iterable.
+
+    At most `window` coroutines run at once, results are yielded in the
+    order of `iterable`.
+    """
+    pending = deque()
+    try:
+        if hasattr(iterable, '__aiter__'):
+            async for item in iterable:
+                pending.append(asyncio.ensure_future(fn(item)))
+                if len(pending) >= window:
+                    yield await pending.popleft()
+        else:
+            for item in iterable:
+                pending.append(asyncio.ensure_future(fn(item)))
+                if len(pending) >= window:
+                    yield await pending.popleft()
+
+        while pending:
+            yield await pending.popleft()
+    finally:
+        for task in pending:
+            task.cancel()
@@ -1,6 +1,10 @@
 import math
 
-from typing import Tuple
+from typing import Iterable, List, Tuple
+
+# Largest float, which still holds every integer exactly. The vectorized
+# paths convert to int64 only below it, the rest goes to the scalar path.
+MAX_EXACT_INT = 2 ** 53
 
 
 def mps_to_min_per_km(mps):
@@ -86,3 +90,135 @@ def mps_to_kmh_string(mps):
     """
 
     return f"{mps * 3.6:.1f} km/h"
+
+
+def _import_numpy():
+    """
+    Import the optional `numpy` package for the batch conversions. Returns
+    None, when it's not installed and the pure-Python loop is used.
+    """
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+def _as_float_array(numpy, values):
+    """
+    Return the values as 1-D float64 array, or None when they are not plain
+    numbers. Such values go through the scalar functions, so they fail (or
+    not) the same way as with a single call.
+    """
+    array = numpy.asarray(values)
+    if array.ndim != 1 or array.dtype.kind not in 'iuf':
+        return None
+    return array.astype(numpy.float64)
+
+
+def _unique(numpy, array):
+    """
+    Return the distinct values and the indices to rebuild the array from
+    them. Values are compared bit by bit, so 0.0 and -0.0 stay apart.
+    """
+    bits, inverse = numpy.unique(array.view(numpy.int64), return_inverse=True)
+    return bits.view(numpy.float64), inverse
+
+
+def _expand(numpy, strings, inverse) -> List[str]:
+    return numpy.array(strings, dtype=object)[inverse].tolist()
+
+
+def mps_to_pace_strings(values: Iterable[float]) -> List[str]:
+    """
+    Batch version of `mps_to_pace_string`.
+
+    Return list of formatted strings: "MINS:SECS min/km"
+    """
+    values = values if hasattr(values, '__len__') else list(values)
+    numpy = _import_numpy()
+    array = _as_float_array(numpy, values) if numpy else None
+    if array is None:
+        return [mps_to_pace_string(mps) for mps in values]
+
+    unique, inverse = _unique(numpy, array)
+    if not (numpy.isfinite(unique).all() and unique.all()):
+        # Zero raises ZeroDivisionError like the scalar function does
+        return [mps_to_pace_string(mps) for mps in values]
+    mins_per_km = 1000 / (60 * unique)
+    if not (numpy.abs(mins_per_km) < MAX_EXACT_INT).all():
+        return [mps_to_pace_string(mps) for mps in values]
+
+    minutes = numpy.floor(mins_per_km)
+    # `rint` rounds half to even, as `round` does
+    seconds = numpy.rint(60 * (mins_per_km - minutes))
+    strings = [f"{mins}:{secs} min/km" for mins, secs
+               in zip(minutes.astype(numpy.int64).tolist(),
+                      seconds.astype(numpy.int64).tolist())]
+    return _expand(numpy, strings, inverse)
+
+
+def pace_strings_to_mps(pace_strings: Iterable[str]) -> List[float]:
+    """
+    Batch version of `pace_string_to_mps`.
+
+    Parsing the strings can't be vectorized, every distinct pace is
+    converted only once instead.
+    """
+    converted = {}
+    mps_values = []
+    for pace_string in pace_strings:
+        mps = converted.get(pace_string)
+        if mps is None:
+            mps = converted[pace_string] = pace_string_to_mps(pace_string)
+        mps_values.append(mps)
+    return mps_values
+
+
+def seconds_to_time_strings(values: Iterable[float]) -> List[str]:
+    """
+    Batch version of `seconds_to_time_string`.
+    """
+    values = values if hasattr(values, '__len__') else list(values)
+    numpy = _import_numpy()
+    array = _as_float_array(numpy, values) if numpy else None
+    if array is None:
+        return [seconds_to_time_string(seconds) for seconds in values]
+
+    unique, inverse = _unique(numpy, array)
+    if not (numpy.abs(unique) < MAX_EXACT_INT).all():
+        # Also catches inf and nan, `int()` of them raises
+        return [seconds_to_time_string(seconds) for seconds in values]
+
+    # `remainder` has the sign of the divisor, as `%` does
+    seconds = numpy.trunc(numpy.remainder(unique, 60))
+    minutes_total = numpy.floor(unique / 60)
+    hours = numpy.floor(minutes_total / 60)
+    minutes = minutes_total - hours * 60
+
+    strings = []
+    for hrs, mins, secs in zip(hours.astype(numpy.int64).tolist(),
+                               minutes.astype(numpy.int64).tolist(),
+                               seconds.astype(numpy.int64).tolist()):
+        if hrs != 0:
+            strings.append(f"{hrs:02d}:{mins:02d}:{secs:02d} hours")
+        elif mins != 0:
+            strings.append(f"{mins:02d}:{secs:02d} minutes")
+        else:
+            strings.append(f"{secs:02d} seconds")
+    return _expand(numpy, strings, inverse)
+
+
+def mps_to_kmh_strings(values: Iterable[float]) -> List[str]:
+    """
+    Batch version of `mps_to_kmh_string`.
+    """
+    values = values if hasattr(values, '__len__') else list(values)
+    numpy = _import_numpy()
+    array = _as_float_array(numpy, values) if numpy else None
+    if array is None:
+        return [mps_to_kmh_string(mps) for mps in values]
+
+    unique, inverse = _unique(numpy, array)
+    strings = [f"{kmh:.1f} km/h" for kmh in (unique * 3.6).tolist()]
+    return _expand(numpy, strings, inverse)
@@ -0,0 +1,104 @@
+import json
+import os
+import socket
+import sys
+
+from libs.app_dirs import package_dirs
+
+# Commands, which are sent to the running daemon
+DAEMON_COMMANDS = ('export', 'import', 'rm', 'remove', 'sync')
+
+default_socket_path = os.path.join(
+    os.environ.get('XDG_RUNTIME_DIR') or package_dirs.user_cache_dir,
+    'garmin-workouts-cli.sock')
+
+
+def send_message(wfile, message):
+    # type: (object, dict) -> None
+    """
+    Send one message of the daemon protocol, a JSON object on a line.
+    """
+    wfile.write(json.dumps(message).encode('utf-8') + b'\n')
+    wfile.flush()
+
+
+def read_message(rfile):
+    # type: (object) -> dict
+    """
+    Read one message of the daemon protocol, or None when the other side
+    closed the connection.
+    """
+    line = rfile.readline()
+    if not line:
+        return None
+    return json.loads(line)
+
+
+def _connect(socket_path):
+    # type: (str) -> socket.socket
+    if not hasattr(socket, 'AF_UNIX') or not os.path.exists(socket_path):
+        return None
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(socket_path)
+    except OSError:
+        # Left behind by a daemon, which didn't stop cleanly
+        client.close()
+        return None
+    return client
+
+
+def forward_to_daemon(argv, socket_path=None):
+    # type: (list, str) -> int
+    """
+    Run the command with the arguments `argv` in the daemon, when one is
+    listening on the socket. Its output and prompts are passed through.
+
+    Returns the exit code of the command, or None when there is no daemon
+    and the command has to run in this process.
+    """
+    client = _connect(socket_path or default_socket_path)
+    if not client:
+        return None
+
+    with client:
+        rfile = client.makefile('rb')
+        wfile = client.makefile('wb')
+        send_message(wfile, {"argv": argv, "cwd": os.getcwd()})
+        while True:
+            message = read_message(rfile)
+            if message is None:
+                print('The daemon closed the connection', file=sys.stderr)
+                return 1
+            if "stdout" in message:
+                try:
+                    sys.stdout.write(message["stdout"])
+                    sys.stdout.flush()
+                except BrokenPipeError:
+                    # E.g. piped to `head`. Closing the connection stops
+                    # the command in the daemon.
+                    os.dup2(os.open(os.devnull, os.O_WRONLY),
+                            sys.stdout.fileno())
+                    return 1
+            elif "stderr" in message:
+                sys.stderr.write(message["stderr"])
+                sys.stderr.flush()
+            elif "readline" in message:
+                send_message(wfile, {"line": sys.stdin.readline()})
+            elif "exit" in message:
+                return message["exit"]
+
+
+def stop_daemon(socket_path=None):
+    # type: (str) -> bool
+    """
+    Ask the daemon listening on the socket to stop. Returns False, when
+    there is none.
+    """
+    client = _connect(socket_path or default_socket_path)
+    if not client:
+        return False
+    with client:
+        send_message(client.makefile('wb'), {"stop": True})
+        read_message(client.makefile('rb'))
+    return True
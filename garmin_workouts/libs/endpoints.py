@@ -0,0 +1,42 @@
+import os
+
+# Base URLs of the Garmin Connect. They can be pointed to a local stand-in
+# server (see `benchmarks/fake_garmin_connect.py`) with the environment
+# variables.
+CONNECT_URL = os.environ.get('GARMIN_CONNECT_URL', 'https://connect.garmin.com').rstrip('/')
+SSO_URL = os.environ.get('GARMIN_SSO_URL', 'https://sso.garmin.com').rstrip('/')
+
+SETTINGS_URL = f'{CONNECT_URL}/modern/settings'
+LOGOUT_URL = f'{CONNECT_URL}/modern/auth/logout'
+SIGNIN_URL = f'{SSO_URL}/sso/signin'
+MODERN_URL = f'{CONNECT_URL}/modern'
+WORKOUTS_PAGE_URL = f'{CONNECT_URL}/modern/workouts'
+WORKOUTS_LIST_URL = f'{CONNECT_URL}/proxy/workout-service/workouts'
+# Creating new workouts
+WORKOUT_SERVICE_URL = f'{CONNECT_URL}/modern/proxy/workout-service/workout'
+
+
+def workout_url(workout_id):
+    # type: (int) -> str
+    """
+    URL of the workout in the Garmin Connect web application
+    """
+    return f'{CONNECT_URL}/modern/workout/{workout_id}'
+
+
+def workout_edit_url(workout_id):
+    # type: (int) -> str
+    return f'{CONNECT_URL}/modern/workout/edit/{workout_id}'
+
+
+def workout_details_url(workout_id):
+    # type: (int) -> str
+    return f'{CONNECT_URL}/proxy/workout-service/workout/{workout_id}'
+
+
+def workout_service_url(workout_id):
+    # type: (int) -> str
+    """
+    URL for updating and deleting the workout
+    """
+    return f'{WORKOUT_SERVICE_URL}/{workout_id}'
@@ -0,0 +1,150 @@
+import glob
+import json
+import logging
+import os
+
+log = logging.getLogger(__name__)
+
+CHECKPOINT_VERSION = 1
+
+
+def checkpoint_path(filename):
+    # type: (str) -> str
+    """
+    Return the path of the checkpoint of the export into `filename`. It
+    lies next to the partial output of the `WorkoutsYamlWriter`.
+    """
+    directory, basename = os.path.split(os.path.abspath(filename))
+    return os.path.join(directory, f'.{basename}.checkpoint')
+
+
+def find_checkpointed(pattern='workouts_*.yml'):
+    # type: (str) -> str
+    """
+    Return the newest output matching the `pattern` in the current
+    directory, whose export was interrupted, or None.
+    """
+    checkpoints = sorted(glob.glob(f'.{pattern}.checkpoint'),
+                         key=os.path.getmtime)
+    if not checkpoints:
+        return None
+    return checkpoints[-1][1:-len('.checkpoint')]
+
+
+class ExportCheckpoint():
+    """
+    Progress of the export into a file, so `export --resume` can continue
+    after it was interrupted.
+
+    The converted workouts are already in the partial output of the
+    writer, the checkpoint records only the IDs of the finished workouts
+    and the size of the partial output after each of them. The first line
+    holds the options of the export, every next one `<id> <offset>`. Lines
+    are only appended, one per workout, and a line cut by the interruption
+    is ignored.
+
+    The lines are flushed, not synced, so the checkpoint survives a killed
+    process but not necessarily a crash of the system.
+    """
+    def __init__(self, filename, options):
+        # type: (str, dict) -> None
+        self.path = checkpoint_path(filename)
+        self.options = dict(options, version=CHECKPOINT_VERSION)
+        self.completed = set()
+        # Size of the partial output with all completed workouts
+        self.offset = None
+        # Bytes of the checkpoint up to the last complete line
+        self._size = None
+        self._file = None
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type:
+            self.close()
+            # Interrupted export reports the checkpoint itself
+            if not issubclass(exc_type, KeyboardInterrupt):
+                log.info('Run the export with --resume to continue')
+        else:
+            self.remove()
+
+    def load(self):
+        # type: () -> bool
+        """
+        Read the checkpoint of the previous run. Returns False, when there
+        is none or it was made with other options.
+        """
+        try:
+            with open(self.path, 'rb') as infile:
+                header = infile.readline()
+                options = json.loads(header)
+                lines = infile.readlines()
+        except (OSError, ValueError):
+            return False
+        if options != self.options:
+            log.warning(f'Checkpoint "{self.path}" was made with other '
+                        'options, starting over')
+            return False
+
+        self._size = len(header)
+        for line in lines:
+            try:
+                workout_id, offset = map(int, line.split())
+            except ValueError:
+                break
+            if not line.endswith(b'\n'):
+                break
+            self.completed.add(workout_id)
+            self.offset = offset
+            self._size += len(line)
+        return True
+
+    def open(self):
+        """
+        Open the checkpoint for appending, or start a new one when nothing
+        was loaded.
+        """
+        if self._size is None:
+            self._file = open(self.path, 'w')
+            self._file.write(json.dumps(self.options) + '\n')
+            self._file.flush()
+        else:
+            # Drop the line cut by the interruption
+            self._file = open(self.path, 'r+')
+            self._file.truncate(self._size)
+            self._file.seek(self._size)
+
+    def reset(self):
+        """
+        Forget the loaded progress, `open` starts a new checkpoint.
+        """
+        self.completed = set()
+        self.offset = None
+        self._size = None
+
+    def commit(self, workout_id, offset):
+        # type: (int, int) -> None
+        """
+        Record the workout, whose output ends at `offset`.
+        """
+        self.completed.add(workout_id)
+        self.offset = offset
+        self._file.write(f'{workout_id} {offset}\n')
+        self._file.flush()
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def remove(self):
+        """
+        Remove the checkpoint of the finished export.
+        """
+        self.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,124 @@
+import hashlib
+import json
+import os
+import threading
+
+from libs.app_dirs import package_dirs, ensure_dir
+
+# Decimal places of the compared values. Garmin Connect may store the
+# floats we send with a different precision.
+FLOAT_PRECISION = 4
+
+fingerprints_path = os.path.join(package_dirs.user_cache_dir,
+                                 'fingerprints.json')
+
+
+def _key(payload, key):
+    # type: (dict, str) -> str
+    return payload.get(key) if payload else None
+
+
+def _value(value):
+    if isinstance(value, float):
+        return round(value, FLOAT_PRECISION)
+    return value
+
+
+def canonical_step(garmin_step):
+    # type: (dict) -> dict
+    """
+    Return only the parts of the step, which define the training. IDs,
+    ordering numbers and display details are left out.
+    """
+    step = {
+        "type": garmin_step.get("type"),
+        "stepType": _key(garmin_step.get("stepType"), "stepTypeKey"),
+    }
+    if garmin_step.get("type") == "RepeatGroupDTO":
+        step["iterations"] = garmin_step.get("numberOfIterations")
+        step["steps"] = [canonical_step(substep)
+                         for substep in garmin_step.get("workoutSteps", [])]
+        return step
+
+    step["endCondition"] = _key(garmin_step.get("endCondition"),
+                                "conditionTypeKey")
+    # A missing target is the same as no target
+    step["targetType"] = _key(garmin_step.get("targetType"),
+                              "workoutTargetTypeKey") or "no.target"
+    # Values are compared only when defined, Garmin Connect returns nulls
+    # for the ones we don't send
+    for key in ("endConditionValue", "endConditionCompare", "targetValueOne",
+                "targetValueTwo", "zoneNumber"):
+        if garmin_step.get(key) is not None:
+            step[key] = _value(garmin_step[key])
+    return step
+
+
+def canonical_workout(garmin_workout):
+    # type: (dict) -> dict
+    """
+    Normalize the workout in the Garmin Connect API format, so the one
+    converted from the YAML file and the one downloaded from the Garmin
+    Connect are equal, when they describe the same training.
+    """
+    return {
+        "name": garmin_workout.get("workoutName"),
+        "sportType": _key(garmin_workout.get("sportType"), "sportTypeKey"),
+        "segments": [{
+            "sportType": _key(segment.get("sportType"), "sportTypeKey"),
+            "steps": [canonical_step(step)
+                      for step in segment.get("workoutSteps", [])],
+        } for segment in garmin_workout.get("workoutSegments", [])],
+    }
+
+
+def workout_fingerprint(garmin_workout):
+    # type: (dict) -> str
+    """
+    Return the hash of the canonical form of the workout.
+    """
+    canonical = json.dumps(canonical_workout(garmin_workout), sort_keys=True,
+                           separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class FingerprintStore():
+    """
+    Fingerprints of the workouts as they were last uploaded to (or found
+    in) the Garmin Connect, by workout ID. Stored as a JSON file.
+
+    Changes made directly in the Garmin Connect are not seen here.
+    """
+    def __init__(self, path=fingerprints_path):
+        # type: (str) -> None
+        self.path = path
+        self._fingerprints = {}
+        self._changed = False
+        self._lock = threading.Lock()
+        try:
+            with open(self.path, 'r') as infile:
+                self._fingerprints = json.load(infile)
+        except (OSError, ValueError):
+            pass
+
+    def get(self, workout_id):
+        # type: (int) -> str
+        return self._fingerprints.get(str(workout_id))
+
+    def set(self, workout_id, fingerprint):
+        # type: (int, str) -> None
+        with self._lock:
+            if self._fingerprints.get(str(workout_id)) != fingerprint:
+                self._fingerprints[str(workout_id)] = fingerprint
+                self._changed = True
+
+    def save(self):
+        with self._lock:
+            if not self._changed:
+                return
+            ensure_dir(os.path.dirname(self.path))
+            tmp_path = f'{self.path}.tmp'
+            with open(tmp_path, 'w') as outfile:
+                json.dump(self._fingerprints, outfile, sort_keys=True)
+            os.replace(tmp_path, self.path)
+            self._changed = False
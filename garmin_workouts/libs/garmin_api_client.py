@@ -1,23 +1,29 @@
 import logging
 import http
-import os
 import re
 import requests
+import threading
 import json
-from typing import List
-from fake_useragent import UserAgent
-
-from appdirs import AppDirs
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List
 
+from libs import endpoints
 from libs.parser import WorkoutsInfoParser
-
-APP_NAME = 'garmin-workouts-cli'
-
-package_dirs = AppDirs(APP_NAME)
-if not os.path.exists(package_dirs.user_config_dir):
-    os.makedirs(package_dirs.user_config_dir)
-
-cookie_jar_path = f'{package_dirs.user_config_dir}/cookie.txt'
+from libs.profiling import active_profiler
+from libs.exception import GarminConnectNotImplementedError
+from libs.throttling import TokenBucket, AdaptiveConcurrency, RequestStats, \
+    RetryPolicy
+from libs.session_store import SessionStore
+from libs.validator_store import conditional_headers, response_validators
+
+# Requests per second sent to the Garmin Connect, no limit by default. The
+# adaptive concurrency and the Retry-After of the throttled requests slow
+# the client down, when the server asks for it.
+DEFAULT_RATE_LIMIT = 0
+DEFAULT_MAX_RETRIES = 5
+# Seconds for which the stored session is trusted without checking it
+DEFAULT_SESSION_TTL = 30 * 60
 
 log = logging.getLogger(__name__)
 
@@ -26,79 +32,244 @@ class GarminApiClient():
     """
     Class to comunicate with Garmin Connect API
     """
-    def __init__(self, username=None, password=None, session=None):
+    def __init__(self, username=None, password=None, session=None,
+                 rate_limit=DEFAULT_RATE_LIMIT,
+                 max_retries=DEFAULT_MAX_RETRIES,
+                 session_ttl=DEFAULT_SESSION_TTL, session_store=None):
+        # type: (str, str, requests.Session, float, int, float, SessionStore) -> None
         self.username = username
         self.password = password
-        self.cookie_jar_path = cookie_jar_path
+        # Cookies shared with the other processes
+        self.session_store = session_store or SessionStore()
+        self.session_ttl = session_ttl
         self.session = session
+        # Increased with every authentication, so concurrent requests
+        # failing on the same expired session authenticate only once
+        self._auth_generation = 0
+        self._auth_lock = threading.Lock()
+        self.max_retries = max_retries
+        self.stats = RequestStats()
+        # No rate limit, when it's not a positive number
+        self._rate_limiter = TokenBucket(rate_limit) if rate_limit else None
+        self._pool_size = requests.adapters.DEFAULT_POOLSIZE
+        self._concurrency = AdaptiveConcurrency(self._pool_size)
+        self._retry_policy = RetryPolicy(max_retries, self.stats,
+                                         self._concurrency)
+        # Conditional requests for the workout details, when it's set
+        self.validator_store = None
 
         if not self.session:
             self.login()
 
+        profiler = active_profiler()
+        if profiler:
+            profiler.instrument_api_client(self)
+
     def login(self):
         self.session = requests.Session()
-        self.session.cookies = http.cookiejar.LWPCookieJar(cookie_jar_path)
-
-        if os.path.isfile(cookie_jar_path):
-            self.session.cookies.load(ignore_discard=True, ignore_expires=True)
-
-        response = self.session.get("https://connect.garmin.com/modern/settings", allow_redirects=False)
-        if response.status_code != 200:
-            self._authenticate()
-            log.info('Login successful')
-        else:
-            log.debug('Using stored cookies')
+        self.session.cookies = http.cookiejar.LWPCookieJar()
+        store = self.session_store
+
+        if store.load(self.session.cookies) and \
+                store.is_fresh(self.session_ttl):
+            # Skip the check, if the session expired anyway, we
+            # authenticate on the first request failing on it
+            log.debug('Using stored cookies validated recently')
+            return
+
+        with store.lock():
+            # Another process could have checked the session or logged in
+            # while this one was waiting for the lock
+            if store.load(self.session.cookies) and \
+                    store.is_fresh(self.session_ttl):
+                log.debug('Using stored cookies validated by another process')
+                return
+
+            response = self._request('GET', endpoints.SETTINGS_URL,
+                                     reauthenticate=False,
+                                     allow_redirects=False)
+            if response.status_code != 200:
+                self._authenticate()
+                log.info('Login successful')
+            else:
+                log.debug('Using stored cookies')
+                store.mark_valid()
+
+    def _reauthenticate(self, generation):
+        # type: (int) -> None
+        """
+        Authenticate again, unless another thread or process did it already
+        since the failed request was sent.
+        """
+        with self._auth_lock:
+            if generation != self._auth_generation:
+                return
+            with self.session_store.lock():
+                if self.session_store.load_newer(self.session.cookies):
+                    log.info('Session expired, using the one of another '
+                             'process')
+                    self._auth_generation += 1
+                    return
+                log.info('Session expired, logging in again')
+                self.session_store.invalidate()
+                self._authenticate()
 
     def logout(self):
         if self.session:
-            response = self.session.get('https://connect.garmin.com/modern/auth/logout')
+            response = self._request('GET', endpoints.LOGOUT_URL,
+                                     reauthenticate=False)
             response.raise_for_status()
             self.session.cookies.clear()
 
-        if os.path.exists(self.cookie_jar_path):
-            os.remove(self.cookie_jar_path)
+        with self.session_store.lock():
+            self.session_store.clear()
 
         log.info('Logged out')
 
+    def set_pool_size(self, pool_size):
+        # type: (int) -> None
+        """
+        Mount a connection pool on the session big enough for `pool_size`
+        threads sharing it, so parallel requests don't throw away
+        connections to the Garmin Connect. Plain HTTP gets it too, e.g.
+        for the Garmin Connect URL overridden to a local server.
+        """
+        self._concurrency.set_maximum(pool_size)
+        if pool_size <= self._pool_size:
+            # Keep the open connections of the current pool
+            return
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size,
+                                                pool_maxsize=pool_size)
+        for prefix in ('https://', 'http://'):
+            self.session.mount(prefix, adapter)
+        self._pool_size = pool_size
+
+    def set_validator_store(self, validator_store):
+        # type: (ValidatorStore) -> None
+        """
+        Send the workout details requests as conditional GETs with the
+        validators from the store, and keep the new ones there.
+        """
+        self.validator_store = validator_store
+
+    def reset_state(self):
+        """
+        Forget what the previous command set up, so the next one can reuse
+        the client with its session and connections.
+        """
+        self.validator_store = None
+        self.stats = RequestStats()
+
+    def log_request_stats(self):
+        if self.stats.retries or self.stats.throttled:
+            log.info(f'Garmin Connect requests: {self.stats}')
+        else:
+            log.debug(f'Garmin Connect requests: {self.stats}')
+        if self.stats.unvalidated:
+            log.info(f'{self.stats.unvalidated} workouts came without ETag '
+                     'and Last-Modified, they will be downloaded in full '
+                     'next time too')
+
+    def _request(self, method, url, idempotent=True, reauthenticate=True,
+                 **kwargs):
+        # type: (str, str, bool, bool, ...) -> requests.Response
+        """
+        Send the request to the Garmin Connect. When the response says the
+        session expired (401, or a redirect to the sign in), authenticate
+        again and repeat the request once.
+
+        Returns the last response, the caller checks its status.
+        """
+        generation = self._auth_generation
+        response = self._send(method, url, idempotent, **kwargs)
+        if reauthenticate and self._is_unauthenticated(response):
+            self._reauthenticate(generation)
+            response = self._send(method, url, idempotent, **kwargs)
+        return response
+
+    @staticmethod
+    def _is_unauthenticated(response):
+        # type: (requests.Response) -> bool
+        redirected = [response] + response.history
+        return response.status_code == http.HTTPStatus.UNAUTHORIZED or \
+            any(r.status_code == http.HTTPStatus.FOUND for r in redirected)
+
+    def _send(self, method, url, idempotent=True, **kwargs):
+        # type: (str, str, bool, ...) -> requests.Response
+        """
+        Send the request through the rate limiter and the concurrency
+        limiter, retrying it as the `RetryPolicy` says.
+        """
+        attempt = 0
+        while True:
+            if self._rate_limiter:
+                self._rate_limiter.acquire()
+
+            response = None
+            with self._concurrency:
+                try:
+                    response = self.session.request(method, url, **kwargs)
+                except (requests.exceptions.ConnectionError,
+                        requests.exceptions.Timeout) as err:
+                    if not self._retry_policy.can_retry_error(attempt,
+                                                              idempotent):
+                        raise err
+                    log.debug(f'{method} {url} failed: {err}')
+            self.stats.add(requests=1)
+
+            delay = self._retry_policy.retry_delay(method, url, response,
+                                                   attempt, idempotent)
+            if delay is None:
+                return response
+            attempt += 1
+            time.sleep(delay)
+
+    def _decode_json(self, response):
+        # type: (requests.Response) -> object
+        return json.loads(response.text)
+
     def delete_workout(self, workout_id):
-        log.info(f"Deleting workout with ID '{workout_id}'")
+        # type: (int) -> int
+        """
+        Delete the workout with the given ID.
+
+        Returns the HTTP status code. Missing (404) and forbidden (403)
+        workouts are not an error, the caller decides how to report them.
+        """
+        log.debug(f"Deleting workout with ID '{workout_id}'")
         headers = {
             "Accept": "application/json, text/javascript, */*; q=0.01",
             "Accept-Language": "en-US,en;q=0.5",
             "NK": "NT",
-            "Referer": f"https://connect.garmin.com/modern/workouts",
+            "Referer": endpoints.WORKOUTS_PAGE_URL,
             "Content-Type": "application/json",
             "X-HTTP-Method-Override": "DELETE",
         }
-        response = self.session.post(
-            f"https://connect.garmin.com/modern/proxy/workout-service/workout/{workout_id}",
+        response = self._request(
+            'POST',
+            endpoints.workout_service_url(workout_id),
             headers=headers)
 
-        try:
-            response.raise_for_status()
-            log.info('Workout deleted')
-        except requests.exceptions.HTTPError as err:
-            if response.status_code == 404:
-                log.info('Workout with given ID doesn\'t exist')
-                log.info(err)
-            elif response.status_code == 403:
-                log.info("Can't access workout with given ID")
-                log.info(err)
-            else:
-                raise err
+        if response.status_code in (http.HTTPStatus.NOT_FOUND,
+                                    http.HTTPStatus.FORBIDDEN):
+            return response.status_code
+
+        response.raise_for_status()
+        log.debug(f"Workout '{workout_id}' deleted")
+        return response.status_code
 
     @staticmethod
     def get_workout_url(workout_id) -> str:
-        return f"https://connect.garmin.com/modern/workout/{workout_id}"
+        return endpoints.workout_url(workout_id)
 
     def get_workout_api_url(self, workout_id):
-        return f"https://connect.garmin.com/modern/proxy/workout-service/workout/{workout_id}"
+        return endpoints.workout_service_url(workout_id)
 
-    def get_workouts_info(self, limit=999, order_seq='DESC'):
-        # type: (int, str) -> object
-        workouts_url = "https://connect.garmin.com/proxy/workout-service/workouts"
+    def get_workouts_info(self, limit=999, order_seq='DESC', start=1):
+        # type: (int, str, int) -> object
+        workouts_url = endpoints.WORKOUTS_LIST_URL
         workouts_params = {
-            "start": 1,
+            "start": start,
             "limit": limit,
             "myWorkoutsOnly": True,
             "sharedWorkoutsOnly": False,
@@ -106,46 +277,105 @@ class GarminApiClient():
             "orderSeq": order_seq,
             "includeAtp": False,
         }
-        workouts_response = self.session.get(
+        workouts_response = self._request(
+            'GET',
             url=workouts_url,
             params=workouts_params)
         workouts_response.raise_for_status()
 
-        return json.loads(workouts_response.text)
+        return self._decode_json(workouts_response)
+
+    def iter_workouts_pages(self, limit: int = None, order_seq: str = 'DESC',
+                            page_size: int = 100) -> Iterator[List[dict]]:
+        """
+        Iterate over the pages of the workouts list with all workouts (or
+        the first `limit` ones). The next page is downloaded in the
+        background while the current one is processed.
+        """
+        start = 1
+        remaining = limit
+
+        def next_page():
+            page_limit = page_size if remaining is None \
+                else min(page_size, remaining)
+            return executor.submit(self.get_workouts_info,
+                                   page_limit, order_seq, start), page_limit
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            future, page_limit = next_page()
+            while future:
+                page = future.result()
+                start += len(page)
+                if remaining is not None:
+                    remaining -= len(page)
+
+                # Prefetch the next page, unless this one was the last
+                future = None
+                if len(page) == page_limit and remaining != 0:
+                    future, page_limit = next_page()
+
+                yield page
+
+    def iter_workouts_info(
+            self, limit: int = None, order_seq: str = 'DESC',
+            page_size: int = 100) -> Iterator[WorkoutsInfoParser]:
+        """
+        Iterate over the info of all workouts (or the first `limit` ones),
+        requesting the workouts list page by page.
+
+        Workouts with a sport we don't support yet are skipped.
+        """
+        for page in self.iter_workouts_pages(limit, order_seq, page_size):
+            for workout_info in page:
+                try:
+                    yield WorkoutsInfoParser(workout_info)
+                except GarminConnectNotImplementedError as err:
+                    if err.property != "sportType.sportTypeKey":
+                        raise err
+                    log.info(f'Skipping {err.value} workout for now...')
 
     def get_all_runs_info(self) -> List[WorkoutsInfoParser]:
-        all_workouts_info = self.get_workouts_info()
-        run_workouts_info = []
-        for workout_info in all_workouts_info:
-            workout = WorkoutsInfoParser(workout_info)
-            if workout.is_run():
-                run_workouts_info.append(workout)
-        return run_workouts_info
+        return [workout for workout in self.iter_workouts_info()
+                if workout.is_run()]
 
     def get_all_bikes_info(self) -> List[WorkoutsInfoParser]:
-        all_workouts_info = self.get_workouts_info()
-        bike_workouts_info = []
-        for workout_info in all_workouts_info:
-            workout = WorkoutsInfoParser(workout_info)
-            if workout.is_bike():
-                bike_workouts_info.append(workout)
-        return bike_workouts_info
+        return [workout for workout in self.iter_workouts_info()
+                if workout.is_bike()]
 
     def get_all_swims_info(self) -> List[WorkoutsInfoParser]:
-        all_workouts_info = self.get_workouts_info()
-        swim_workouts_info = []
-        for workout_info in all_workouts_info:
-            workout = WorkoutsInfoParser(workout_info)
-            if workout.is_swim():
-                swim_workouts_info.append(workout)
-        return swim_workouts_info
-
+        return [workout for workout in self.iter_workouts_info()
+                if workout.is_swim()]
 
     def get_workout_details(self, id):
-        workout_url = f'https://connect.garmin.com/proxy/workout-service/workout/{id}'
-        workout_response = self.session.get(workout_url)
-
-        return json.loads(workout_response.text)
+        workout_url = endpoints.workout_details_url(id)
+        store = self.validator_store
+        validators = store.get_validators(id) if store else None
+        workout_response = self._request(
+            'GET', workout_url, headers=conditional_headers(validators))
+        if validators and \
+                workout_response.status_code == http.HTTPStatus.NOT_MODIFIED:
+            workout = store.get_body(id, validators)
+            if workout is not None:
+                self.stats.add(not_modified=1)
+                return workout
+            # The stored body is gone, download it again
+            workout_response = self._request('GET', workout_url)
+        workout_response.raise_for_status()
+
+        workout = self._decode_json(workout_response)
+        if store:
+            self._store_validators(id, workout_response.headers, workout)
+        return workout
+
+    def _store_validators(self, id, headers, workout):
+        # type: (int, dict, dict) -> None
+        validators = response_validators(headers)
+        if validators:
+            stamp = workout.get("updateDate") if isinstance(workout, dict) \
+                else None
+            self.validator_store.put(id, validators, stamp)
+        else:
+            self.stats.add(unvalidated=1)
 
     def upload_new_workout(self, workout_json, workout_name):
         log.info(f"Uploading a new workout '{workout_name}' to the Garmin Connect")
@@ -153,17 +383,18 @@ class GarminApiClient():
             "Accept": "application/json, text/javascript, */*; q=0.01",
             "Accept-Language": "en-US,en;q=0.5",
             "NK": "NT",
-            "Referer": "https://connect.garmin.com/modern/workouts",
+            "Referer": endpoints.WORKOUTS_PAGE_URL,
             "Content-Type": "application/json",
         }
-        response = self.session.post(
-            "https://connect.garmin.com/modern/proxy/workout-service/workout",
-            headers=headers, data=workout_json)
+        response = self._request(
+            'POST',
+            endpoints.WORKOUT_SERVICE_URL,
+            idempotent=False, headers=headers, data=workout_json)
         response.raise_for_status()
 
         response_json = response.json()
         workout_id = response_json["workoutId"]
-        new_workout_url = f"https://connect.garmin.com/modern/workout/{workout_id}"
+        new_workout_url = endpoints.workout_url(workout_id)
         log.info(f'New workout created: {new_workout_url}')
         return workout_id, response_json
 
@@ -173,16 +404,17 @@ class GarminApiClient():
             "Accept": "application/json, text/javascript, */*; q=0.01",
             "Accept-Language": "en-US,en;q=0.5",
             "NK": "NT",
-            "Referer": f"https://connect.garmin.com/modern/workout/edit/{workout_id}",
+            "Referer": endpoints.workout_edit_url(workout_id),
             "Content-Type": "application/json",
             "X-HTTP-Method-Override": "PUT",
         }
-        response = self.session.post(
-            f"https://connect.garmin.com/modern/proxy/workout-service/workout/{workout_id}",
+        response = self._request(
+            'POST',
+            endpoints.workout_service_url(workout_id),
             headers=headers, data=workout_json)
         response.raise_for_status()
 
-        log.info(f'Workout updated: https://connect.garmin.com/modern/workout/{workout_id}')
+        log.info(f'Workout updated: {endpoints.workout_url(workout_id)}')
 
     def _authenticate(self):
         username = self.username
@@ -203,16 +435,19 @@ class GarminApiClient():
         }
 
         request_params = {
-            "service": "https://connect.garmin.com/modern"
+            "service": endpoints.MODERN_URL
         }
 
         headers = {
-            'origin': 'https://sso.garmin.com',
+            'origin': endpoints.SSO_URL,
             'User-Agent': self._genenerate_user_agent()
         }
 
-        auth_response = self.session.post(
-            url="https://sso.garmin.com/sso/signin",
+        auth_response = self._request(
+            'POST',
+            url=endpoints.SIGNIN_URL,
+            idempotent=False,
+            reauthenticate=False,
             headers=headers,
             params=request_params,
             data=form_data)
@@ -221,13 +456,16 @@ class GarminApiClient():
 
         auth_ticket_url = self._extract_auth_ticket_url(auth_response.text)
 
-        response = self.session.get(auth_ticket_url)
+        response = self._request('GET', auth_ticket_url, reauthenticate=False)
         response.raise_for_status()
 
-        self.session.cookies.save(ignore_discard=True, ignore_expires=True)
+        self.session_store.save(self.session.cookies)
         self.session.close()
+        self._auth_generation += 1
 
     def _genenerate_user_agent(self):
+        # Slow to import, only needed for the authentication
+        from fake_useragent import UserAgent
         ua = UserAgent()
         return ua.random
 
@@ -1,8 +1,9 @@
 
 import logging
-import libs.garmin_api_client
 
+from types import MappingProxyType
 
+from libs import endpoints
 from libs.conversions import \
     mps_to_pace_string, \
     pace_string_to_mps, \
@@ -16,6 +17,313 @@ from libs.exception import \
 
 log = logging.getLogger(__name__)
 
+# Constant payloads of the Garmin Connect API format. They are read-only,
+# each converted step and workout gets its own copy.
+RUNNING_SPORT = MappingProxyType({"sportTypeId": 1,
+                                  "sportTypeKey": "running"})
+REPEAT_STEP_TYPE = MappingProxyType({"stepTypeId": 6,
+                                     "stepTypeKey": "repeat"})
+LAP_BUTTON_CONDITION = MappingProxyType({"conditionTypeId": 1,
+                                         "conditionTypeKey": "lap.button"})
+DISTANCE_CONDITION = MappingProxyType({"conditionTypeId": 3,
+                                       "conditionTypeKey": "distance"})
+KILOMETER_UNIT = MappingProxyType({"unitId": 2, "unitKey": "kilometer",
+                                   "factor": 100000.0})
+NO_TARGET = MappingProxyType({"workoutTargetTypeId": 1,
+                              "workoutTargetTypeKey": "no.target"})
+HEART_RATE_ZONE_TARGET = MappingProxyType({
+    "workoutTargetTypeId": 4, "workoutTargetTypeKey": "heart.rate.zone"})
+PACE_ZONE_TARGET = MappingProxyType({"workoutTargetTypeId": 6,
+                                     "workoutTargetTypeKey": "pace.zone"})
+
+# Own step type -> Garmin stepType
+GARMIN_STEP_TYPES = MappingProxyType({
+    "warmup": MappingProxyType({"stepTypeId": 1, "stepTypeKey": "warmup"}),
+    "cooldown": MappingProxyType({"stepTypeId": 2,
+                                  "stepTypeKey": "cooldown"}),
+    "run": MappingProxyType({"stepTypeId": 3, "stepTypeKey": "interval"}),
+    "recovery": MappingProxyType({"stepTypeId": 4,
+                                  "stepTypeKey": "recovery"}),
+})
+
+# Garmin stepTypeKey -> own step type
+OWN_STEP_TYPES = MappingProxyType({
+    "warmup": "warmup",
+    "cooldown": "cooldown",
+    "interval": "run",
+    "recovery": "recovery",
+    "rest": "rest",
+    "other": "other",
+})
+
+# Garmin endConditionCompare of the heart rate condition -> own key
+OWN_HEART_RATE_COMPARES = MappingProxyType({
+    "lt": "hr_below",
+    "gt": "hr_above",
+})
+
+
+def _garmin_target_values(garmin_step):
+    # type: (dict) -> tuple
+    if "targetValueOne" not in garmin_step:
+        raise GarminConnectObjectError("targetValueOne", garmin_step)
+    if "targetValueTwo" not in garmin_step:
+        raise GarminConnectObjectError("targetValueTwo", garmin_step)
+    return garmin_step["targetValueOne"], garmin_step["targetValueTwo"]
+
+
+def _own_distance(garmin_step, own_step):
+    own_step["distance"] = garmin_step["endConditionValue"]
+
+
+def _own_lap_button(garmin_step, own_step):
+    own_step["lap_button"] = True
+
+
+def _own_time(garmin_step, own_step):
+    own_step["time"] = seconds_to_time_string(garmin_step["endConditionValue"])
+
+
+def _own_calories(garmin_step, own_step):
+    own_step["calories"] = garmin_step["endConditionValue"]
+
+
+def _own_heart_rate(garmin_step, own_step):
+    hr_compare = garmin_step["endConditionCompare"]
+    if hr_compare not in OWN_HEART_RATE_COMPARES:
+        raise GarminConnectNotImplementedError("endConditionCompare",
+                                               hr_compare,
+                                               garmin_step)
+    own_step[OWN_HEART_RATE_COMPARES[hr_compare]] = \
+        garmin_step["endConditionValue"]
+
+
+def _own_pace_zone(garmin_step, own_step):
+    mps_from, mps_to = _garmin_target_values(garmin_step)
+    own_step["pace_from"] = mps_to_pace_string(mps_from)
+    own_step["pace_to"] = mps_to_pace_string(mps_to)
+
+
+def _own_heart_rate_zone(garmin_step, own_step):
+    if garmin_step.get("zoneNumber") is not None:
+        # We have a precise zone number
+        own_step["hr_zone"] = garmin_step["zoneNumber"]
+    else:
+        # We have a zone range with the 2 values
+        own_step["hr_low"] = garmin_step["targetValueOne"]
+        own_step["hr_high"] = garmin_step["targetValueTwo"]
+
+
+def _own_speed_zone(garmin_step, own_step):
+    mps_from, mps_to = _garmin_target_values(garmin_step)
+    own_step["pace_from"] = mps_to_kmh_string(mps_from)
+    own_step["pace_to"] = mps_to_kmh_string(mps_to)
+
+
+def _own_cadence(garmin_step, own_step):
+    own_step["cadence_from"], own_step["cadence_to"] = \
+        _garmin_target_values(garmin_step)
+
+
+def _own_no_target(garmin_step, own_step):
+    pass
+
+
+# Garmin conditionTypeKey -> converter of the end condition
+OWN_END_CONDITIONS = {
+    "distance": _own_distance,
+    "lap.button": _own_lap_button,
+    "time": _own_time,
+    "calories": _own_calories,
+    "heart.rate": _own_heart_rate,
+}
+
+# Garmin workoutTargetTypeKey -> converter of the target
+OWN_TARGETS = {
+    "pace.zone": _own_pace_zone,
+    "heart.rate.zone": _own_heart_rate_zone,
+    "speed.zone": _own_speed_zone,
+    "cadence": _own_cadence,
+    "no.target": _own_no_target,
+}
+
+
+def _own_range(own_step, low_key, high_key):
+    # type: (dict, str, str) -> tuple
+    """
+    Return both values of the range, which needs to be defined completely.
+    """
+    if low_key not in own_step:
+        raise OwnFormatDataObjectError(low_key, own_step)
+    if high_key not in own_step:
+        raise OwnFormatDataObjectError(high_key, own_step)
+    return own_step[low_key], own_step[high_key]
+
+
+def _garmin_lap_button(own_step, garmin_step):
+    garmin_step["endCondition"] = dict(LAP_BUTTON_CONDITION)
+
+
+def _garmin_distance(own_step, garmin_step):
+    garmin_step["endCondition"] = dict(DISTANCE_CONDITION)
+    garmin_step["endConditionValue"] = float(own_step["distance"])
+    garmin_step["preferredEndConditionUnit"] = dict(KILOMETER_UNIT)
+
+
+def _garmin_heart_rate_zone(own_step, garmin_step):
+    raise OwnFormatDataObjectNotImplementedError("hr_zone",
+                                                 own_step["hr_zone"],
+                                                 own_step)
+
+
+def _garmin_heart_rate_range(own_step, garmin_step):
+    garmin_step["targetType"] = dict(HEART_RATE_ZONE_TARGET)
+    garmin_step["targetValueOne"], garmin_step["targetValueTwo"] = \
+        _own_range(own_step, "hr_low", "hr_high")
+
+
+def _garmin_pace_range(own_step, garmin_step):
+    pace_from, pace_to = _own_range(own_step, "pace_from", "pace_to")
+    garmin_step["targetType"] = dict(PACE_ZONE_TARGET)
+    garmin_step["targetValueOne"] = pace_string_to_mps(pace_from)
+    garmin_step["targetValueTwo"] = pace_string_to_mps(pace_to)
+
+
+# (own key, converter) of the end condition, the first present key wins
+# TODO: Finish endCondition: "calories", "iterations", "heart.rate"
+GARMIN_END_CONDITIONS = (
+    ("lap_button", _garmin_lap_button),
+    ("distance", _garmin_distance),
+)
+
+# (own key, converter) of the target, the first present key wins. Steps
+# without any of them have no target.
+# TODO: Finish targetType: "cadence", "speed.zone"
+GARMIN_TARGETS = (
+    ("hr_zone", _garmin_heart_rate_zone),
+    ("hr_low", _garmin_heart_rate_range),
+    ("hr_high", _garmin_heart_rate_range),
+    ("pace_from", _garmin_pace_range),
+    ("pace_to", _garmin_pace_range),
+)
+
+
+def _parse_garmin_executable_step(garmin_step):
+    # type: (dict) -> dict
+    if "stepType" not in garmin_step:
+        raise GarminConnectObjectError("stepType", garmin_step)
+
+    step_type = garmin_step["stepType"]["stepTypeKey"]
+    own_type = OWN_STEP_TYPES.get(step_type)
+    if own_type is None:
+        raise GarminConnectNotImplementedError("stepTypeKey",
+                                               step_type,
+                                               garmin_step)
+    own_step = {"type": own_type}
+
+    if "endCondition" not in garmin_step:
+        raise GarminConnectObjectError("endCondition", garmin_step)
+
+    duration_type = garmin_step["endCondition"]["conditionTypeKey"]
+    set_end_condition = OWN_END_CONDITIONS.get(duration_type)
+    if set_end_condition is None:
+        raise GarminConnectNotImplementedError("conditionTypeKey",
+                                               duration_type,
+                                               garmin_step)
+    set_end_condition(garmin_step, own_step)
+
+    if "targetType" not in garmin_step:
+        raise GarminConnectObjectError("targetType", garmin_step)
+
+    target = garmin_step["targetType"]
+    # we don't need to have target type. bare step
+    if target:
+        if "workoutTargetTypeKey" not in target:
+            raise GarminConnectObjectError("workoutTargetTypeKey",
+                                           garmin_step)
+
+        target_type = target["workoutTargetTypeKey"]
+        set_target = OWN_TARGETS.get(target_type)
+        if set_target is None:
+            raise GarminConnectNotImplementedError("workoutTargetTypeKey",
+                                                   target_type,
+                                                   garmin_step)
+        set_target(garmin_step, own_step)
+
+    return own_step
+
+
+def _parse_garmin_repeat_group(garmin_step):
+    # type: (dict) -> dict
+    """
+    Return the repetition in the own format, with the substeps still to
+    be filled in.
+    """
+    if "numberOfIterations" not in garmin_step:
+        raise GarminConnectObjectError("numberOfIterations", garmin_step)
+    if "workoutSteps" not in garmin_step:
+        raise GarminConnectObjectError("workoutSteps", garmin_step)
+
+    return {
+        "type": "repetition",
+        "count": garmin_step["numberOfIterations"],
+        "steps": [],
+    }
+
+
+def _parse_own_executable_step(own_step, step_order):
+    # type: (dict, int) -> dict
+    step_type = GARMIN_STEP_TYPES.get(own_step["type"])
+    if step_type is None:
+        raise OwnFormatDataObjectNotImplementedError("type",
+                                                     own_step["type"],
+                                                     own_step)
+    garmin_step = {
+        "stepOrder": step_order,
+        "type": "ExecutableStepDTO",
+        "stepType": dict(step_type),
+    }
+
+    for key, set_end_condition in GARMIN_END_CONDITIONS:
+        if key in own_step:
+            set_end_condition(own_step, garmin_step)
+            break
+
+    for key, set_target in GARMIN_TARGETS:
+        if key in own_step:
+            set_target(own_step, garmin_step)
+            break
+    else:
+        garmin_step["targetType"] = dict(NO_TARGET)
+
+    return garmin_step
+
+
+def _parse_own_repetition(own_step, step_order):
+    # type: (dict, int) -> dict
+    """
+    Return the repeat group in the Garmin format, with the substeps still
+    to be filled in.
+    """
+    if "count" not in own_step:
+        raise OwnFormatDataObjectError("count", own_step)
+    if "steps" not in own_step:
+        raise OwnFormatDataObjectError("steps", own_step)
+
+    return {
+        "stepOrder": step_order,
+        "type": "RepeatGroupDTO",
+        "stepType": dict(REPEAT_STEP_TYPE),
+        # NOTE: childStepId and smartRepeat both needs to be in the object
+        #       otherwise Garmin server throws 500 Internal Error
+        # TODO: Check what 'childStepId' is doing.
+        "childStepId": 1,
+        # TODO: Check what really 'smartRepeat' do
+        "smartRepeat": False,
+        "numberOfIterations": own_step["count"],
+        "workoutSteps": [],
+    }
+
 
 class WorkoutParser():
     """
@@ -94,13 +402,8 @@ class WorkoutParser():
             if sport == "running":
                 if "workoutSteps" not in segment:
                     raise GarminConnectObjectError("workoutSteps", segment)
-                workout_steps = segment["workoutSteps"]
-                own_steps = []
-                for workout_step in workout_steps:
-                    own_step = \
-                        self.parse_garmin_format_running_step(workout_step)
-                    own_steps.append(own_step)
-                own["steps"] = own_steps
+                own["steps"] = \
+                    self.parse_garmin_format_steps(segment["workoutSteps"])
                 return own
             else:
                 raise GarminConnectNotImplementedError("sportType", sport,
@@ -108,157 +411,47 @@ class WorkoutParser():
 
         raise Exception("Shouldn't be reachable")
 
-    def parse_garmin_format_running_step(self, garmin_step):
-        # type: (dict) -> dict
+    def parse_garmin_format_steps(self, garmin_steps):
+        # type: (list) -> list
         """
-        Parses one running step from Garmin Connect API and return it
-        in our own format.
+        Parses the running steps from Garmin Connect API and return them
+        in our own format. Repeat groups are walked with an explicit stack,
+        so any depth of nesting works.
         """
-        own_step = {}
-        if "type" not in garmin_step:
-            raise GarminConnectObjectError("type", garmin_step)
-
-        type = garmin_step["type"]
-
-        if type == "RepeatGroupDTO":
-            own_step["type"] = "repetition"
-
-            if "numberOfIterations" not in garmin_step:
-                raise GarminConnectObjectError("numberOfIterations",
-                                               garmin_step)
-            own_step["count"] = garmin_step["numberOfIterations"]
-            if "workoutSteps" not in garmin_step:
-                raise GarminConnectObjectError("workoutSteps", garmin_step)
-
-            garmin_substeps = garmin_step["workoutSteps"]
-            own_substeps = []
-            for garmin_substep in garmin_substeps:
-                own_substep = self. \
-                    parse_garmin_format_running_step(garmin_substep)
-                own_substeps.append(own_substep)
-            own_step["steps"] = own_substeps
-        elif type == "ExecutableStepDTO":
-            if "stepType" not in garmin_step:
-                raise GarminConnectObjectError("stepType", garmin_step)
-
-            step_type = garmin_step["stepType"]["stepTypeKey"]
-            if step_type == "warmup":
-                own_step["type"] = "warmup"
-            elif step_type == "cooldown":
-                own_step["type"] = "cooldown"
-            elif step_type == "interval":
-                own_step["type"] = "run"
-            elif step_type == "recovery":
-                own_step["type"] = "recovery"
-            elif step_type == "rest":
-                own_step["type"] = "rest"
-            elif step_type == "other":
-                own_step["type"] = "other"
-            else:
-                raise GarminConnectNotImplementedError("stepTypeKey",
-                                                       step_type,
-                                                       garmin_step)
-
-            if "endCondition" not in garmin_step:
-                raise GarminConnectObjectError("endCondition", garmin_step)
-
-            duration_type = garmin_step["endCondition"]["conditionTypeKey"]
-            if duration_type == "distance":
-                distance = garmin_step["endConditionValue"]
-                own_step["distance"] = distance
-            elif duration_type == "lap.button":
-                own_step["lap_button"] = True
-            elif duration_type == "time":
-                seconds = garmin_step["endConditionValue"]
-                own_step["time"] = seconds_to_time_string(seconds)
-            elif duration_type == "calories":
-                own_step["calories"] = garmin_step["endConditionValue"]
-            elif duration_type == "heart.rate":
-                hr = garmin_step["endConditionValue"]
-                hr_compare = garmin_step["endConditionCompare"]
-                if hr_compare == "lt":
-                    own_step["hr_below"] = hr
-                elif hr_compare == "gt":
-                    own_step["hr_above"] = hr
+        own_steps = []
+        stack = [(iter(garmin_steps), own_steps)]
+        while stack:
+            garmin_steps_iter, own_substeps = stack[-1]
+            for garmin_step in garmin_steps_iter:
+                if "type" not in garmin_step:
+                    raise GarminConnectObjectError("type", garmin_step)
+
+                type = garmin_step["type"]
+                if type == "ExecutableStepDTO":
+                    own_substeps.append(
+                        _parse_garmin_executable_step(garmin_step))
+                elif type == "RepeatGroupDTO":
+                    own_step = _parse_garmin_repeat_group(garmin_step)
+                    own_substeps.append(own_step)
+                    # Continue with the substeps, then the rest of this level
+                    stack.append((iter(garmin_step["workoutSteps"]),
+                                  own_step["steps"]))
+                    break
                 else:
-                    raise GarminConnectNotImplementedError("endConditionCompare",
-                                                           hr_compare,
+                    raise GarminConnectNotImplementedError("type",
+                                                           type,
                                                            garmin_step)
             else:
-                raise GarminConnectNotImplementedError("conditionTypeKey",
-                                                       duration_type,
-                                                       garmin_step)
-
-            if "targetType" not in garmin_step:
-                raise GarminConnectObjectError("targetType", garmin_step)
-
-            if not garmin_step["targetType"]:
-                # we don't nede to have target type. bare step
-                pass
-            else:
-                if "workoutTargetTypeKey" not in garmin_step["targetType"]:
-                    raise GarminConnectObjectError("workoutTargetTypeKey", garmin_step)
-
-                target_type = garmin_step["targetType"]["workoutTargetTypeKey"]
-                if target_type == "pace.zone":
-                    if "targetValueOne" not in garmin_step:
-                        raise GarminConnectObjectError("targetValueOne",
-                                                    garmin_step)
-                    if "targetValueTwo" not in garmin_step:
-                        raise GarminConnectObjectError("targetValueTwo",
-                                                    garmin_step)
-
-                    pace_from = mps_to_pace_string(garmin_step["targetValueOne"])
-                    pace_to = mps_to_pace_string(garmin_step["targetValueTwo"])
-
-                    own_step["pace_from"] = pace_from
-                    own_step["pace_to"] = pace_to
-                elif target_type == "heart.rate.zone":
-                    if ("zoneNumber" in garmin_step and
-                            garmin_step["zoneNumber"] is not None):
-                        # We have a precise zone number
-                        hr_zone = garmin_step["zoneNumber"]
-                        own_step["hr_zone"] = hr_zone
-                    else:
-                        # We have a zone range with the 2 values
-                        hr_low = garmin_step["targetValueOne"]
-                        hr_high = garmin_step["targetValueTwo"]
-                        own_step["hr_low"] = hr_low
-                        own_step["hr_high"] = hr_high
-                elif target_type == "speed.zone":
-                    if "targetValueOne" not in garmin_step:
-                        raise GarminConnectObjectError("targetValueOne",
-                                                    garmin_step)
-                    if "targetValueTwo" not in garmin_step:
-                        raise GarminConnectObjectError("targetValueTwo",
-                                                    garmin_step)
-                    speed_from = mps_to_kmh_string(garmin_step["targetValueOne"])
-                    speed_to = mps_to_kmh_string(garmin_step["targetValueTwo"])
-
-                    own_step["pace_from"] = speed_from
-                    own_step["pace_to"] = speed_to
-                elif target_type == "cadence":
-                    if "targetValueOne" not in garmin_step:
-                        raise GarminConnectObjectError("targetValueOne",
-                                                    garmin_step)
-                    if "targetValueTwo" not in garmin_step:
-                        raise GarminConnectObjectError("targetValueTwo",
-                                                    garmin_step)
-
-                    own_step["cadence_from"] = garmin_step["targetValueOne"]
-                    own_step["cadence_to"] = garmin_step["targetValueTwo"]
-                elif target_type == "no.target":
-                    pass
-                else:
-                    raise GarminConnectNotImplementedError("workoutTargetTypeKey",
-                                                        target_type,
-                                                        garmin_step)
-        else:
-            raise GarminConnectNotImplementedError("type",
-                                                   type,
-                                                   garmin_step)
+                stack.pop()
+        return own_steps
 
-        return own_step
+    def parse_garmin_format_running_step(self, garmin_step):
+        # type: (dict) -> dict
+        """
+        Parses one running step from Garmin Connect API and return it
+        in our own format.
+        """
+        return self.parse_garmin_format_steps([garmin_step])[0]
 
     def parse_own_format(self, own):
         # type: (dict) -> dict
@@ -268,175 +461,63 @@ class WorkoutParser():
         """
         log.info("Parsing own format data object..")
         garmin = {}
-        self.step_index = 1
 
-        garmin["sportType"] = {
-            "sportTypeId": 1,
-            "sportTypeKey": "running"
-        }
+        garmin["sportType"] = dict(RUNNING_SPORT)
 
         if "name" not in own:
             raise OwnFormatDataObjectError("name", own)
 
         garmin["workoutName"] = own["name"]
 
-        segments = []
-        segment_1 = {}
-        segment_1["segmentOrder"] = 1
-        segment_1["sportType"] = {
-            "sportTypeId": 1,
-            "sportTypeKey": "running"
-        }
         if "steps" not in own:
             raise OwnFormatDataObjectError("steps", own)
 
-        garmin_steps = []
-        for own_step in own["steps"]:
-            garmin_step = self.parse_own_format_running_step(own_step)
-            garmin_steps.append(garmin_step)
-
-        segment_1["workoutSteps"] = garmin_steps
-        segments.append(segment_1)
-        garmin["workoutSegments"] = segments
+        segment_1 = {
+            "segmentOrder": 1,
+            "sportType": dict(RUNNING_SPORT),
+            "workoutSteps": self.parse_own_format_steps(own["steps"]),
+        }
+        garmin["workoutSegments"] = [segment_1]
         return garmin
 
+    def parse_own_format_steps(self, own_steps):
+        # type: (list) -> list
+        """
+        Parses the running steps from our own format, and return them in
+        Garmin Connect API format. Steps are numbered in the order they
+        appear, the same way as the Garmin Connect does.
+        """
+        step_order = 0
+        garmin_steps = []
+        stack = [(iter(own_steps), garmin_steps)]
+        while stack:
+            own_steps_iter, garmin_substeps = stack[-1]
+            for own_step in own_steps_iter:
+                step_order += 1
+                if "type" not in own_step:
+                    raise OwnFormatDataObjectError("type", own_step)
+
+                if own_step["type"] == "repetition":
+                    garmin_step = _parse_own_repetition(own_step, step_order)
+                    garmin_substeps.append(garmin_step)
+                    # Continue with the substeps, then the rest of this level
+                    stack.append((iter(own_step["steps"]),
+                                  garmin_step["workoutSteps"]))
+                    break
+                garmin_substeps.append(
+                    _parse_own_executable_step(own_step, step_order))
+            else:
+                stack.pop()
+        return garmin_steps
+
     def parse_own_format_running_step(self, own_step):
         # type: (dict) -> dict
         """
         Parses one running step from our own format, and return it
         in Garmin Connect API format dictionary.
         """
-        garmin_step = {}
-        garmin_step["stepOrder"] = self.step_index
-        self.step_index += 1
-
-        if "type" not in own_step:
-            raise OwnFormatDataObjectError("type", own_step)
-
-        type = own_step["type"]
-        if type == "repetition":
-            garmin_step["type"] = "RepeatGroupDTO"
-            garmin_step["stepType"] = {
-                "stepTypeId": 6,
-                "stepTypeKey": "repeat"
-            }
-            # NOTE: childStepId and smartRepeat both needs to be in the object
-            #       otherwise Garmin server throws 500 Internal Error
-            # TODO: Check what 'childStepId' is doing.
-            garmin_step["childStepId"] = 1
-            # TODO: Check what really 'smartRepeat' do
-            garmin_step["smartRepeat"] = False
-            if "count" not in own_step:
-                raise OwnFormatDataObjectError("count", own_step)
-
-            garmin_step["numberOfIterations"] = own_step["count"]
-
-            if "steps" not in own_step:
-                raise OwnFormatDataObjectError("steps", own_step)
-
-            garmin_substeps = []
-            for own_substep in own_step["steps"]:
-                garmin_substep = \
-                    self.parse_own_format_running_step(own_substep)
-                garmin_substeps.append(garmin_substep)
-
-            garmin_step["workoutSteps"] = garmin_substeps
-        elif type == "run" or "recovery" or "warmup" or "cooldown":
-            garmin_step["type"] = "ExecutableStepDTO"
-
-            # Set the type of the Garmin run
-            if type == "warmup":
-                garmin_step["stepType"] = {
-                    "stepTypeId": 1,
-                    "stepTypeKey": "warmup"
-                }
-            elif type == "cooldown":
-                garmin_step["stepType"] = {
-                    "stepTypeId": 2,
-                    "stepTypeKey": "cooldown"
-                }
-            elif type == "run":
-                garmin_step["stepType"] = {
-                    "stepTypeId": 3,
-                    "stepTypeKey": "interval"
-                }
-            elif type == "recovery":
-                garmin_step["stepType"] = {
-                    "stepTypeId": 4,
-                    "stepTypeKey": "recovery"
-                }
-            else:
-                raise OwnFormatDataObjectNotImplementedError("type",
-                                                             type,
-                                                             own_step)
-
-            # TODO: Finsih endCondition: "calories", "iterations", "heart.rate"
-            # Set the distance/duration
-            if "lap_button" in own_step:
-                garmin_step["endCondition"] = {
-                    "conditionTypeId": 1,
-                    "conditionTypeKey": "lap.button"
-                }
-            elif "distance" in own_step:
-                garmin_step["endCondition"] = {
-                    "conditionTypeId": 3,
-                    "conditionTypeKey": "distance"
-                }
-                distance = own_step["distance"]
-                garmin_step["endConditionValue"] = float(distance)
-                garmin_step["preferredEndConditionUnit"] = {
-                    "unitId": 2,
-                    "unitKey": "kilometer",
-                    "factor": 100000.0
-                }
-
-            # Set the intensity
-            # TODO: Finsish targetType: "no.target", "cadence", "speed.zone"
-            if "hr_low" or "hr_high" or "hr_zone" in own_step:
-                # Set the HR intensity
-                # check if we are using a HR zone or a custom range
-                if "hr_zone" in own_step:
-                    raise OwnFormatDataObjectNotImplementedError("hr_zone", own_step)
-                else:
-                    # Custom HR range. Check that we have both of them
-                    if "hr_low" in own_step and "hr_high" not in own_step:
-                        raise OwnFormatDataObjectError("hr_high", own_step)
-                    if "hr_low" not in own_step and "hr_high" in own_step:
-                        raise OwnFormatDataObjectError("hr_low", own_step)
-
-                    garmin_step["targetType"] = {
-                        "workoutTargetTypeId": 4,
-                        "workoutTargetTypeKey": "heart.rate.zone"
-                    }
-                    garmin_step["targetValueOne"] = own_step["hr_low"]
-                    garmin_step["targetValueTwo"] = own_step["hr_high"]
-
-            elif "pace_from" or "pace_to" in own_step:
-                # Set the pace
-                if "pace_from" in own_step and "pace_to" not in own_step:
-                    raise OwnFormatDataObjectError("pace_to", own_step)
-                if "pace_from" not in own_step and "pace_to" in own_step:
-                    raise OwnFormatDataObjectError("pace_from", own_step)
-
-                if "pace_from" in own_step and "pace_to" in own_step:
-                    pace_from = own_step["pace_from"]
-                    pace_to = own_step["pace_to"]
-                    mps_from = pace_string_to_mps(pace_from)
-                    mps_to = pace_string_to_mps(pace_to)
-
-                    garmin_step["targetType"] = {
-                        "workoutTargetTypeId": 6,
-                        "workoutTargetTypeKey": "pace.zone",
-                    }
-                    garmin_step["targetValueOne"] = mps_from
-                    garmin_step["targetValueTwo"] = mps_to
-
-        else:
-            raise OwnFormatDataObjectNotImplementedError("type",
-                                                         type,
-                                                         own_step)
+        return self.parse_own_format_steps([own_step])[0]
 
-        return garmin_step
 
 class WorkoutsInfoParser():
     """
@@ -457,7 +538,8 @@ class WorkoutsInfoParser():
 
         self._own_info["id"] = self._workout_info["workoutId"]
         self._own_info["name"] = self._workout_info["workoutName"]
-
+        # Modification stamp of the workout, used as a cache key
+        self._own_info["updated"] = self._workout_info.get("updateDate")
 
         sport_type = self._workout_info["sportType"]["sportTypeKey"]
         if sport_type == "running":
@@ -471,7 +553,7 @@ class WorkoutsInfoParser():
                                                    sport_type,
                                                    self._workout_info)
 
-        self.url = libs.garmin_api_client.get_workout_url(self.get_id())
+        self.url = endpoints.workout_url(self.get_id())
 
     def get_type(self):
         return self._own_info["type"]
@@ -491,6 +573,9 @@ class WorkoutsInfoParser():
     def get_name(self):
         return self._own_info["name"]
 
+    def get_update_date(self):
+        return self._own_info["updated"]
+
     def get_url(self):
         return self.url
 
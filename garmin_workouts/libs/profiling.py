@@ -0,0 +1,282 @@
+import bisect
+import functools
+import inspect
+import json
+import math
+import re
+import sys
+import threading
+import time
+
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+# Upper bounds of the latency histogram buckets in milliseconds. The last
+# bucket takes everything slower.
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# Numeric path segments, e.g. workout IDs, are one endpoint
+ID_SEGMENT = re.compile(r'/\d+(?=/|$)')
+
+_active_profiler = None
+
+
+def active_profiler():
+    # type: () -> Profiler
+    """
+    Return the profiler of the running command, or None when `--profile`
+    is off. The commands install their hooks only when there is one, so
+    nothing is slowed down otherwise.
+    """
+    return _active_profiler
+
+
+def endpoint_name(method, url):
+    # type: (str, str) -> str
+    path = ID_SEGMENT.sub('/{id}', urlsplit(url).path)
+    return f'{method} {path}'
+
+
+class LatencyHistogram():
+    """
+    Latencies of the requests sent to one endpoint, in seconds.
+    """
+    def __init__(self):
+        self.samples = []
+
+    def add(self, seconds):
+        # type: (float) -> None
+        self.samples.append(seconds)
+
+    def percentile(self, percent):
+        # type: (float) -> float
+        """
+        Nearest-rank percentile of the samples.
+        """
+        ordered = sorted(self.samples)
+        rank = max(0, min(len(ordered) - 1,
+                          math.ceil(percent / 100 * len(ordered)) - 1))
+        return ordered[rank]
+
+    def buckets(self):
+        # type: () -> list
+        """
+        Count of the samples in each of `LATENCY_BUCKETS_MS`, plus the
+        count of the slower ones.
+        """
+        counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        for seconds in self.samples:
+            counts[bisect.bisect_left(LATENCY_BUCKETS_MS, seconds * 1000)] += 1
+        return counts
+
+    def to_dict(self):
+        # type: () -> dict
+        bucket_names = [f'<={bound}' for bound in LATENCY_BUCKETS_MS] + \
+            [f'>{LATENCY_BUCKETS_MS[-1]}']
+        return {
+            "count": len(self.samples),
+            "mean_ms": sum(self.samples) / len(self.samples) * 1000,
+            "p50_ms": self.percentile(50) * 1000,
+            "p90_ms": self.percentile(90) * 1000,
+            "p99_ms": self.percentile(99) * 1000,
+            "max_ms": max(self.samples) * 1000,
+            "histogram_ms": dict(zip(bucket_names, self.buckets())),
+        }
+
+
+class Profiler():
+    """
+    Collects the time spent in each phase of the command and the latency
+    of the requests per endpoint for `--profile`. Phases run in the worker
+    threads too, so their totals can add up to more than the wall time.
+
+    With `stats_path`, the command also runs under cProfile in all threads
+    and the merged stats are saved there for `pstats` or `snakeviz`.
+    """
+    def __init__(self, stats_path=None):
+        # type: (str) -> None
+        self.stats_path = stats_path
+        self.wall_time = None
+        # Phase name -> [calls, seconds]
+        self._phases = {}
+        self._latencies = {}
+        self._lock = threading.Lock()
+        self._started = None
+        self._profiles = []
+
+    def start(self):
+        global _active_profiler
+        _active_profiler = self
+        if self.stats_path:
+            # Each thread needs its own profiler, cProfile sees only the
+            # thread which enabled it
+            threading.setprofile(self._profile_thread)
+            self._profile_thread()
+        self._started = time.perf_counter()
+
+    def stop(self):
+        global _active_profiler
+        self.wall_time = time.perf_counter() - self._started
+        _active_profiler = None
+        if self.stats_path:
+            threading.setprofile(None)
+            self._save_stats()
+
+    def _profile_thread(self, *args):
+        # Only needed with `stats_path`, like pstats below
+        import cProfile
+        profile = cProfile.Profile()
+        try:
+            # Replaces the `threading.setprofile` hook of this thread
+            profile.enable()
+        except ValueError:
+            # Python 3.12+ allows one profiler, which sees all threads
+            sys.setprofile(None)
+            return
+        with self._lock:
+            self._profiles.append(profile)
+
+    def _save_stats(self):
+        import pstats
+        with self._lock:
+            profiles = list(self._profiles)
+        for profile in profiles:
+            profile.create_stats()
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+        stats.dump_stats(self.stats_path)
+
+    def add_phase(self, name, seconds):
+        # type: (str, float) -> None
+        with self._lock:
+            phase = self._phases.setdefault(name, [0, 0.0])
+            phase[0] += 1
+            phase[1] += seconds
+
+    @contextmanager
+    def phase(self, name):
+        # type: (str) -> None
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_phase(name, time.perf_counter() - start)
+
+    def add_request(self, endpoint, seconds):
+        # type: (str, float) -> None
+        with self._lock:
+            histogram = self._latencies.get(endpoint)
+            if histogram is None:
+                histogram = self._latencies[endpoint] = LatencyHistogram()
+            histogram.add(seconds)
+
+    def instrument(self, obj, name, phase):
+        # type: (object, str, str) -> None
+        """
+        Replace the method `name` of the object with the one adding its
+        run time to the `phase`. Works for coroutine functions too.
+        """
+        method = getattr(obj, name)
+        if inspect.iscoroutinefunction(method):
+            @functools.wraps(method)
+            async def timed(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await method(*args, **kwargs)
+                finally:
+                    self.add_phase(phase, time.perf_counter() - start)
+        else:
+            @functools.wraps(method)
+            def timed(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return method(*args, **kwargs)
+                finally:
+                    self.add_phase(phase, time.perf_counter() - start)
+        setattr(obj, name, timed)
+
+    def instrument_requests(self, obj, name):
+        # type: (object, str) -> None
+        """
+        Replace the method `name(method, url, ...)` of the object, which
+        sends one request and reads the response, with the one recording
+        its latency by the endpoint.
+        """
+        send = getattr(obj, name)
+        if inspect.iscoroutinefunction(send):
+            @functools.wraps(send)
+            async def timed(method, url, *args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await send(method, url, *args, **kwargs)
+                finally:
+                    self.add_request(endpoint_name(method, url),
+                                     time.perf_counter() - start)
+        else:
+            @functools.wraps(send)
+            def timed(method, url, *args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return send(method, url, *args, **kwargs)
+                finally:
+                    self.add_request(endpoint_name(method, url),
+                                     time.perf_counter() - start)
+        setattr(obj, name, timed)
+
+    def instrument_api_client(self, api_client):
+        """
+        Record the requests of the `GarminApiClient`, the decoding of their
+        JSON and the download of the workouts list pages.
+        """
+        self.instrument_requests(api_client.session, 'request')
+        self.instrument(api_client, '_decode_json', 'json decode')
+        self.instrument(api_client, 'get_workouts_info', 'workouts list')
+
+    def instrument_async_api_client(self, client):
+        """
+        The same as `instrument_api_client` for the `AsyncGarminApiClient`.
+        """
+        self.instrument_requests(client, '_fetch')
+        self.instrument(client, '_decode_json', 'json decode')
+        self.instrument(client, 'get_workouts_info', 'workouts list')
+
+    def metrics(self):
+        # type: () -> dict
+        with self._lock:
+            return {
+                "wall_s": self.wall_time,
+                "phases": {name: {"calls": calls, "total_s": seconds}
+                           for name, (calls, seconds)
+                           in sorted(self._phases.items())},
+                "requests": {endpoint: histogram.to_dict()
+                             for endpoint, histogram
+                             in sorted(self._latencies.items())},
+            }
+
+    def write_json(self, path):
+        # type: (str) -> None
+        with open(path, 'w') as outfile:
+            json.dump(self.metrics(), outfile, indent=2)
+
+    def summary(self):
+        # type: () -> str
+        metrics = self.metrics()
+        lines = [f"Profile: {metrics['wall_s']:.3f} s wall time", '',
+                 f"{'phase':<24} {'calls':>8} {'total s':>9} {'mean ms':>9}"]
+        for name, phase in metrics["phases"].items():
+            mean_ms = phase["total_s"] / phase["calls"] * 1000
+            lines.append(f"{name:<24} {phase['calls']:>8} "
+                         f"{phase['total_s']:>9.3f} {mean_ms:>9.2f}")
+
+        if metrics["requests"]:
+            width = max(len(endpoint) for endpoint in metrics["requests"])
+            lines += ['', f"{'endpoint':<{width}} {'count':>7} {'mean ms':>8} "
+                      f"{'p50':>8} {'p90':>8} {'p99':>8} {'max':>8}"]
+            for endpoint, latency in metrics["requests"].items():
+                lines.append(
+                    f"{endpoint:<{width}} {latency['count']:>7} "
+                    f"{latency['mean_ms']:>8.1f} {latency['p50_ms']:>8.1f} "
+                    f"{latency['p90_ms']:>8.1f} {latency['p99_ms']:>8.1f} "
+                    f"{latency['max_ms']:>8.1f}")
+        return '\n'.join(lines)
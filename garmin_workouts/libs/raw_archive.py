@@ -0,0 +1,166 @@
+import gzip
+import io
+import json
+import logging
+import re
+from typing import Iterator, List, Tuple
+
+log = logging.getLogger(__name__)
+
+GZIP_MAGIC = b'\x1f\x8b'
+# Characters read at once from the JSON array
+CHUNK_SIZE = 1024 * 1024
+
+# JSON strings and the brackets outside of them. A string cut by the end of
+# the chunk has no `end` group.
+JSON_TOKEN = re.compile(r'"(?:[^"\\]|\\.)*(?:(?P<end>")|\\?\Z)|[][{}]')
+
+
+class RawArchiveWriter():
+    """
+    Archive of the raw Garmin Connect workouts in the NDJSON format, one
+    compact JSON object per line.
+
+    Everything goes through one buffered file handle, compressed with gzip
+    when the path ends with `.gz`.
+    """
+    def __init__(self, path, compress=None):
+        # type: (str, bool) -> None
+        self.path = path
+        self.compress = path.endswith('.gz') if compress is None else compress
+        self.count = 0
+        self._file = None
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def open(self):
+        if self.compress:
+            self._file = gzip.open(self.path, 'wt', encoding='utf-8')
+        else:
+            self._file = open(self.path, 'w', encoding='utf-8',
+                              buffering=io.DEFAULT_BUFFER_SIZE * 16)
+
+    def write(self, workout):
+        # type: (dict) -> None
+        self._file.write(json.dumps(workout, separators=(',', ':')))
+        self._file.write('\n')
+        self.count += 1
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+            log.info(f'Archived {self.count} raw workouts to "{self.path}"')
+
+
+def open_raw_workouts(path):
+    """
+    Open the file with raw workouts for reading as text, decompressing it
+    when it starts with the gzip magic number.
+    """
+    with open(path, 'rb') as infile:
+        magic = infile.read(len(GZIP_MAGIC))
+    if magic == GZIP_MAGIC:
+        return gzip.open(path, 'rt', encoding='utf-8')
+    return open(path, 'r', encoding='utf-8')
+
+
+def _scan_array(buffer: str, position: int, start: int,
+                depth: int) -> Tuple[List[str], int, int, int, bool]:
+    """
+    Scan the `buffer` from the `position` for the tokens of the JSON array.
+    Returns the elements completed in it, the state the scan continues
+    with and whether the array ended.
+    """
+    elements = []
+    for match in JSON_TOKEN.finditer(buffer, position):
+        token = match.group()
+        if token[0] == '"':
+            if match.group('end') is None:
+                # The string continues in the next chunk
+                return elements, position, start, depth, False
+        elif token in '{[':
+            if depth == 0 and start is None:
+                start = match.start()
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 0:
+                elements.append(buffer[start:match.end()])
+                start = None
+            elif depth < 0:
+                # The end of the array
+                return elements, position, start, depth, True
+        position = match.end()
+    return elements, len(buffer), start, depth, False
+
+
+def _iter_array_elements(infile: object, chunk_size: int) -> Iterator[str]:
+    """
+    Split the JSON array of objects, whose `[` was already read, into the
+    texts of its elements. The file is read in chunks and scanned only for
+    the strings and the brackets, the elements are not decoded here.
+    """
+    buffer = ''
+    # Where the scan continues, where the current element starts (None
+    # between the elements) and the nesting inside the array
+    position = 0
+    start = None
+    depth = 0
+    while True:
+        chunk = infile.read(chunk_size)
+        if not chunk:
+            raise ValueError('Unexpected end of the JSON array')
+        # Keep only the unfinished element
+        keep_from = position if start is None else start
+        buffer = buffer[keep_from:] + chunk
+        position -= keep_from
+        if start is not None:
+            start -= keep_from
+
+        elements, position, start, depth, ended = \
+            _scan_array(buffer, position, start, depth)
+        yield from elements
+        if ended:
+            return
+
+
+def iter_raw_workout_texts(path: str,
+                           chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+    """
+    Iterate over the JSON texts of the workouts stored in the raw archive,
+    without decoding them.
+
+    Accepts the NDJSON archive (plain or gzipped) which is read line by
+    line, as well as a file with a JSON array of workouts, which is split
+    incrementally. Only a chunk of the file is in the memory at once.
+    """
+    with open_raw_workouts(path) as infile:
+        first_char = ''
+        while not first_char.strip():
+            first_char = infile.read(1)
+            if not first_char:
+                return
+
+        if first_char == '[':
+            yield from _iter_array_elements(infile, chunk_size)
+            return
+
+        line = first_char + infile.readline()
+        while line:
+            if line.strip():
+                yield line
+            line = infile.readline()
+
+
+def iter_raw_workouts(path: str) -> Iterator[dict]:
+    """
+    Iterate over the Garmin Connect workouts stored in the raw archive.
+    """
+    for text in iter_raw_workout_texts(path):
+        yield json.loads(text)
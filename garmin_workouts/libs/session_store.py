@@ -0,0 +1,222 @@
+import json
+import logging
+import os
+import threading
+import time
+
+from contextlib import contextmanager
+from http.cookiejar import LWPCookieJar
+from typing import Callable
+
+from libs.app_dirs import package_dirs, ensure_dir
+
+try:
+    import fcntl
+except ImportError:
+    # Windows, only the threads of one process are locked out there
+    fcntl = None
+
+cookie_jar_path = os.path.join(package_dirs.user_config_dir, 'cookie.txt')
+# When the stored cookies were obtained and checked against the Garmin
+# Connect
+session_path = os.path.join(package_dirs.user_config_dir, 'session.json')
+
+log = logging.getLogger(__name__)
+
+# Cookie jar path -> (stat of the file, cookies), shared by the clients of
+# the process, so the file is parsed again only when another process has
+# replaced it
+_cookies_cache = {}
+_cookies_cache_lock = threading.Lock()
+
+
+def _stat_key(path):
+    # type: (str) -> tuple
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+def _write_atomically(path: str, write: Callable) -> None:
+    """
+    Write the file under a temporary name with `write(tmp_path)` and
+    rename it, so the readers see either the old or the new file.
+    """
+    ensure_dir(os.path.dirname(os.path.abspath(path)))
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class SessionStore():
+    """
+    Cookies of the Garmin Connect session shared by the CLI processes
+    running at the same time.
+
+    Files are always replaced by a rename, so they can be read without
+    locking. Whoever is going to log in takes the exclusive lock first and
+    checks, whether another process has logged in meanwhile. Processes
+    started together then wait for one login and use its session.
+
+    The cookies are written before the session info, so the info never
+    describes older cookies than those in the file.
+    """
+    def __init__(self, cookie_path=cookie_jar_path, info_path=session_path):
+        # type: (str, str) -> None
+        self.cookie_path = cookie_path
+        self.info_path = info_path
+        self.lock_path = f'{cookie_path}.lock'
+        # Login time of the loaded session, to tell the newer ones apart
+        self.authenticated_at = None
+        self._thread_lock = threading.RLock()
+
+    @contextmanager
+    def lock(self):
+        """
+        Hold the exclusive lock of the session over the login.
+        """
+        with self._thread_lock:
+            if not fcntl:
+                yield
+                return
+            ensure_dir(os.path.dirname(os.path.abspath(self.lock_path)))
+            with open(self.lock_path, 'a') as lock_file:
+                start = time.monotonic()
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    log.info('Waiting for another process logging in')
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                    log.debug('Session lock acquired after '
+                              f'{time.monotonic() - start:.1f}s')
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_info(self):
+        # type: () -> dict
+        try:
+            with open(self.info_path, 'r') as infile:
+                info = json.load(infile)
+        except (OSError, ValueError):
+            return {}
+        return info if isinstance(info, dict) else {}
+
+    def load(self, cookie_jar):
+        # type: (LWPCookieJar) -> bool
+        """
+        Replace the cookies in the jar with the stored ones. Returns False,
+        when there are none.
+        """
+        # The info first, the cookies can only be newer than it says
+        info = self._read_info()
+        key = _stat_key(self.cookie_path)
+        if key is None:
+            return False
+
+        with _cookies_cache_lock:
+            cached = _cookies_cache.get(self.cookie_path)
+        if cached and cached[0] == key:
+            cookies = cached[1]
+        else:
+            stored = LWPCookieJar(self.cookie_path)
+            try:
+                stored.load(ignore_discard=True, ignore_expires=True)
+            except OSError as err:
+                log.debug(f'Unable to load "{self.cookie_path}": {err}')
+                return False
+            cookies = list(stored)
+            with _cookies_cache_lock:
+                _cookies_cache[self.cookie_path] = (key, cookies)
+
+        cookie_jar.clear()
+        for cookie in cookies:
+            cookie_jar.set_cookie(cookie)
+        self.authenticated_at = info.get("authenticated_at")
+        return True
+
+    def load_newer(self, cookie_jar):
+        # type: (LWPCookieJar) -> bool
+        """
+        Load the stored session, when another process has logged in since
+        this one was loaded or saved. Call it under the `lock`.
+        """
+        authenticated_at = self._read_info().get("authenticated_at")
+        if authenticated_at is None or \
+                authenticated_at == self.authenticated_at:
+            return False
+        return self.load(cookie_jar)
+
+    def is_fresh(self, ttl):
+        # type: (float) -> bool
+        """
+        True, when the stored session was checked less than `ttl` seconds
+        ago.
+        """
+        if not ttl:
+            return False
+        validated_at = self._read_info().get("validated_at")
+        if not isinstance(validated_at, (int, float)):
+            return False
+        return 0 <= time.time() - validated_at < ttl
+
+    def save(self, cookie_jar):
+        # type: (LWPCookieJar) -> None
+        """
+        Store the cookies of a new login. Call it under the `lock`.
+        """
+        def write_cookies(tmp_path):
+            cookie_jar.save(tmp_path, ignore_discard=True, ignore_expires=True)
+
+        _write_atomically(self.cookie_path, write_cookies)
+        with _cookies_cache_lock:
+            _cookies_cache[self.cookie_path] = \
+                (_stat_key(self.cookie_path), list(cookie_jar))
+        now = time.time()
+        self.authenticated_at = now
+        self._write_info({"authenticated_at": now, "validated_at": now})
+
+    def mark_valid(self):
+        """
+        Record that the stored session was just checked and works. Call it
+        under the `lock`.
+        """
+        info = self._read_info()
+        info["validated_at"] = time.time()
+        self._write_info(info)
+
+    def invalidate(self):
+        """
+        Don't trust the stored session without checking it. Call it under
+        the `lock`.
+        """
+        info = self._read_info()
+        if info.pop("validated_at", None) is not None:
+            self._write_info(info)
+
+    def clear(self):
+        """
+        Remove the stored session.
+        """
+        for path in (self.cookie_path, self.info_path):
+            if os.path.exists(path):
+                os.remove(path)
+        with _cookies_cache_lock:
+            _cookies_cache.pop(self.cookie_path, None)
+        self.authenticated_at = None
+
+    def _write_info(self, info):
+        # type: (dict) -> None
+        def write_info(tmp_path):
+            with open(tmp_path, 'w') as outfile:
+                json.dump(info, outfile)
+
+        _write_atomically(self.info_path, write_info)
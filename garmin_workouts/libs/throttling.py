@@ -0,0 +1,272 @@
+import asyncio
+import collections
+import email.utils
+import http
+import logging
+import random
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+# Responses worth to try again. 429 is handled separately as throttling
+RETRY_STATUSES = (
+    http.HTTPStatus.INTERNAL_SERVER_ERROR,
+    http.HTTPStatus.BAD_GATEWAY,
+    http.HTTPStatus.SERVICE_UNAVAILABLE,
+    http.HTTPStatus.GATEWAY_TIMEOUT,
+)
+
+
+class TokenBucket():
+    """
+    Token bucket rate limiter. Allows `rate` requests per second on
+    average, with bursts of up to `burst` requests.
+    """
+    def __init__(self, rate, burst=None):
+        # type: (float, int) -> None
+        self.rate = rate
+        self.burst = burst if burst else max(int(rate), 1)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        # type: (None) -> None
+        """
+        Take one token, waiting until there is one available.
+        """
+        time.sleep(self.reserve())
+
+    def reserve(self):
+        # type: (None) -> float
+        """
+        Take one token and return how many seconds to wait until it's
+        available. Lets the asyncio code wait without blocking the loop.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens +
+                               (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+
+class AdaptiveConcurrency():
+    """
+    Limits the number of requests in flight with the AIMD (additive
+    increase, multiplicative decrease) algorithm. The limit is halved when
+    the server throttles us and grows by one after each window of healthy
+    responses, up to `maximum`.
+
+    Use as a context manager around each request.
+    """
+    def __init__(self, maximum, minimum=1):
+        # type: (int, int) -> None
+        self.maximum = maximum
+        self.minimum = minimum
+        self.limit = maximum
+        self._in_flight = 0
+        self._successes = 0
+        self._condition = threading.Condition()
+
+    def __enter__(self):
+        with self._condition:
+            while self._in_flight >= self.limit:
+                self._condition.wait()
+            self._in_flight += 1
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        with self._condition:
+            self._in_flight -= 1
+            self._wake()
+
+    def _wake(self):
+        """
+        Let the waiting requests in, when the limit allows it. Called with
+        the condition held.
+        """
+        self._condition.notify(max(self.limit - self._in_flight, 0))
+
+    def set_maximum(self, maximum):
+        # type: (int) -> None
+        with self._condition:
+            self.maximum = maximum
+            self.limit = min(max(self.limit, self.minimum), maximum)
+            self._wake()
+
+    def on_throttle(self):
+        with self._condition:
+            self.limit = max(self.minimum, self.limit // 2)
+            self._successes = 0
+            log.debug(f'Throttled, concurrency lowered to {self.limit}')
+
+    def on_success(self):
+        with self._condition:
+            if self.limit >= self.maximum:
+                return
+            self._successes += 1
+            if self._successes >= self.limit:
+                self._successes = 0
+                self.limit += 1
+                self._wake()
+
+
+class AsyncAdaptiveConcurrency(AdaptiveConcurrency):
+    """
+    `AdaptiveConcurrency` for the asyncio tasks of one event loop. Use as
+    an async context manager around each request.
+    """
+    def __init__(self, maximum, minimum=1):
+        # type: (int, int) -> None
+        super().__init__(maximum, minimum)
+        self._waiters = collections.deque()
+
+    async def __aenter__(self):
+        while self._in_flight >= self.limit:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                else:
+                    # Woken up, give the place to the next one
+                    self._wake()
+                raise
+        self._in_flight += 1
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self._in_flight -= 1
+        self._wake()
+
+    def _wake(self):
+        free = self.limit - self._in_flight
+        while free > 0 and self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
+
+
+class RetryPolicy():
+    """
+    Decides, which requests are retried and how long to wait before the
+    next attempt, the same way for the sync and the async client.
+
+    Throttled (429) requests, connection errors and server errors are
+    retried with jittered exponential backoff, honoring the `Retry-After`
+    header. Requests which are not idempotent (e.g. creating a new workout)
+    are retried only when the server didn't process them (429). The
+    outcomes are reported to the concurrency limiter and counted in the
+    stats.
+    """
+    def __init__(self, max_retries, stats, concurrency):
+        # type: (int, RequestStats, AdaptiveConcurrency) -> None
+        self.max_retries = max_retries
+        self.stats = stats
+        self.concurrency = concurrency
+
+    def can_retry_error(self, attempt, idempotent):
+        # type: (int, bool) -> bool
+        """
+        True, when the request which failed to connect can be sent again.
+        """
+        return idempotent and attempt < self.max_retries
+
+    def retry_delay(self, method, url, response, attempt, idempotent):
+        # type: (str, str, object, int, bool) -> float
+        """
+        Return the seconds to wait before the next attempt of the request,
+        or None when the `response` is final. The `response` is None after
+        a connection error.
+        """
+        retry_after = None
+        if response is None:
+            pass
+        elif response.status_code == http.HTTPStatus.TOO_MANY_REQUESTS:
+            self.stats.add(throttled=1)
+            self.concurrency.on_throttle()
+            retry_after = parse_retry_after(
+                response.headers.get('Retry-After'))
+        elif idempotent and response.status_code in RETRY_STATUSES:
+            pass
+        else:
+            self.concurrency.on_success()
+            return None
+
+        if attempt >= self.max_retries:
+            return None
+
+        delay = backoff_delay(attempt, retry_after=retry_after)
+        status = response.status_code if response is not None else None
+        log.debug(f'Retrying {method} {url} ({status}) in {delay:.1f}s')
+        self.stats.add(retries=1)
+        return delay
+
+
+class RequestStats():
+    """
+    Counters of the requests sent by the API client.
+
+    `not_modified` counts the conditional requests answered from the local
+    store, `unvalidated` the responses without validators, which can't be
+    requested conditionally next time.
+    """
+    def __init__(self):
+        self.requests = 0
+        self.retries = 0
+        self.throttled = 0
+        self.not_modified = 0
+        self.unvalidated = 0
+        self._lock = threading.Lock()
+
+    def add(self, requests=0, retries=0, throttled=0, not_modified=0,
+            unvalidated=0):
+        with self._lock:
+            self.requests += requests
+            self.retries += retries
+            self.throttled += throttled
+            self.not_modified += not_modified
+            self.unvalidated += unvalidated
+
+    def __str__(self) -> str:
+        return f"requests={self.requests} retries={self.retries} " \
+               f"throttled={self.throttled} " \
+               f"not_modified={self.not_modified} " \
+               f"unvalidated={self.unvalidated}"
+
+
+def backoff_delay(attempt, base=0.5, cap=60.0, retry_after=None):
+    # type: (int, float, float, float) -> float
+    """
+    Exponential backoff with full jitter for the given retry attempt
+    (counted from 0). `Retry-After` from the server is the lower bound.
+    """
+    delay = random.uniform(0, min(cap, base * 2 ** attempt))
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+
+def parse_retry_after(value):
+    # type: (str) -> float
+    """
+    Parse the `Retry-After` header, given in seconds or as an HTTP date.
+    Returns None, when the header is missing or broken.
+    """
+    if not value:
+        return None
+    if value.strip().isdigit():
+        return float(value)
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
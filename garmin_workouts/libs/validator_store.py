@@ -0,0 +1,69 @@
+from libs.workout_cache import WorkoutCache
+
+
+def response_validators(headers):
+    # type: (dict) -> dict
+    """
+    Return the `ETag` and `Last-Modified` of the response, or None when the
+    server sent neither of them.
+    """
+    validators = {}
+    if headers.get('ETag'):
+        validators["etag"] = headers['ETag']
+    if headers.get('Last-Modified'):
+        validators["last_modified"] = headers['Last-Modified']
+    return validators or None
+
+
+def conditional_headers(validators):
+    # type: (dict) -> dict
+    """
+    Return the headers making the GET conditional on the stored validators.
+    """
+    if not validators:
+        return None
+    headers = {}
+    if "etag" in validators:
+        headers["If-None-Match"] = validators["etag"]
+    if "last_modified" in validators:
+        headers["If-Modified-Since"] = validators["last_modified"]
+    return headers
+
+
+class ValidatorStore():
+    """
+    Validators of the workouts downloaded from the Garmin Connect, so a
+    repeated download can be a conditional GET and a 304 Not Modified
+    response is served from the disk.
+
+    The validators are kept in the `WorkoutCache` next to the bodies. The
+    store only records them with the update date of the workout, the
+    bodies are stored by the commands under the same stamp of the workouts
+    list. A 304 for a body, which isn't there, is downloaded again.
+    """
+    def __init__(self, cache=None, refresh=False):
+        # type: (WorkoutCache, bool) -> None
+        self._cache = cache or WorkoutCache()
+        # Don't send conditional requests, only store the fresh validators
+        self.refresh = refresh
+
+    def get_validators(self, workout_id):
+        # type: (int) -> dict
+        if self.refresh:
+            return None
+        return self._cache.get_validators(workout_id)
+
+    def get_body(self, workout_id, validators):
+        # type: (int, dict) -> dict
+        """
+        Return the stored workout for the validators, or None when it was
+        evicted.
+        """
+        return self._cache.load(workout_id, validators.get("stamp"))
+
+    def put(self, workout_id, validators, stamp):
+        # type: (int, dict, str) -> None
+        if not stamp:
+            # Nothing to find the body by
+            return
+        self._cache.put_validators(workout_id, dict(validators, stamp=stamp))
@@ -0,0 +1,163 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+
+from libs.app_dirs import package_dirs
+
+# Default upper bound for the size of the cache directory in bytes
+DEFAULT_MAX_SIZE = 100 * 1024 * 1024
+
+workouts_cache_dir = os.path.join(package_dirs.user_cache_dir, 'workouts')
+
+log = logging.getLogger(__name__)
+
+
+class WorkoutCache():
+    """
+    On-disk cache of the workouts downloaded from the Garmin Connect.
+
+    Entries are addressed by the workout ID together with the modification
+    stamp from the workouts list, so a workout changed in the Garmin Connect
+    is a miss and is downloaded again. The least recently used entries are
+    evicted when the cache grows over `max_size` bytes.
+
+    The validators of the last downloaded version of a workout are kept
+    next to the entries for the conditional requests, see `ValidatorStore`.
+    They count into the size and are evicted the same way.
+    """
+    def __init__(self, cache_dir=workouts_cache_dir, max_size=DEFAULT_MAX_SIZE,
+                 refresh=False):
+        # type: (str, int, bool) -> None
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        # Don't read from the cache, only store fresh workouts into it
+        self.refresh = refresh
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._size = sum(stat.st_size for _, stat in self._stat_entries())
+
+    def get(self, workout_id, stamp):
+        # type: (int, str) -> dict
+        """
+        Return the cached Garmin Connect workout, or None on a miss.
+        """
+        workout = None
+        if not self.refresh:
+            workout = self.load(workout_id, stamp)
+
+        with self._lock:
+            if workout is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return workout
+
+    def load(self, workout_id, stamp):
+        # type: (int, str) -> dict
+        """
+        The same as `get`, but not counted as a hit or a miss.
+        """
+        if not stamp:
+            return None
+        return self._read(self._path(workout_id, stamp))
+
+    def contains(self, workout_id, stamp):
+        # type: (int, str) -> bool
+        return bool(stamp) and os.path.exists(self._path(workout_id, stamp))
+
+    def put(self, workout_id, stamp, workout):
+        # type: (int, str, dict) -> None
+        if not stamp:
+            return
+        self._write(self._path(workout_id, stamp), workout)
+
+    def get_validators(self, workout_id):
+        # type: (int) -> dict
+        """
+        Return the validators stored by `put_validators`, or None.
+        """
+        return self._read(self._validators_path(workout_id))
+
+    def put_validators(self, workout_id, validators):
+        # type: (int, dict) -> None
+        self._write(self._validators_path(workout_id), validators)
+
+    def _read(self, path):
+        # type: (str) -> object
+        try:
+            with open(path, 'r') as infile:
+                data = json.load(infile)
+            # Touch the entry, so it is evicted as the last one
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return data
+
+    def _write(self, path, data):
+        # type: (str, object) -> None
+        # Unique also among the processes sharing the cache
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w') as outfile:
+            json.dump(data, outfile, separators=(',', ':'))
+        try:
+            # Replaced entry doesn't take the space any more
+            replaced_size = os.path.getsize(path)
+        except OSError:
+            replaced_size = 0
+        os.replace(tmp_path, path)
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            # Evicted by another process already
+            size = 0
+
+        with self._lock:
+            self._size += size - replaced_size
+            if self._size > self.max_size:
+                self._evict()
+
+    def _evict(self):
+        entries = sorted(self._stat_entries(),
+                         key=lambda entry: entry[1].st_mtime)
+        self._size = sum(stat.st_size for _, stat in entries)
+        for path, stat in entries:
+            if self._size <= self.max_size:
+                break
+            log.debug(f'Evicting "{os.path.basename(path)}" from the '
+                      'workouts cache')
+            self._size -= stat.st_size
+            try:
+                os.remove(path)
+            except OSError:
+                # Evicted by another process sharing the cache
+                pass
+
+    def _stat_entries(self):
+        # type: () -> list
+        """
+        Return (path, stat) of the entries. Entries removed meanwhile by
+        another process are left out.
+        """
+        entries = []
+        for entry in self._entries():
+            try:
+                entries.append((entry.path, entry.stat()))
+            except OSError:
+                continue
+        return entries
+
+    def _entries(self):
+        return [entry for entry in os.scandir(self.cache_dir)
+                if entry.name.endswith(('.json', '.validators'))]
+
+    def _path(self, workout_id, stamp):
+        key = hashlib.sha1(f'{workout_id}:{stamp}'.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, f'{key}.json')
+
+    def _validators_path(self, workout_id):
+        return os.path.join(self.cache_dir, f'{workout_id}.validators')
@@ -0,0 +1,122 @@
+import logging
+import re
+import sys
+from array import array
+from typing import Iterable, List
+
+from libs import endpoints
+from libs.exception import GarminConnectObjectError
+
+log = logging.getLogger(__name__)
+
+# Supported sports, the position is the sport code stored in the catalog.
+# All other sports share the "other" code.
+SPORTS = ("running", "cycling", "swimming", "other")
+SPORT_CODES = {sport: code for code, sport in enumerate(SPORTS)}
+OTHER_SPORT_CODE = SPORT_CODES["other"]
+
+
+class WorkoutCatalog():
+    """
+    Compact list of the workouts info, built from the workouts list
+    responses. Only ID, sport, name and modification stamp of each workout
+    are kept, in parallel arrays, so the raw JSON can be freed. Workouts are
+    addressed by their position in the catalog; URLs are derived on demand.
+
+    All workouts are kept, also those with a sport we don't support yet, so
+    selecting by ID, name or regex finds them. Only the selection by sport
+    tells the supported sports apart.
+    """
+    __slots__ = ("_ids", "_sports", "_names", "_updated", "_by_name")
+
+    def __init__(self, workouts_info: Iterable[dict] = ()) -> None:
+        self._ids = array('q')
+        self._sports = bytearray()
+        self._names: List[str] = []
+        self._updated: List[str] = []
+        self._by_name = None
+        self.extend(workouts_info)
+
+    @classmethod
+    def from_api_client(cls, api_client, limit=None, order_seq='DESC'):
+        catalog = cls()
+        for page in api_client.iter_workouts_pages(limit, order_seq):
+            catalog.extend(page)
+        log.debug(f'Catalog of {len(catalog)} workouts')
+        return catalog
+
+    def extend(self, workouts_info: Iterable[dict]) -> range:
+        """
+        Add the workouts info from the workouts list response. Returns the
+        positions of the added workouts.
+        """
+        first = len(self._ids)
+        for workout_info in workouts_info:
+            if "workoutId" not in workout_info:
+                raise GarminConnectObjectError("workoutId", workout_info)
+            if "sportType" not in workout_info:
+                raise GarminConnectObjectError("sportType", workout_info)
+
+            sport = workout_info["sportType"]["sportTypeKey"]
+            self._ids.append(workout_info["workoutId"])
+            self._sports.append(SPORT_CODES.get(sport, OTHER_SPORT_CODE))
+            self._names.append(sys.intern(workout_info["workoutName"]))
+            # Modification stamp of the workout, used as a cache key
+            self._updated.append(workout_info.get("updateDate"))
+        self._by_name = None
+        return range(first, len(self._ids))
+
+    def __len__(self):
+        return len(self._ids)
+
+    def get_id(self, position):
+        # type: (int) -> int
+        return self._ids[position]
+
+    def get_type(self, position):
+        # type: (int) -> str
+        return SPORTS[self._sports[position]]
+
+    def get_name(self, position):
+        # type: (int) -> str
+        return self._names[position]
+
+    def get_update_date(self, position):
+        # type: (int) -> str
+        return self._updated[position]
+
+    def get_url(self, position):
+        # type: (int) -> str
+        return endpoints.workout_url(self._ids[position])
+
+    def all(self):
+        # type: () -> range
+        return range(len(self._ids))
+
+    def by_sport(self, sport: str,
+                 positions: Iterable[int] = None) -> List[int]:
+        """
+        Return positions of the workouts of the sport, e.g. "running".
+        Only the given positions are checked, when defined.
+        """
+        code = SPORT_CODES.get(sport)
+        sports = self._sports
+        if positions is None:
+            positions = range(len(sports))
+        return [position for position in positions if sports[position] == code]
+
+    def by_name(self, name: str) -> List[int]:
+        if self._by_name is None:
+            self._by_name = {}
+            for position, workout_name in enumerate(self._names):
+                self._by_name.setdefault(workout_name, []).append(position)
+        return list(self._by_name.get(name, []))
+
+    def by_regex(self, pattern: str) -> List[int]:
+        """
+        Return positions of the workouts with the name matching the regex
+        anywhere.
+        """
+        search = re.compile(pattern).search
+        return [position for position, name in enumerate(self._names)
+                if search(name)]
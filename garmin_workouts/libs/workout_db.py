@@ -0,0 +1,200 @@
+import logging
+import os
+import sqlite3
+import time
+
+from typing import List, Tuple
+
+from libs.app_dirs import package_dirs, ensure_dir
+from libs.conversions import mps_to_pace_string, mps_to_kmh_string
+from libs.parser import OWN_STEP_TYPES
+
+default_db_path = os.path.join(package_dirs.user_data_dir, 'workouts.db')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS workouts (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    sport TEXT,
+    update_date TEXT,
+    steps INTEGER NOT NULL,
+    -- Planned meters including the repetitions, NULL without distance steps
+    distance REAL,
+    exported_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS workouts_name ON workouts (name);
+CREATE INDEX IF NOT EXISTS workouts_sport ON workouts (sport);
+
+-- Steps of the workouts flattened in their order. Steps of a repetition
+-- point to it by `parent`.
+CREATE TABLE IF NOT EXISTS steps (
+    workout_id INTEGER NOT NULL REFERENCES workouts (id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    parent INTEGER,
+    depth INTEGER NOT NULL,
+    type TEXT NOT NULL,
+    iterations INTEGER,
+    end_condition TEXT,
+    end_value REAL,
+    target_type TEXT,
+    target_low REAL,
+    target_high REAL,
+    zone INTEGER,
+    -- Pace and speed targets as in the YAML files
+    pace_from TEXT,
+    pace_to TEXT,
+    PRIMARY KEY (workout_id, position)
+);
+CREATE INDEX IF NOT EXISTS steps_target_type ON steps (target_type);
+'''
+
+log = logging.getLogger(__name__)
+
+
+def connect(path=default_db_path, read_only=False):
+    # type: (str, bool) -> sqlite3.Connection
+    if read_only:
+        if not os.path.isfile(path):
+            raise FileNotFoundError(f'No workouts database "{path}", fill '
+                                    'it with `export --db` first')
+        connection = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    else:
+        ensure_dir(os.path.dirname(os.path.abspath(path)))
+        connection = sqlite3.connect(path)
+        connection.executescript(SCHEMA)
+    connection.execute('PRAGMA foreign_keys = ON')
+    return connection
+
+
+def _pace_strings(target_type, garmin_step):
+    # type: (str, dict) -> tuple
+    if target_type == "pace.zone":
+        convert = mps_to_pace_string
+    elif target_type == "speed.zone":
+        convert = mps_to_kmh_string
+    else:
+        return None, None
+    return tuple(convert(garmin_step[key]) if garmin_step.get(key) else None
+                 for key in ("targetValueOne", "targetValueTwo"))
+
+
+def step_rows(workout_id: int,
+              garmin_steps: list) -> Tuple[List[tuple], float]:
+    """
+    Flatten the steps in the Garmin Connect format into the rows of the
+    `steps` table. Returns them with the planned distance in meters, where
+    the steps of repetitions count as many times as they are repeated.
+    """
+    rows = []
+    distance = None
+    stack = [(iter(garmin_steps), None, 0, 1)]
+    while stack:
+        steps_iter, parent, depth, multiplier = stack[-1]
+        for garmin_step in steps_iter:
+            position = len(rows)
+            step_type = (garmin_step.get("stepType") or {}).get("stepTypeKey")
+            if garmin_step.get("type") == "RepeatGroupDTO":
+                iterations = garmin_step.get("numberOfIterations") or 1
+                rows.append((workout_id, position, parent, depth,
+                             "repetition", iterations) + (None,) * 8)
+                stack.append((iter(garmin_step.get("workoutSteps", ())),
+                              position, depth + 1, multiplier * iterations))
+                break
+
+            end_condition = \
+                (garmin_step.get("endCondition") or {}).get("conditionTypeKey")
+            end_value = garmin_step.get("endConditionValue")
+            if end_condition == "distance" and end_value:
+                distance = (distance or 0.0) + end_value * multiplier
+            target_type = (garmin_step.get("targetType") or {}) \
+                .get("workoutTargetTypeKey") or "no.target"
+            rows.append((workout_id, position, parent, depth,
+                         OWN_STEP_TYPES.get(step_type, step_type), None,
+                         end_condition, end_value, target_type,
+                         garmin_step.get("targetValueOne"),
+                         garmin_step.get("targetValueTwo"),
+                         garmin_step.get("zoneNumber"))
+                        + _pace_strings(target_type, garmin_step))
+        else:
+            stack.pop()
+    return rows, distance
+
+
+class WorkoutDatabaseWriter():
+    """
+    Stores the exported workouts into the SQLite database for the `query`
+    command. Workouts already in the database are replaced.
+
+    Everything is written in one transaction, committed when the export
+    finishes, so an interrupted export leaves the database as it was.
+    """
+    def __init__(self, path=default_db_path):
+        # type: (str) -> None
+        self.path = path
+        self.count = 0
+        self._connection = None
+        self._exported_at = time.time()
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type:
+            self._connection.rollback()
+            self._connection.close()
+            self._connection = None
+        else:
+            self.close()
+
+    def open(self):
+        self._connection = connect(self.path)
+
+    def write(self, parsed_workout):
+        # type: (WorkoutParser) -> None
+        garmin_workout = parsed_workout.get_garmin_format()
+        workout_id = parsed_workout.get_workout_id() or \
+            garmin_workout.get("workoutId")
+        sport = (garmin_workout.get("sportType") or {}).get("sportTypeKey")
+
+        rows = []
+        distance = None
+        for segment in garmin_workout.get("workoutSegments", ()):
+            segment_rows, segment_distance = \
+                step_rows(workout_id, segment.get("workoutSteps", ()))
+            # Positions continue over the segments
+            rows += [(row[0], row[1] + len(rows),
+                      None if row[2] is None else row[2] + len(rows)) + row[3:]
+                     for row in segment_rows]
+            if segment_distance is not None:
+                distance = (distance or 0.0) + segment_distance
+
+        executable_steps = len([row for row in rows if row[4] != "repetition"])
+        cursor = self._connection.cursor()
+        cursor.execute('DELETE FROM steps WHERE workout_id = ?', (workout_id,))
+        cursor.execute(
+            'INSERT OR REPLACE INTO workouts VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (workout_id, garmin_workout.get("workoutName"), sport,
+             garmin_workout.get("updateDate"), executable_steps, distance,
+             self._exported_at))
+        cursor.executemany('INSERT INTO steps VALUES '
+                           '(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+        self.count += 1
+
+    def remove_others(self):
+        """
+        Remove the workouts, which were not written by this export. Call it
+        only when the export went over the whole library.
+        """
+        cursor = self._connection.execute(
+            'DELETE FROM workouts WHERE exported_at != ?', (self._exported_at,))
+        if cursor.rowcount:
+            log.info(f'Removed {cursor.rowcount} workouts, which are not in '
+                     'the Garmin Connect anymore, from the database')
+
+    def close(self):
+        if self._connection:
+            self._connection.commit()
+            self._connection.close()
+            self._connection = None
+            log.info(f'Stored {self.count} workouts to the "{self.path}"')
@@ -0,0 +1,125 @@
+import glob
+import logging
+import os
+import re
+import yaml
+
+from typing import List
+
+from libs.exception import OwnFormatDataObjectError, \
+    OwnFormatDataObjectNotImplementedError
+
+YAML_EXTENSIONS = ('.yml', '.yaml')
+
+# Top level `id: ...` line of a workout in the block style
+ID_LINE = re.compile(r'^id:.*$', re.MULTILINE)
+# Top level `key: ...` line of a mapping in the block style
+MAPPING_LINE = re.compile(r'^[^\s#{\[\-?][^:]*:(\s|$)')
+
+# Errors of the parser on a workout, which doesn't describe a valid workout
+WORKOUT_ERRORS = (ValueError, KeyError, TypeError, AttributeError,
+                  OwnFormatDataObjectError,
+                  OwnFormatDataObjectNotImplementedError)
+
+log = logging.getLogger(__name__)
+
+
+def expand_paths(paths: List[str]) -> List[str]:
+    """
+    Expand directories and glob patterns into the list of YAML files.
+    """
+    filenames = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                filenames += [os.path.join(root, name)
+                              for name in sorted(files)
+                              if name.endswith(YAML_EXTENSIONS)]
+        elif any(char in path for char in '*?['):
+            filenames += sorted(glob.glob(path, recursive=True))
+        else:
+            filenames.append(path)
+    return filenames
+
+
+def parse_yaml_file(filename: str) -> List[dict]:
+    """
+    Return the list of workouts from the file. The file can be a stream
+    of more YAML documents, or an exported file with the `workouts` list.
+    """
+    with open(filename, 'r') as infile:
+        log.info(f'Opening file {filename} for reading')
+        documents = [document for document in yaml.safe_load_all(infile)
+                     if document is not None]
+
+    workout_objs = []
+    for document in documents:
+        if isinstance(document, dict) and "workouts" in document:
+            workout_objs += document["workouts"]
+        else:
+            workout_objs.append(document)
+    return workout_objs
+
+
+def workout_error(err):
+    # type: (Exception) -> str
+    """
+    Describe the error of the workout in one line. The exceptions of the
+    parser print the whole workout, the callers say where it is.
+    """
+    if isinstance(err, OwnFormatDataObjectError):
+        return f'missing "{err.property}"'
+    if isinstance(err, OwnFormatDataObjectNotImplementedError):
+        return f'{err.property} "{err.value}" is not supported'
+    return f'{type(err).__name__}: {err}'
+
+
+def _with_workout_id(text, workout_id):
+    # type: (str, int) -> str
+    if ID_LINE.search(text):
+        return ID_LINE.sub(f'id: {workout_id}', text, count=1)
+
+    # Put the ID before the first key, after comments and `---`
+    lines = text.splitlines(keepends=True)
+    for index, line in enumerate(lines):
+        stripped = line.strip()
+        if not stripped or stripped.startswith(('#', '%')) or \
+                stripped == '---':
+            continue
+        if not MAPPING_LINE.match(line):
+            return None
+        lines.insert(index, f'id: {workout_id}\n')
+        return ''.join(lines)
+    return None
+
+
+def store_workout_id(filename, workout_id):
+    # type: (str, int) -> bool
+    """
+    Write the workout ID into the YAML file with a single workout, keeping
+    the rest of the file as it is. Returns False, when the file can't be
+    updated this way, e.g. it has more workouts.
+    """
+    with open(filename, 'r') as infile:
+        text = infile.read()
+
+    documents = [document for document in yaml.safe_load_all(text)
+                 if document is not None]
+    if len(documents) != 1 or not isinstance(documents[0], dict) or \
+            "workouts" in documents[0]:
+        return False
+
+    new_text = _with_workout_id(text, workout_id)
+    # Check the file says the same, only with the new ID
+    expected = dict(documents[0], id=workout_id)
+    if new_text is None or \
+            [document for document in yaml.safe_load_all(new_text)
+             if document is not None] != [expected]:
+        return False
+
+    tmp_filename = f'{filename}.tmp'
+    with open(tmp_filename, 'w') as outfile:
+        outfile.write(new_text)
+    os.replace(tmp_filename, filename)
+    return True
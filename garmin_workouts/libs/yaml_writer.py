@@ -0,0 +1,142 @@
+import errno
+import logging
+import os
+import shutil
+import sys
+import yaml
+
+log = logging.getLogger(__name__)
+
+
+class WorkoutsYamlWriter():
+    """
+    Streams exported workouts into a YAML document one by one, so they
+    don't have to be kept in memory until the end of the export.
+
+    The document has the same shape as dumping the whole
+    `{"version": 1, "workouts": [...]}` mapping at once.
+
+    The file is written under a temporary name and renamed at the end,
+    so there is never a half written file under `filename`. When the export
+    fails, the workouts written so far are stored into `failed_filename`
+    together with the `error` key. With `keep_partial`, they stay in the
+    temporary file instead, so the export can `resume` it.
+    """
+    def __init__(self, filename=None, failed_filename='failed_workouts.yml',
+                 version=1, keep_partial=False):
+        # type: (str, str, int, bool) -> None
+        # Write to the STDOUT when no filename is given
+        self.filename = filename
+        self.failed_filename = failed_filename
+        self.version = version
+        self.keep_partial = keep_partial
+        self.count = 0
+        self._stream = None
+        self._tmp_filename = None
+        if filename:
+            directory, basename = os.path.split(os.path.abspath(filename))
+            self._tmp_filename = os.path.join(directory, f'.{basename}.tmp')
+
+    def __enter__(self):
+        if not self._stream:
+            self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if not self._stream:
+            return
+        if exc_type and self.keep_partial and self.filename:
+            self._stream.close()
+            self._stream = None
+            log.info(f'Kept {self.count} exported workouts in the '
+                     f'"{self._tmp_filename}" for the resume')
+        elif exc_type:
+            self.abort(exc_type.__name__)
+        else:
+            self.close()
+
+    def open(self):
+        if self.filename:
+            self._stream = open(self._tmp_filename, 'w')
+        else:
+            self._stream = sys.stdout
+        self._dump({"version": self.version})
+
+    def resume(self, offset, count):
+        # type: (int, int) -> bool
+        """
+        Continue the partial output kept by the interrupted export, after
+        the `count` workouts ending at `offset`. Returns False, when the
+        partial output is gone or shorter.
+        """
+        if not self.filename:
+            return False
+        try:
+            stream = open(self._tmp_filename, 'r+')
+        except OSError:
+            return False
+        stream.seek(0, os.SEEK_END)
+        if stream.tell() < offset:
+            stream.close()
+            return False
+        # Drop what was written after the last checkpoint
+        stream.truncate(offset)
+        stream.seek(offset)
+        self._stream = stream
+        self.count = count
+        return True
+
+    def tell(self):
+        # type: () -> int
+        """
+        Flush the output and return its size.
+        """
+        self._stream.flush()
+        return self._stream.tell()
+
+    def write(self, workout):
+        # type: (dict) -> None
+        if self.count == 0:
+            self._stream.write('workouts:\n')
+        self._dump([workout])
+        self.count += 1
+
+    def close(self):
+        self._finish(self.filename)
+        if self.filename:
+            log.info('Storing workouts to the "%s"' % self.filename)
+
+    def abort(self, error):
+        # type: (str) -> None
+        """
+        Finish the document with the workouts written so far and the error.
+        """
+        self._finish(self.failed_filename, error)
+        if self.filename:
+            log.info(f'Storing {self.count} exported workouts to the '
+                     f'"{self.failed_filename}"')
+
+    def _finish(self, filename, error=None):
+        if self.count == 0:
+            self._dump({"workouts": []})
+        if error:
+            self._dump({"error": error})
+
+        stream, self._stream = self._stream, None
+        stream.flush()
+        if stream is sys.stdout:
+            return
+
+        os.fsync(stream.fileno())
+        stream.close()
+        try:
+            os.replace(self._tmp_filename, filename)
+        except OSError as err:
+            if err.errno != errno.EXDEV:
+                raise
+            # The failed file can be on another file system than the output
+            shutil.move(self._tmp_filename, filename)
+
+    def _dump(self, data):
+        yaml.dump(data, self._stream, default_flow_style=False,
+                  sort_keys=False)
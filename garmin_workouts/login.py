@@ -2,11 +2,24 @@ import configparser
 import logging
 import os
 
-from libs.garmin_api_client import GarminApiClient
+from libs.garmin_api_client import GarminApiClient, DEFAULT_RATE_LIMIT, \
+    DEFAULT_MAX_RETRIES, DEFAULT_SESSION_TTL
+from libs.session_store import SessionStore
 
 log = logging.getLogger(__name__)
 
 
+def logout():
+    """
+    Remove the stored session. No client is built, so the stored session
+    isn't checked and no credentials are needed.
+    """
+    session_store = SessionStore()
+    with session_store.lock():
+        session_store.clear()
+    log.info('Logged out')
+
+
 class Login():
     def __init__(self, args={}):
         self.username = args.username if 'username' in args else None
@@ -14,15 +27,30 @@ class Login():
         self.config_path = os.path.join(os.path.curdir, args.config) if \
             'config' in args else 'config.ini'
 
+        self.rate_limit = args.rate_limit if 'rate_limit' in args \
+            else DEFAULT_RATE_LIMIT
+        self.max_retries = args.max_retries if 'max_retries' in args \
+            else DEFAULT_MAX_RETRIES
+        self.session_ttl = args.session_ttl if 'session_ttl' in args \
+            else DEFAULT_SESSION_TTL
+
         if not self.username or not self.password:
             self._get_credentials()
 
-        api_client = GarminApiClient(self.username, self.password)
-        self.session = api_client.session
+        # Missing credentials are asked for only when the stored session
+        # can't be used
+        self.api_client = GarminApiClient(self.username, self.password,
+                                          rate_limit=self.rate_limit,
+                                          max_retries=self.max_retries,
+                                          session_ttl=self.session_ttl)
+        self.session = self.api_client.session
 
     def get_session(self):
         return self.session
 
+    def get_api_client(self):
+        return self.api_client
+
     def _get_credentials(self):
         if os.path.exists(self.config_path):
             config = configparser.ConfigParser()
@@ -35,8 +63,3 @@ class Login():
                 if not self.password and 'password' in auth:
                     log.info('Loading password from %s' % self.config_path)
                     self.password = auth['password']
-
-        if not self.username:
-            self.username = input('Username: ')
-        if not self.password:
-            self.username = input('Password: ')
@@ -0,0 +1,148 @@
+import logging
+import sys
+
+from libs.conversions import pace_string_to_mps
+from libs.workout_db import connect, default_db_path
+
+log = logging.getLogger(__name__)
+
+# `--target` choice -> workoutTargetTypeKey in the `steps` table
+TARGET_TYPES = {
+    "pace": "pace.zone",
+    "speed": "speed.zone",
+    "hr": "heart.rate.zone",
+    "cadence": "cadence",
+    "none": "no.target",
+}
+
+# `--group-by` choice -> grouped column, True when it's the column of steps
+GROUP_COLUMNS = {
+    "sport": ("w.sport", False),
+    "target": ("s.target_type", True),
+    "step": ("s.type", True),
+}
+
+
+def _format_km(meters):
+    # type: (float) -> str
+    return '-' if meters is None else f'{meters / 1000:.1f}'
+
+
+class Query():
+    """
+    Answer the questions about the workouts library from the database
+    filled by `export --db`, without the Garmin Connect.
+    """
+    def __init__(self, args):
+        self._db_path = args.query_db or default_db_path
+        self._args = args
+        try:
+            self._connection = connect(self._db_path, read_only=True)
+        except FileNotFoundError as err:
+            log.error(err)
+            sys.exit(1)
+        try:
+            if args.query_sql:
+                self._run_sql(args.query_sql)
+            else:
+                self.query()
+        finally:
+            self._connection.close()
+
+    def _filters(self):
+        # type: () -> tuple
+        """
+        Return the SQL condition of the workouts `w` matching the filters
+        and its parameters.
+        """
+        args = self._args
+        conditions, params = [], []
+        if args.query_id is not None:
+            conditions.append('w.id = ?')
+            params.append(args.query_id)
+        if args.query_name:
+            conditions.append('w.name LIKE ?')
+            params.append(f'%{args.query_name}%')
+        if args.query_sport:
+            conditions.append('w.sport = ?')
+            params.append(args.query_sport)
+        if args.query_min_distance is not None:
+            conditions.append('w.distance >= ?')
+            params.append(args.query_min_distance * 1000)
+        if args.query_max_distance is not None:
+            conditions.append('w.distance <= ?')
+            params.append(args.query_max_distance * 1000)
+        if args.query_target:
+            conditions.append('EXISTS (SELECT 1 FROM steps t WHERE '
+                              't.workout_id = w.id AND t.target_type = ?)')
+            params.append(TARGET_TYPES[args.query_target])
+        if args.query_pace:
+            # Compared in whole seconds per km, as the paces are shown
+            seconds = round(1000 / pace_string_to_mps(args.query_pace))
+            conditions.append(
+                "EXISTS (SELECT 1 FROM steps t WHERE t.workout_id = w.id "
+                "AND t.target_type = 'pace.zone' AND ? BETWEEN "
+                "min(round(1000 / t.target_low), round(1000 / t.target_high)) "
+                "AND max(round(1000 / t.target_low), round(1000 / t.target_high)))")
+            params.append(seconds)
+        where = ' AND '.join(conditions) if conditions else '1'
+        return where, params
+
+    def query(self):
+        where, params = self._filters()
+        if self._args.query_count:
+            count, = self._connection.execute(
+                f'SELECT count(*) FROM workouts w WHERE {where}',
+                params).fetchone()
+            print(count)
+        elif self._args.query_group_by:
+            self._print_groups(where, params)
+        else:
+            self._print_workouts(where, params)
+
+    def _print_workouts(self, where, params):
+        rows = self._connection.execute(
+            'SELECT w.id, w.sport, w.distance, w.steps, w.name '
+            f'FROM workouts w WHERE {where} ORDER BY w.name, w.id',
+            params).fetchall()
+        if rows:
+            print(f"{'ID':>12}  {'SPORT':<10} {'KM':>6} {'STEPS':>5}  NAME")
+        for workout_id, sport, distance, steps, name in rows:
+            print(f"{workout_id:>12}  {sport or '-':<10} "
+                  f"{_format_km(distance):>6} {steps:>5}  {name}")
+        print(f'{len(rows)} workouts')
+
+    def _print_groups(self, where, params):
+        column, of_steps = GROUP_COLUMNS[self._args.query_group_by]
+        if of_steps:
+            rows = self._connection.execute(
+                f'SELECT {column}, count(DISTINCT w.id), count(*) '
+                'FROM workouts w JOIN steps s ON s.workout_id = w.id '
+                f"WHERE {where} AND s.type != 'repetition' "
+                f'GROUP BY {column} ORDER BY count(*) DESC',
+                params).fetchall()
+            print(f"{self._args.query_group_by.upper():<20} "
+                  f"{'WORKOUTS':>8} {'STEPS':>8}")
+            for group, workouts, steps in rows:
+                print(f'{group or "-":<20} {workouts:>8} {steps:>8}')
+            return
+
+        rows = self._connection.execute(
+            f'SELECT {column}, count(*), sum(w.distance), avg(w.distance) '
+            f'FROM workouts w WHERE {where} '
+            f'GROUP BY {column} ORDER BY count(*) DESC',
+            params).fetchall()
+        print(f"{self._args.query_group_by.upper():<20} {'WORKOUTS':>8} "
+              f"{'TOTAL KM':>9} {'MEAN KM':>8}")
+        for group, workouts, total, mean in rows:
+            print(f'{group or "-":<20} {workouts:>8} {_format_km(total):>9} '
+                  f'{_format_km(mean):>8}')
+
+    def _run_sql(self, sql):
+        # type: (str) -> None
+        cursor = self._connection.execute(sql)
+        if cursor.description:
+            print('\t'.join(column[0] for column in cursor.description))
+        for row in cursor:
+            print('\t'.join('' if value is None else str(value)
+                            for value in row))
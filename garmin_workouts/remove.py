@@ -1,34 +1,42 @@
+import asyncio
+import http
 import logging
+import requests
 
-from libs.garmin_api_client import GarminApiClient
+from concurrent.futures import ThreadPoolExecutor
+
+from libs.workout_catalog import WorkoutCatalog
+from libs.async_garmin_api_client import AsyncGarminApiClient
 
 log = logging.getLogger(__name__)
 
 
 class Remove():
-    def __init__(self, args, session):
-        self.api_client = GarminApiClient(session=session)
+    def __init__(self, args, api_client):
+        self.api_client = api_client
         self._workouts_id = []
-        self._workouts_info = []
+        self._catalog = None
+        # Positions of the selected workouts in the catalog
+        self._selected = []
         # Prompt before deleting when `--force` is not defined
         self._prompt = False if args.remove_force else True
+        self._jobs = max(args.remove_jobs, 1)
+        self._async = args.use_async
+        if self._jobs > 1:
+            self.api_client.set_pool_size(self._jobs)
         self._parse_args(args)
         self._remove()
+        self.api_client.log_request_stats()
 
     def _parse_args(self, args):
         """
         Build the list of workout IDs, that we will call
         the Garmin Api Client with.
 
-        If there is file with mapping WORKOUT_NAME:WORKOUT_ID
-        defined, and there is deletion by name, we don't need
-        to call API to get list of workouts info.
-
-        Otherwise we need to query it.
-
-        Don't allow different ways at the same time.
+        Selectors by sport, name and regex are resolved against the catalog
+        of workouts, built from a single download of the workouts list.
+        The list is downloaded only when some selector needs it.
         """
-        print(args)
         # 1. Add positional IDs ([WORKOUT_ID [WORKOUT_ID ...]])
         if args.WORKOUT_ID:
             for workout_id in args.WORKOUT_ID:
@@ -39,49 +47,154 @@ class Remove():
             for workout_id in args.remove_workout_id_optional:
                 self._workouts_id.append(workout_id)
 
-        # 3. All runs
+        if not (args.remove_all or args.remove_all_runs or
+                args.remove_all_bikes or args.remove_all_swims or
+                args.remove_workout_name or args.remove_regex):
+            return
+
+        self._catalog = WorkoutCatalog.from_api_client(self.api_client)
+        self._select_from_catalog(args, self._catalog)
+
+    def _select_from_catalog(self, args, catalog):
+        # type: (object, WorkoutCatalog) -> None
+        """
+        Select the workouts in the catalog by sport, name and regex.
+        """
+        # 3. All workouts or all of the sport
+        if args.remove_all:
+            self._selected += catalog.all()
+
         if args.remove_all_runs:
-            self._workouts_info += self.api_client.get_all_runs_info()
+            self._selected += catalog.by_sport("running")
 
         if args.remove_all_bikes:
-            self._workouts_info += self.api_client.get_all_bikes_info()
+            self._selected += catalog.by_sport("cycling")
 
         if args.remove_all_swims:
-            self._workouts_info += self.api_client.get_all_swims_info()
+            self._selected += catalog.by_sport("swimming")
 
-        if args.remove_all:
-            raise NotImplementedError
+        # 4. Names ([--name NAME [--name NAME ...]])
+        if args.remove_workout_name:
+            for name in args.remove_workout_name:
+                positions = catalog.by_name(name)
+                if not positions:
+                    log.warning(f"There is no workout with the name '{name}'")
+                self._selected += positions
 
+        # 5. Regex
         if args.remove_regex:
-            raise NotImplementedError
+            self._selected += catalog.by_regex(args.remove_regex)
 
-    def _remove(self):
-        for workout_info in self._workouts_info:
-            if self._prompt:
-                name = workout_info.get_name()
-                url = workout_info.get_url()
-                prompt_message = \
-                    f"Are you sure you want to delete '{name}' ({url})? [y/N]"
-                answer = input(prompt_message) or "n"
-                if answer.lower() == "n":
-                    continue
-                elif answer.lower() == "y":
-                    pass
-                else:
-                    print("Unexpected input. Skipping..")
-
-            self.api_client.delete_workout(workout_info.get_id())
+    def _get_targets(self):
+        """
+        Return the list of (ID, description) of the workouts to delete.
+        Workouts selected more than once are there only once.
+        """
+        targets = {}
+        for position in self._selected:
+            workout_id = self._catalog.get_id(position)
+            if workout_id not in targets:
+                name = self._catalog.get_name(position)
+                url = self._catalog.get_url(position)
+                targets[workout_id] = f"'{name}' ({url})"
 
         for workout_id in self._workouts_id:
-            if self._prompt:
-                workout_url = self.api_client.get_workout_url(workout_id)
-                prompt_message = f"Are you sure you want to delete '{workout_url}'? [y/N]"
-                answer = input(prompt_message) or "n"
-                if answer.lower() == "n":
-                    continue
-                elif answer.lower() == "y":
-                    pass
-                else:
-                    print("Unexpected input. Skipping..")
+            workout_url = self.api_client.get_workout_url(workout_id)
+            targets.setdefault(workout_id, f"'{workout_url}'")
+        return list(targets.items())
 
-            self.api_client.delete_workout(workout_id)
+    def _confirm(self, targets):
+        # type: (list) -> bool
+        """
+        Ask only once for all the workouts to delete.
+        """
+        print("Following workouts will be deleted:")
+        for _, description in targets:
+            print(f"  {description}")
+        prompt_message = \
+            f"Are you sure you want to delete {len(targets)} workouts? [y/N]"
+        answer = input(prompt_message) or "n"
+        if answer.lower() == "y":
+            return True
+        if answer.lower() != "n":
+            print("Unexpected input. Skipping..")
+        return False
+
+    def _remove(self):
+        targets = self._get_targets()
+        if not targets:
+            log.info('No workouts to delete')
+            return
+
+        if self._prompt and not self._confirm(targets):
+            return
+
+        workouts_id = [workout_id for workout_id, _ in targets]
+        # Workout ID -> (status, error) of the finished deletes
+        results = {}
+        try:
+            if self._async:
+                asyncio.run(self._delete_async(workouts_id, results))
+            else:
+                with ThreadPoolExecutor(max_workers=self._jobs) as executor:
+                    for workout_id, result in zip(
+                            workouts_id,
+                            executor.map(self._delete, workouts_id)):
+                        results[workout_id] = result
+        finally:
+            # Also when interrupted, with the deletes finished so far
+            self._report(workouts_id, results)
+
+    def _delete(self, workout_id):
+        # type: (int) -> tuple
+        """
+        Delete the workout. Returns the HTTP status and None, or None and
+        the error, so one failed delete doesn't stop the others.
+        """
+        try:
+            return self.api_client.delete_workout(workout_id), None
+        except requests.exceptions.RequestException as err:
+            return None, err
+
+    async def _delete_async(self, workouts_id, results):
+        # type: (list, dict) -> None
+        async with AsyncGarminApiClient(self.api_client, self._jobs) as client:
+            async def delete(workout_id):
+                try:
+                    status = await client.delete_workout(workout_id)
+                except requests.exceptions.RequestException as err:
+                    results[workout_id] = None, err
+                else:
+                    results[workout_id] = status, None
+
+            await asyncio.gather(*[delete(workout_id)
+                                   for workout_id in workouts_id])
+
+    def _report(self, workouts_id, results):
+        # type: (list, dict) -> None
+        deleted, missing, forbidden, failed = [], [], [], []
+        for workout_id in workouts_id:
+            if workout_id not in results:
+                continue
+            status, error = results[workout_id]
+            if error is not None:
+                log.error(f"Failed to delete workout '{workout_id}': {error}")
+                failed.append(workout_id)
+            elif status == http.HTTPStatus.NOT_FOUND:
+                missing.append(workout_id)
+            elif status == http.HTTPStatus.FORBIDDEN:
+                forbidden.append(workout_id)
+            else:
+                deleted.append(workout_id)
+
+        log.info(f'Deleted {len(deleted)} workouts: '
+                 f"{', '.join(str(workout_id) for workout_id in deleted)}")
+        if missing:
+            log.info(f"{len(missing)} workouts with given ID don't exist: "
+                     f"{', '.join(str(workout_id) for workout_id in missing)}")
+        if forbidden:
+            log.info(f"Can't access {len(forbidden)} workouts with given ID: "
+                     f"{', '.join(str(workout_id) for workout_id in forbidden)}")
+        if failed:
+            log.info(f"Failed to delete {len(failed)} workouts: "
+                     f"{', '.join(str(workout_id) for workout_id in failed)}")
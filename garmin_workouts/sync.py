@@ -0,0 +1,295 @@
+import http
+import json
+import logging
+import requests
+import sys
+import yaml
+
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from libs.concurrency import ordered_map
+from libs.fingerprint import FingerprintStore, workout_fingerprint
+from libs.parser import WorkoutParser
+from libs.validator_store import ValidatorStore
+from libs.workout_cache import WorkoutCache
+from libs.workout_catalog import WorkoutCatalog
+from libs.workout_files import WORKOUT_ERRORS, expand_paths, \
+    parse_yaml_file, store_workout_id, workout_error
+
+log = logging.getLogger(__name__)
+
+
+class LocalWorkout():
+    """
+    Workout from the YAML file, converted to the Garmin Connect format.
+    """
+    def __init__(self, filename, document, workout_parser):
+        # type: (str, int, WorkoutParser) -> None
+        self.filename = filename
+        # Index of the workout in the file with more of them, otherwise None
+        self.document = document
+        self.parser = workout_parser
+        self.fingerprint = \
+            workout_fingerprint(workout_parser.get_garmin_format())
+
+    def get_id(self):
+        return self.parser.get_workout_id()
+
+    def get_name(self):
+        return self.parser.get_workout_name()
+
+    def __str__(self) -> str:
+        location = self.filename if self.document is None \
+            else f'{self.filename}#{self.document}'
+        return f"'{self.get_name()}' ({location})"
+
+
+class Sync():
+    """
+    Make the workouts in the Garmin Connect match the YAML files. Local and
+    remote workouts are paired by the `id` in the files and compared by
+    the fingerprint of their canonical form, so only new and changed
+    workouts are uploaded.
+    """
+    def __init__(self, args, api_client):
+        self.api_client = api_client
+        self.paths = args.sync_paths
+        self._delete = args.sync_delete
+        self._dry_run = args.sync_dry_run
+        # Prompt before applying the plan when `--force` is not defined
+        self._prompt = not args.sync_force
+        # Files and workouts, which failed to load
+        self._skipped_count = 0
+        self._jobs = max(args.sync_jobs, 1)
+        if self._jobs > 1:
+            self.api_client.set_pool_size(self._jobs)
+        self._cache = WorkoutCache()
+        self.api_client.set_validator_store(ValidatorStore(self._cache))
+        # Shared with `import`, so it can skip what sync has uploaded
+        self._fingerprints = FingerprintStore()
+        try:
+            self.sync()
+        finally:
+            self._fingerprints.save()
+        self.api_client.log_request_stats()
+
+    def sync(self):
+        local_workouts = self._load_local_workouts()
+        catalog = WorkoutCatalog.from_api_client(self.api_client)
+        to_add, to_update, to_delete, unchanged_count = \
+            self._plan(local_workouts, catalog)
+
+        self._print_plan(to_add, to_update, to_delete, catalog,
+                         unchanged_count)
+        if not (to_add or to_update or to_delete):
+            log.info('Everything is up to date')
+            return
+        if self._dry_run:
+            return
+        if self._prompt and not self._confirm():
+            return
+
+        self._apply(to_add, to_update, to_delete, catalog)
+
+    def _load_local_workouts(self):
+        """
+        Convert the workouts in the files. Files and workouts, which can't
+        be read or converted, are skipped like in `import`, but then no
+        workouts are deleted, they can be the ones in the skipped files.
+        """
+        local_workouts = []
+        files_by_id = {}
+        for filename in expand_paths(self.paths):
+            try:
+                workout_objs = parse_yaml_file(filename)
+            except (OSError, yaml.YAMLError) as err:
+                log.error(f'Skipping {filename}: {err}')
+                self._skipped_count += 1
+                continue
+            for index, workout_obj in enumerate(workout_objs):
+                document = index if len(workout_objs) > 1 else None
+                local_workout = self._load_local_workout(filename, document,
+                                                         workout_obj)
+                if local_workout is None:
+                    continue
+
+                workout_id = local_workout.get_id()
+                if workout_id in files_by_id:
+                    log.error(f'Workout ID {workout_id} is used by '
+                              f'{files_by_id[workout_id]} and '
+                              f'{local_workout}')
+                    sys.exit(1)
+                if workout_id:
+                    files_by_id[workout_id] = local_workout
+                local_workouts.append(local_workout)
+        return local_workouts
+
+    def _load_local_workout(self, filename, document, workout_obj):
+        # type: (str, int, dict) -> LocalWorkout
+        try:
+            return LocalWorkout(filename, document,
+                                WorkoutParser(own_format=workout_obj))
+        except WORKOUT_ERRORS as err:
+            location = filename if document is None \
+                else f'{filename}#{document}'
+            log.error(f'Skipping {location}: {workout_error(err)}')
+            self._skipped_count += 1
+            return None
+
+    def _plan(self, local_workouts, catalog):
+        # type: (list, WorkoutCatalog) -> tuple
+        """
+        Return the local workouts to add and to update, the catalog
+        positions of the workouts to delete and the count of unchanged ones.
+        """
+        positions_by_id = {catalog.get_id(position): position
+                           for position in catalog.all()}
+        to_add, paired = [], []
+        for local_workout in local_workouts:
+            workout_id = local_workout.get_id()
+            if workout_id and workout_id not in positions_by_id:
+                log.warning(f'Workout {workout_id} of {local_workout} is not '
+                            'in the Garmin Connect, it will be added again')
+            if workout_id in positions_by_id:
+                paired.append(local_workout)
+            else:
+                to_add.append(local_workout)
+
+        # Only the paired workouts need the details, the workouts list
+        # doesn't have the steps
+        positions = [positions_by_id[local_workout.get_id()]
+                     for local_workout in paired]
+        with ThreadPoolExecutor(max_workers=self._jobs) as executor:
+            remote_fingerprints = list(ordered_map(
+                executor, partial(self._remote_fingerprint, catalog),
+                positions, window=self._jobs * 2))
+
+        to_update = [local_workout for local_workout, remote_fingerprint
+                     in zip(paired, remote_fingerprints)
+                     if local_workout.fingerprint != remote_fingerprint]
+        unchanged_count = len(paired) - len(to_update)
+
+        to_delete = []
+        if self._delete and self._skipped_count:
+            log.warning(f'Not deleting any workouts, {self._skipped_count} '
+                        'files or workouts were skipped')
+        elif self._delete:
+            local_ids = {local_workout.get_id()
+                         for local_workout in local_workouts}
+            # The YAML files can describe only runs, other sports stay
+            to_delete = [position for position in catalog.by_sport("running")
+                         if catalog.get_id(position) not in local_ids]
+
+        return to_add, to_update, to_delete, unchanged_count
+
+    def _remote_fingerprint(self, catalog, position):
+        # type: (WorkoutCatalog, int) -> str
+        workout_id = catalog.get_id(position)
+        update_date = catalog.get_update_date(position)
+        garmin_workout = self._cache.get(workout_id, update_date)
+        if garmin_workout is None:
+            garmin_workout = self.api_client.get_workout_details(workout_id)
+            self._cache.put(workout_id, update_date, garmin_workout)
+        fingerprint = workout_fingerprint(garmin_workout)
+        self._fingerprints.set(workout_id, fingerprint)
+        return fingerprint
+
+    def _print_plan(self, to_add, to_update, to_delete, catalog,
+                    unchanged_count):
+        print("Sync plan:")
+        for local_workout in to_add:
+            print(f"  + {local_workout}")
+        for local_workout in to_update:
+            print(f"  ~ {local_workout} {self.api_client.get_workout_url(local_workout.get_id())}")
+        for position in to_delete:
+            print(f"  - '{catalog.get_name(position)}' {catalog.get_url(position)}")
+        print(f"{len(to_add)} to add, {len(to_update)} to update, "
+              f"{len(to_delete)} to delete, {unchanged_count} unchanged")
+
+    def _confirm(self):
+        # type: () -> bool
+        answer = input("Apply the plan? [y/N]") or "n"
+        if answer.lower() == "y":
+            return True
+        if answer.lower() != "n":
+            print("Unexpected input. Skipping..")
+        return False
+
+    def _apply(self, to_add, to_update, to_delete, catalog):
+        uploads = [(local_workout, False) for local_workout in to_add] + \
+            [(local_workout, True) for local_workout in to_update]
+        workouts_id = [catalog.get_id(position) for position in to_delete]
+
+        # Results of the finished uploads and deletes
+        uploaded, statuses = [], []
+        try:
+            with ThreadPoolExecutor(max_workers=self._jobs) as executor:
+                for result in ordered_map(executor, self._upload, uploads,
+                                          window=self._jobs * 2):
+                    uploaded.append(result)
+                for status in executor.map(self._delete_workout, workouts_id):
+                    statuses.append(status)
+        finally:
+            # Also when interrupted, with the changes finished so far
+            self._report(len(to_add), uploaded, statuses)
+
+    def _report(self, add_count, uploaded, statuses):
+        # type: (int, list, list) -> None
+        added_count = uploaded[:add_count].count(True)
+        updated_count = uploaded[add_count:].count(True)
+        deleted_count = len([status for status in statuses
+                             if status not in (None, http.HTTPStatus.NOT_FOUND,
+                                               http.HTTPStatus.FORBIDDEN)])
+        failed_count = uploaded.count(False) + statuses.count(None)
+        log.info(f'Added {added_count}, updated {updated_count}, deleted '
+                 f'{deleted_count} workouts, {failed_count} failed')
+
+    def _delete_workout(self, workout_id):
+        # type: (int) -> int
+        """
+        Delete one workout. Runs in the worker threads. Returns the HTTP
+        status, or None when the delete failed.
+        """
+        try:
+            return self.api_client.delete_workout(workout_id)
+        except requests.exceptions.RequestException as err:
+            log.error(f"Failed to delete workout '{workout_id}': {err}")
+            return None
+
+    def _upload(self, upload):
+        # type: (tuple) -> bool
+        """
+        Upload one new or changed workout. Runs in the worker threads.
+        """
+        local_workout, update = upload
+        workout_json = json.dumps(local_workout.parser.get_garmin_format(),
+                                  sort_keys=True, indent=2)
+        workout_name = local_workout.get_name()
+        try:
+            if update:
+                self.api_client.update_existing_workout(
+                    workout_json, workout_name, local_workout.get_id())
+                self._fingerprints.set(local_workout.get_id(),
+                                       local_workout.fingerprint)
+                return True
+            workout_id, _ = self.api_client.upload_new_workout(workout_json,
+                                                               workout_name)
+        except requests.exceptions.RequestException as err:
+            log.error(f'Failed to sync {local_workout}: {err}')
+            return False
+        self._fingerprints.set(workout_id, local_workout.fingerprint)
+
+        # The next sync pairs the workout by the ID in the file
+        try:
+            stored = store_workout_id(local_workout.filename, workout_id)
+        except OSError as err:
+            log.error(f"Can't save workout ID {workout_id} to "
+                      f'"{local_workout.filename}": {err}')
+            stored = False
+        if stored:
+            log.info(f'Workout ID {workout_id} saved to "{local_workout.filename}"')
+        else:
+            log.warning(f"Add 'id: {workout_id}' to {local_workout}, "
+                        'otherwise the next sync adds it again')
+        return True
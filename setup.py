@@ -44,4 +44,8 @@ setup(
     packages=['garmin_workouts'],
     python_requires='>=3.5, <4',
     install_requires=install_requires,
+    extras_require={
+        'async': ['aiohttp'],
+        'numpy': ['numpy'],
+    },
 )